@@ -0,0 +1,115 @@
+"""
+Throughput and latency percentiles of the sync (threadpool) and async (DB_ASYNC=1)
+request paths at high concurrency, against a real uvicorn server.
+
+Runs offline against a seeded SQLite file unless DB_URL points at MySQL
+(MySQL is where the async path matters: the sync path holds one of the
+40 threadpool slots for every in-flight DB round trip).
+
+    python -m app.benchmarks.bench_async_mode --concurrency 200 --requests 4000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.benchmarks.common import ensure_local_db, percentile
+
+
+async def wait_ready(base_url, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/conversations/1")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def drive(base_url, total, concurrency, write_ratio, seed=7):
+    rng = random.Random(seed)
+    plan = ["write" if rng.random() < write_ratio else "read" for _ in range(total)]
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i, kind in enumerate(plan):
+        queue.put_nowait((i, kind))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    i, kind = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    if kind == "write":
+                        r = await client.post("/webhooks/inbound", json={
+                            "company_id": 1, "channel_id": 1, "from": f"+1555{i % 500:07d}", "text": "load"})
+                    else:
+                        r = await client.get("/conversations/1/messages", params={"limit": 50})
+                    failed = r.status_code >= 400
+                except httpx.TransportError:
+                    failed = True
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+def run_mode(async_mode, args):
+    env = dict(os.environ, DB_ASYNC="1" if async_mode else "0")
+    port = args.port + (1 if async_mode else 0)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning",
+         "--timeout-keep-alive", "60"],
+        env=env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(wait_ready(base_url))
+        asyncio.run(drive(base_url, min(200, args.requests), args.concurrency, args.write_ratio))  # warm-up
+        return asyncio.run(drive(base_url, args.requests, args.concurrency, args.write_ratio))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    print(f"{args.requests} requests, concurrency {args.concurrency}, write ratio {args.write_ratio}")
+    for label, async_mode in (("sync ", False), ("async", True)):
+        r = run_mode(async_mode, args)
+        print(f"{label}: {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.1f} ms   p99 {r['p99_ms']:7.1f} ms"
+              f"   errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Cold start of a fresh server: time until GET /readyz answers 200 (from every worker), latency of the first
+inbound delivery and first history read, and the worst of the next requests (each on a
+new connection, so with several workers they reach the workers that have not served yet),
+against the steady-state median. With the warm-up off /readyz is 200 as soon as the
+server listens, and the first requests pay for mappers, connections and SQL compilation.
+
+    python -m app.benchmarks.bench_cold_start --workers 4
+
+Runs offline against a seeded SQLite file unless DB_URL points at MySQL (where opening
+connections is what the first requests wait for most).
+"""
+
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.benchmarks.common import ensure_local_db, percentile
+
+_phones = itertools.count()
+
+
+def wait_ready(base_url, workers=1, timeout=60.0):
+    """Until `workers` distinct processes answered ready (a worker accepts connections once warm)."""
+    ready = set()
+    deadline = time.monotonic() + timeout
+    # a new connection per probe, so any worker may take it
+    with httpx.Client(base_url=base_url, limits=httpx.Limits(max_keepalive_connections=0)) as client:
+        while time.monotonic() < deadline:
+            try:
+                r = client.get("/readyz")
+                if r.status_code == 200:
+                    ready.add(r.json()["pid"])
+                    if len(ready) >= workers:
+                        return
+                    continue
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)  # sparingly: on a small box polling competes with the starting server
+    raise RuntimeError(f"{len(ready)} of {workers} workers became ready")
+
+
+def timed_requests(base_url, n):
+    """Latency of n (delivery, history read) pairs, each pair on a new connection."""
+    deliveries, reads = [], []
+    for _ in range(n):
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            start = time.perf_counter()
+            r = client.post("/webhooks/inbound", json={
+                "company_id": 1, "channel_id": 1, "from": f"+1556{next(_phones):07d}", "text": "cold?"})
+            deliveries.append(time.perf_counter() - start)
+            assert r.status_code == 201, r.text
+            start = time.perf_counter()
+            r = client.get(f"/conversations/{r.json()['id']}/messages", params={"limit": 50})
+            reads.append(time.perf_counter() - start)
+            assert r.status_code == 200, r.text
+    return deliveries, reads
+
+
+def run(server, warm_up, args):
+    env = dict(os.environ, WARMUP_ENABLED="1" if warm_up else "0")
+    env.pop("WEB_CONCURRENCY", None)  # uvicorn reads it too
+    port = args.port
+    workers = 1
+    if server == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        env["WEB_CONCURRENCY"] = str(args.workers)
+        workers = args.workers
+        cmd = [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+               "--bind", f"127.0.0.1:{port}", "--log-level", "warning"]
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env)
+    try:
+        wait_ready(base_url, workers)
+        ready = time.perf_counter() - start
+        (first_delivery, *cold_deliveries), (first_read, *cold_reads) = timed_requests(
+            base_url, 1 + args.cold_requests)
+        deliveries, reads = timed_requests(base_url, args.steady_requests)
+    finally:
+        proc.terminate()
+        proc.wait()
+    deliveries.sort()
+    reads.sort()
+    return {"ready_s": ready, "first_delivery_ms": first_delivery * 1000, "first_read_ms": first_read * 1000,
+            "cold_max_ms": max(cold_deliveries + cold_reads, default=0.0) * 1000,
+            "steady_delivery_ms": percentile(deliveries, 50) * 1000, "steady_read_ms": percentile(reads, 50) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cold-requests", type=int, default=None, help="default: 2 per worker")
+    parser.add_argument("--steady-requests", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8200)
+    args = parser.parse_args()
+    if args.cold_requests is None:
+        args.cold_requests = 2 * args.workers
+
+    ensure_local_db()
+    print(f"gunicorn with {args.workers} workers; 'next max' is the worst of the next {args.cold_requests} "
+          f"requests on new connections; steady is the median of {args.steady_requests} afterwards")
+    print(f"{'server':<9} {'warm-up':<8} {'ready s':>8} {'1st write ms':>13} {'1st read ms':>12} "
+          f"{'next max ms':>12} {'steady write':>13} {'steady read':>12}")
+    for server, warm_up in (("uvicorn", False), ("uvicorn", True), ("gunicorn", False), ("gunicorn", True)):
+        r = run(server, warm_up, args)
+        print(f"{server:<9} {'on' if warm_up else 'off':<8} {r['ready_s']:8.2f} {r['first_delivery_ms']:13.1f} "
+              f"{r['first_read_ms']:12.1f} {r['cold_max_ms']:12.1f} {r['steady_delivery_ms']:13.1f} "
+              f"{r['steady_read_ms']:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Requests/sec of the read endpoints with the shared engine registry vs. the
+old behaviour (a brand-new engine + pool per request).
+
+Runs offline against a seeded SQLite file by default; set DB_URL to point at MySQL.
+
+    python -m app.benchmarks.bench_engine_registry --requests 500
+"""
+
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.benchmarks.common import ensure_local_db
+
+
+def legacy_get_db():
+    # pre-registry behaviour: create_engine() with its own QueuePool on every request
+    from app.db_utils.db_connection import load_db_config, build_url
+    engine = create_engine(build_url(load_db_config()["main"]))
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def run(client: TestClient, n: int) -> float:
+    paths = ["/conversations/1", "/conversations/1/messages", "/companies/1/users"]
+    start = time.perf_counter()
+    for i in range(n):
+        r = client.get(paths[i % len(paths)])
+        assert r.status_code == 200, r.text
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    from app.main import app
+    from app.db_utils.deps import get_db
+
+    with TestClient(app) as client:
+        run(client, 20)  # warm-up
+        shared = run(client, args.requests)
+
+        app.dependency_overrides[get_db] = legacy_get_db
+        run(client, 20)
+        legacy = run(client, args.requests)
+        app.dependency_overrides.clear()
+
+    print(f"engine per request : {legacy:8.1f} req/s")
+    print(f"shared engine      : {shared:8.1f} req/s  ({shared / legacy:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
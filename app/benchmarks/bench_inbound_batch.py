@@ -0,0 +1,51 @@
+"""
+Messages/sec of ingesting a backlog one POST /webhooks/inbound per message
+vs. POST /webhooks/inbound/batch, in process (FastAPI TestClient).
+
+    python -m app.benchmarks.bench_inbound_batch --messages 2000 --batch-size 500
+"""
+
+import argparse
+import time
+
+from app.benchmarks.common import ensure_local_db
+
+
+def payloads(n, offset, contacts):
+    return [{"company_id": 1, "channel_id": 1, "from": f"+1555{(offset + i) % contacts:07d}",
+             "text": f"message {offset + i}", "channel_message_id": f"bench-{offset + i}"} for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--contacts", type=int, default=300)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        client.post("/webhooks/inbound", json=payloads(1, 10 ** 7, args.contacts)[0])  # warm caches
+
+        start = time.perf_counter()
+        for item in payloads(args.messages, 0, args.contacts):
+            assert client.post("/webhooks/inbound", json=item).status_code == 201
+        single = args.messages / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        items = payloads(args.messages, args.messages, args.contacts)
+        for i in range(0, len(items), args.batch_size):
+            r = client.post("/webhooks/inbound/batch", json={"messages": items[i:i + args.batch_size]})
+            assert r.status_code == 200 and r.json()["accepted"] == len(items[i:i + args.batch_size])
+        batch = args.messages / (time.perf_counter() - start)
+
+    print(f"{args.messages} messages over {args.contacts} contacts")
+    print(f"single endpoint : {single:9.1f} msg/s")
+    print(f"batch ({args.batch_size:>4})    : {batch:9.1f} msg/s   ({batch / single:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
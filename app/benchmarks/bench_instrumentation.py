@@ -0,0 +1,79 @@
+"""
+Cost of the request/SQL instrumentation: requests/sec of a webhook + read mix with
+METRICS_ENABLED=0 vs 1 (rounds alternate to even out noise), and the added time per
+SQL statement measured on a bare SELECT 1.
+
+    python -m app.benchmarks.bench_instrumentation --requests 1000 --rounds 3
+"""
+
+import argparse
+import os
+import time
+
+from app.benchmarks.common import ensure_local_db
+
+
+def run(client, n: int, offset: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        if i % 2:
+            r = client.get(("/conversations/1", "/conversations/1/messages?limit=20", "/companies/1/users")[i % 3])
+        else:
+            r = client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": f"+1555{i % 200:07d}",
+                                                       "text": "hi", "channel_message_id": f"bench-{offset}-{i}"})
+        assert r.status_code in (200, 201), r.text
+    return n / (time.perf_counter() - start)
+
+
+def requests_per_second(enabled: bool, n: int, offset: int) -> float:
+    os.environ["METRICS_ENABLED"] = "1" if enabled else "0"
+    from fastapi.testclient import TestClient
+    from app.main import create_app
+
+    # the lifespan builds the engines, with or without the SQL hooks
+    with TestClient(create_app(async_mode=False)) as client:
+        run(client, 50, offset - 1)  # warm-up
+        return run(client, n, offset)
+
+
+def statement_overhead_us(n: int) -> float:
+    from sqlalchemy import create_engine
+    from app.db_utils.instrumentation import RequestStats, current_request_stats, instrument_engine
+
+    def per_statement(engine):
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            for _ in range(n):
+                conn.exec_driver_sql("SELECT 1").scalar()
+            return (time.perf_counter() - start) / n
+
+    plain, hooked = create_engine("sqlite://"), create_engine("sqlite://")
+    instrument_engine(hooked, "bench")
+    token = current_request_stats.set(RequestStats(keep_statements=50))
+    try:
+        per_statement(plain), per_statement(hooked)  # warm-up
+        return (per_statement(hooked) - per_statement(plain)) * 1e6
+    finally:
+        current_request_stats.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    results = {False: [], True: []}
+    for r in range(args.rounds):
+        for enabled in (False, True):
+            results[enabled].append(requests_per_second(enabled, args.requests, offset=(2 * r + enabled) * 10))
+    off, on = max(results[False]), max(results[True])
+
+    print(f"metrics off : {off:8.1f} req/s")
+    print(f"metrics on  : {on:8.1f} req/s  ({(off - on) / off * 100:+.1f}% overhead)")
+    print(f"per SQL statement: {statement_overhead_us(20000):.2f} us added")
+
+
+if __name__ == "__main__":
+    main()
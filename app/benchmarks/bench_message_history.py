@@ -0,0 +1,62 @@
+"""
+Peak Python memory and time to read a long conversation history:
+the old full .all() load vs. one keyset page vs. the streaming NDJSON export.
+
+    python -m app.benchmarks.bench_message_history --messages 50000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from app.benchmarks.common import ensure_local_db
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed * 1000:9.1f} ms   peak {peak / 1024 / 1024:8.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    import sqlalchemy
+    from app.dao.message import DAOMessage
+    from app.db_utils.db_connection import get_engine, get_sessionmaker
+    from app.services.messages import list_messages_page, stream_messages_ndjson
+
+    with get_engine().begin() as conn:
+        conn.execute(sqlalchemy.insert(DAOMessage.__table__),
+                     [{"conversation_id": 1, "sender": "contact", "content": f"message number {i} " * 4}
+                      for i in range(args.messages)])
+
+    def full_load():
+        with get_sessionmaker()() as db:
+            rows = db.query(DAOMessage).filter(DAOMessage.conversation_id == 1).order_by(DAOMessage.id).all()
+            [{"id": m.id, "conversation_id": m.conversation_id, "sender": m.sender, "content": m.content}
+             for m in rows]
+
+    def one_page():
+        with get_sessionmaker()() as db:
+            list_messages_page(db, 1, limit=100)
+
+    def export():
+        for _ in stream_messages_ndjson(1):
+            pass
+
+    print(f"{args.messages} messages")
+    measure("full .all() (before)", full_load)
+    measure("keyset page (100)", one_page)
+    measure("ndjson export", export)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Rows/sec of the message-history read path for one long conversation, from query to JSON bytes:
+
+    orm + response_model   ORM objects -> dicts -> pydantic validation -> json.dumps (the old path)
+    core + response_model  Core column select -> dicts -> pydantic validation -> json.dumps
+    core + fast json       Core column select -> dicts -> orjson (what the routes do now)
+
+    python -m app.benchmarks.bench_projection_reads --messages 10000
+"""
+
+import argparse
+import json
+import time
+from typing import List
+
+from app.benchmarks.common import ensure_local_db
+
+
+def measure(label, fn, rows, repeat):
+    fn()  # warm-up (statement cache, imports)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<24} {elapsed * 1000:9.2f} ms   {rows / elapsed:12,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    import sqlalchemy
+    from pydantic import TypeAdapter
+    from app.dao.message import DAOMessage
+    from app.db_utils.db_connection import get_engine, get_sessionmaker
+    from app.schemas.messages import MessageOut
+    from app.services.messages import MESSAGE_COLUMNS, message_dicts
+    from app.services.serialization import dumps, orjson
+
+    with get_engine().begin() as conn:
+        conn.execute(sqlalchemy.insert(DAOMessage.__table__),
+                     [{"conversation_id": 1, "sender": "contact", "content": f"message number {i} " * 4}
+                      for i in range(args.messages)])
+    with get_sessionmaker()() as db:
+        rows = db.query(DAOMessage).filter(DAOMessage.conversation_id == 1).count()
+
+    adapter = TypeAdapter(List[MessageOut])
+
+    def response_model(data):
+        # what FastAPI does with a response_model: validate, dump in json mode, json.dumps
+        return json.dumps(adapter.dump_python(adapter.validate_python(data), mode="json")).encode()
+
+    stmt = sqlalchemy.select(*MESSAGE_COLUMNS).where(DAOMessage.conversation_id == 1).order_by(DAOMessage.id)
+
+    def orm_response_model():
+        with get_sessionmaker()() as db:
+            messages = db.query(DAOMessage).filter(DAOMessage.conversation_id == 1).order_by(DAOMessage.id).all()
+            response_model([{"id": m.id, "conversation_id": m.conversation_id, "sender": m.sender,
+                             "content": m.content} for m in messages])
+
+    def core_response_model():
+        with get_sessionmaker()() as db:
+            response_model(message_dicts(db.execute(stmt).all()))
+
+    def core_fast_json():
+        with get_sessionmaker()() as db:
+            dumps(message_dicts(db.execute(stmt).all()))
+
+    print(f"{rows} messages in conversation 1, {get_engine().dialect.name}, "
+          f"encoder {'orjson' if orjson is not None else 'json'}")
+    measure("orm + response_model", orm_response_model, rows, args.repeat)
+    measure("core + response_model", core_response_model, rows, args.repeat)
+    measure("core + fast json", core_fast_json, rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Inbound deliveries/sec with 1, 16 and 128 concurrent writers, each POSTing /webhooks/inbound
+back to back, with one transaction per request vs. group commit (WRITE_COALESCE=1).
+In process over ASGI; every delivery is two messages (inbound + inline AI reply).
+
+    python -m app.benchmarks.bench_write_coalescing --messages 2000 --writers 1 16 128
+
+On the SQLite stand-in the pool is one connection (SQLite has a single writer anyway).
+Against MySQL set DB_URL (the per-commit fsync is what group commit saves: compare
+innodb_flush_log_at_trx_commit=1 with the default SQLite file, which syncs on commit too).
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import time
+
+from app.benchmarks.common import ensure_local_db, percentile
+
+_ids = itertools.count()
+
+
+async def run(coalesce: bool, writers: int, messages: int, contacts: int):
+    import httpx
+    from app.main import create_app
+
+    os.environ["WRITE_COALESCE"] = "1" if coalesce else "0"
+    app = create_app(async_mode=False)
+    latencies = []
+
+    async def writer(client, n):
+        for _ in range(n):
+            i = next(_ids)
+            start = time.perf_counter()
+            r = await client.post("/webhooks/inbound", json={
+                "company_id": 1, "channel_id": 1, "from": f"+1555{i % contacts:07d}", "text": f"message {i}",
+                "channel_message_id": f"bench-{i}"})
+            latencies.append(time.perf_counter() - start)
+            assert r.status_code == 201, r.text
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            await writer(client, 1)  # warm caches
+            latencies.clear()
+            per_writer = max(1, messages // writers)
+            start = time.perf_counter()
+            await asyncio.gather(*(writer(client, per_writer) for _ in range(writers)))
+            elapsed = time.perf_counter() - start
+            stats = (await client.get("/system/write-coalescer")).json()
+    latencies.sort()
+    return per_writer * writers / elapsed, percentile(latencies, 50), percentile(latencies, 99), stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--contacts", type=int, default=500)
+    args = parser.parse_args()
+
+    ensure_local_db()
+    if os.environ["DB_URL"].startswith("sqlite"):
+        # one writer at a time, as SQLite allows: more pooled connections only trade waiting for "database is locked"
+        os.environ.setdefault("DB_POOL_SIZE", "1")
+        os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+    from app.db_utils.db_connection import get_engine
+    print(f"{args.messages} deliveries per run over {args.contacts} contacts, {get_engine().dialect.name}")
+    print(f"{'writers':>7}  {'mode':<14} {'deliveries/s':>12} {'p50 ms':>8} {'p99 ms':>8}  batches")
+    for writers in args.writers:
+        baseline = None
+        for coalesce in (False, True):
+            rate, p50, p99, stats = asyncio.run(run(coalesce, writers, args.messages, args.contacts))
+            batches = f"{stats['batches']} (mean {stats['mean_batch']})" if coalesce else "-"
+            gain = f"  {rate / baseline:.1f}x" if baseline else ""
+            print(f"{writers:>7}  {'group commit' if coalesce else 'per request':<14} {rate:12.1f} "
+                  f"{p50 * 1000:8.2f} {p99 * 1000:8.2f}  {batches}{gain}")
+            baseline = baseline or rate
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""Shared setup for the benchmark scripts: a seeded SQLite stand-in unless DB_URL is already set."""
+
+import os
+import tempfile
+
+
+def ensure_local_db():
+    if os.getenv("DB_URL"):
+        return
+    os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    from app.db_utils.db_connection import get_engine
+    from app.db_utils.local_db import create_schema, seed_demo_data
+    create_schema(get_engine())
+    seed_demo_data(get_engine())
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
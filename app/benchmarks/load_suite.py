@@ -0,0 +1,341 @@
+"""
+Reproducible multi-tenant load suite.
+
+Builds a synthetic dataset (tenants x contacts, conversation sizes Zipf-skewed so a few
+conversations are long and most are short), then drives each scenario through the app
+in process. By default one request at a time (FastAPI TestClient), so runs are repeatable;
+with --concurrency N, N async clients send the same requests through the app's ASGI
+interface on its event loop, so they contend for the pool, the threadpool and the DB
+locks as under real traffic. The SQL of every request is counted exactly in both modes:
+
+    inbound          POST /webhooks/inbound
+    list_messages    GET  /conversations/{id}/messages (latest page)
+    agent_send       POST /conversations/{id}/messages
+    transfer_toggle  POST /conversations/{id}/transfer-toggle
+    mixed            all of the above, weighted by --mix
+
+Conversations are picked with the same Zipf skew (hot conversations get most traffic).
+The report (JSON) has throughput, p50/p95/p99 latency and queries per request per
+scenario; --baseline compares it with a stored report and exits 1 on regressions.
+app/benchmarks/baselines holds the reports of the default runs and the machine they
+were recorded on (README); compare against them on comparable hardware only.
+
+Runs offline against a fresh SQLite file unless DB_URL points at MySQL (schema applied).
+
+    python -m app.benchmarks.load_suite --requests 500 --out report.json
+    python -m app.benchmarks.load_suite --requests 500 --baseline report.json
+    python -m app.benchmarks.load_suite --concurrency 16 --baseline app/benchmarks/baselines/load_suite_c16.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import event
+
+from app.benchmarks.common import ensure_local_db, percentile
+
+SCENARIOS = ("inbound", "list_messages", "agent_send", "transfer_toggle")
+DEFAULT_MIX = {"inbound": 40, "list_messages": 40, "agent_send": 15, "transfer_toggle": 5}
+
+# statements of the request running in this context, with --concurrency
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("load_suite_request_queries", default=None)
+
+
+@dataclass
+class LoadConfig:
+    tenants: int = 5
+    contacts: int = 200  # per tenant
+    history: int = 2000  # messages stored per tenant before the run
+    zipf_s: float = 1.1
+    requests: int = 500  # per scenario
+    warmup: int = 20
+    mix: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    seed: int = 42
+    concurrency: int = 1  # clients sending at once, 1 = one request at a time
+    first_company_id: int = 1000  # stays clear of the demo seed
+
+
+def zipf_weights(n: int, s: float) -> List[float]:
+    """Normalized weights of ranks 1..n under a Zipf law with exponent s."""
+    raw = [1 / (rank ** s) for rank in range(1, n + 1)]
+    total = sum(raw)
+    return [w / total for w in raw]
+
+
+def conversation_sizes(config: LoadConfig) -> List[int]:
+    """Stored inbound messages per contact (rank order), every contact gets at least one."""
+    return [max(1, round(config.history * w)) for w in zipf_weights(config.contacts, config.zipf_s)]
+
+
+class Dataset:
+    """Tenants, their conversations (Zipf-ranked) and the agent that answers in each tenant."""
+
+    def __init__(self, config: LoadConfig):
+        self.config = config
+        self.company_ids = [config.first_company_id + t for t in range(config.tenants)]
+        self.conversations: Dict[int, List[int]] = {}  # company_id -> conversation ids by rank
+        self.agents: Dict[int, int] = {}
+        self._cum_weights = []
+        for w in zipf_weights(config.contacts, config.zipf_s):
+            self._cum_weights.append((self._cum_weights[-1] if self._cum_weights else 0) + w)
+
+    @staticmethod
+    def phone(company_id: int, rank: int) -> str:
+        return f"+1{company_id:04d}{rank:06d}"
+
+    def load(self, client, chunk: int = 1000):
+        sizes = conversation_sizes(self.config)
+        for company_id in self.company_ids:
+            items = [{"company_id": company_id, "channel_id": company_id, "from": self.phone(company_id, rank),
+                      "text": f"history {n}", "channel_message_id": f"load-{company_id}-{rank}-{n}"}
+                     for rank, size in enumerate(sizes) for n in range(size)]
+            by_phone = {}
+            for i in range(0, len(items), chunk):
+                body = _ok(client.post("/webhooks/inbound/batch", json={"messages": items[i:i + chunk]}))
+                for item, result in zip(items[i:i + chunk], body["results"]):
+                    by_phone[item["from"]] = result["conversation_id"]
+            self.conversations[company_id] = [by_phone[self.phone(company_id, rank)]
+                                              for rank in range(self.config.contacts)]
+            # the first toggle to human creates the tenant's default agent; toggle back to the AI
+            top = self.conversations[company_id][0]
+            _ok(client.post(f"/conversations/{top}/transfer-toggle"))
+            _ok(client.post(f"/conversations/{top}/transfer-toggle"))
+            users = _ok(client.get(f"/companies/{company_id}/users"))
+            self.agents[company_id] = next(u["id"] for u in users if u["role"] == "agent")
+
+    def pick(self, rng: random.Random):
+        """(company_id, contact rank) of the next request: uniform tenant, Zipf-skewed contact."""
+        company_id = rng.choice(self.company_ids)
+        rank = rng.choices(range(self.config.contacts), cum_weights=self._cum_weights)[0]
+        return company_id, rank
+
+
+def _ok(response):
+    assert response.status_code < 400, f"{response.request.method} {response.request.url}: {response.text}"
+    return response.json()
+
+
+def request_for(kind: str, dataset: Dataset, rng: random.Random, n: int):
+    """(method, url, json body) of one request of the given scenario."""
+    company_id, rank = dataset.pick(rng)
+    conv_id = dataset.conversations[company_id][rank]
+    if kind == "inbound":
+        return "POST", "/webhooks/inbound", {"company_id": company_id, "channel_id": company_id,
+                                             "from": dataset.phone(company_id, rank), "text": f"load {n}",
+                                             "channel_message_id": f"run-{rng.random():.12f}-{n}"}
+    if kind == "list_messages":
+        return "GET", f"/conversations/{conv_id}/messages?before_id={2 ** 62}&limit=50", None
+    if kind == "agent_send":
+        return "POST", f"/conversations/{conv_id}/messages", {"author_id": dataset.agents[company_id],
+                                                              "text": f"agent {n}"}
+    if kind == "transfer_toggle":
+        return "POST", f"/conversations/{conv_id}/transfer-toggle", None
+    raise ValueError(f"unknown scenario {kind!r}")
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "after_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "after_cursor_execute", self._on_execute)
+
+
+def _run_sequentially(client, counter: StatementCounter, plan):
+    """(latency seconds, statements, failed) of each request, one at a time."""
+    results = []
+    for method, url, body in plan:
+        before = counter.count
+        start = time.perf_counter()
+        response = client.request(method, url, json=body)
+        results.append((time.perf_counter() - start, counter.count - before, response.status_code >= 400))
+    return results
+
+
+async def _run_concurrently(app, plan, concurrency: int):
+    """
+    Same as _run_sequentially with `concurrency` clients taking the next request of the plan.
+    The ASGI transport runs each request in its client's task, so the statements it issues
+    (in the threadpool or on the loop) count in that task's context.
+    """
+    results, requests = [], iter(plan)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-suite", timeout=None) as client:
+        async def worker():
+            for method, url, body in requests:
+                queries = [0]
+                token = _request_queries.set(queries)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, url, json=body)
+                finally:
+                    _request_queries.reset(token)
+                results.append((time.perf_counter() - start, queries[0], response.status_code >= 400))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def run_scenario(client, counter: StatementCounter, dataset: Dataset, name: str, config: LoadConfig) -> dict:
+    rng = random.Random(f"{config.seed}-{name}")
+    kinds = list(config.mix) if name == "mixed" else [name]
+    weights = [config.mix[k] for k in kinds] if name == "mixed" else None
+
+    def next_request(n):
+        kind = rng.choices(kinds, weights=weights)[0] if weights else name
+        return request_for(kind, dataset, rng, n)
+
+    # drawn up front: every concurrency level sends the same requests
+    plan = [next_request(n) for n in range(config.warmup + config.requests)]
+
+    def run(requests):
+        if config.concurrency > 1:
+            return client.portal.call(_run_concurrently, client.app, requests, config.concurrency)
+        return _run_sequentially(client, counter, requests)
+
+    run(plan[:config.warmup])
+    total_start = time.perf_counter()
+    results = run(plan[config.warmup:])
+    wall = time.perf_counter() - total_start
+
+    latencies = sorted(latency for latency, _, _ in results)
+    queries = [n for _, n, _ in results]
+    return {
+        "requests": len(latencies),
+        "errors": sum(failed for _, _, failed in results),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "latency_ms": {p: round(percentile(latencies, int(p[1:])) * 1000, 3) for p in ("p50", "p95", "p99")},
+        "queries_per_request": round(sum(queries) / len(queries), 2),
+        "queries_per_request_max": max(queries),
+    }
+
+
+def run_suite(config: LoadConfig, scenarios=SCENARIOS + ("mixed",)) -> dict:
+    from fastapi.testclient import TestClient
+    from app.db_utils.db_connection import get_engine
+    from app.main import create_app
+
+    with TestClient(create_app(async_mode=False)) as client:
+        engine = get_engine()
+        dataset = Dataset(config)
+        dataset.load(client)
+        with StatementCounter(engine) as counter:
+            results = {name: run_scenario(client, counter, dataset, name, config) for name in scenarios}
+
+    return {
+        "config": asdict(config),
+        "environment": {"dialect": engine.dialect.name, "python": platform.python_version(),
+                        "platform": platform.platform(), "cpus": os.cpu_count()},
+        "scenarios": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.25) -> List[str]:
+    """
+    Regressions of `report` against `baseline`: throughput down or p95/p99 up by more than
+    `tolerance` (relative), or any increase of queries per request (those are exact).
+    """
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        cur = report["scenarios"].get(name)
+        if cur is None:
+            continue
+        if cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {cur['throughput_rps']} req/s")
+        for p in ("p95", "p99"):
+            if cur["latency_ms"][p] > base["latency_ms"][p] * (1 + tolerance):
+                regressions.append(f"{name}: {p} {base['latency_ms'][p]} -> {cur['latency_ms'][p]} ms")
+        if cur["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(f"{name}: queries/request {base['queries_per_request']} -> "
+                               f"{cur['queries_per_request']}")
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {cur['errors']}")
+    return regressions
+
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {kind.strip()!r}")
+        mix[kind.strip()] = int(weight)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None):
+    defaults = LoadConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=defaults.tenants)
+    parser.add_argument("--contacts", type=int, default=defaults.contacts, help="contacts per tenant")
+    parser.add_argument("--history", type=int, default=defaults.history, help="stored messages per tenant")
+    parser.add_argument("--zipf", type=float, default=defaults.zipf_s, help="Zipf exponent of conversation sizes")
+    parser.add_argument("--requests", type=int, default=defaults.requests, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=defaults.warmup)
+    parser.add_argument("--mix", type=_parse_mix, default=defaults.mix,
+                        help="weights of the mixed scenario, e.g. inbound=40,list_messages=40,agent_send=15,"
+                             "transfer_toggle=5")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--concurrency", type=int, default=defaults.concurrency,
+                        help="clients sending at once (1: one request at a time)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS + ("mixed",)))
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="stored report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative throughput/latency tolerance")
+    args = parser.parse_args(argv)
+
+    config = LoadConfig(tenants=args.tenants, contacts=args.contacts, history=args.history, zipf_s=args.zipf,
+                        requests=args.requests, warmup=args.warmup, mix=args.mix, seed=args.seed,
+                        concurrency=args.concurrency)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"].get("concurrency", 1) != config.concurrency:
+            parser.error(f"{args.baseline} was recorded with --concurrency {baseline['config'].get('concurrency', 1)}")
+    ensure_local_db()
+    report = run_suite(config, scenarios=tuple(args.scenarios.split(",")))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for name, r in report["scenarios"].items():
+        print(f"{name:16} {r['throughput_rps']:9.1f} req/s  p50 {r['latency_ms']['p50']:8.2f}  "
+              f"p95 {r['latency_ms']['p95']:8.2f}  p99 {r['latency_ms']['p99']:8.2f} ms  "
+              f"{r['queries_per_request']:5.2f} queries/req", file=sys.stderr)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
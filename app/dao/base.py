@@ -2,3 +2,6 @@ import sqlalchemy
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
+
+# BIGINT on MySQL; plain INTEGER on SQLite so local stand-ins keep rowid autoincrement
+BigIntId = sqlalchemy.BigInteger().with_variant(sqlalchemy.Integer(), "sqlite")
@@ -1,10 +1,10 @@
 import sqlalchemy
-from .base import Base
+from .base import Base, BigIntId
 
 class DAOChannel(Base):
     __tablename__ = "channels"
 
-    id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
     company_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("companies.id"), nullable=False)
     name = sqlalchemy.Column(sqlalchemy.String(255), nullable=False)
     type = sqlalchemy.Column(sqlalchemy.String(50), nullable=False)
@@ -1,9 +1,9 @@
 import sqlalchemy
-from .base import Base
+from .base import Base, BigIntId
 
 class DAOCompany(Base):
     __tablename__ = "companies"
 
-    id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
     name = sqlalchemy.Column(sqlalchemy.String(255), nullable=False)
     created_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.current_timestamp())
@@ -1,10 +1,14 @@
 import sqlalchemy
-from .base import Base
+from .base import Base, BigIntId
 
 class DAOContact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        # one contact per phone per company; lets get-or-create be a single upsert
+        sqlalchemy.UniqueConstraint("company_id", "phone", name="uq_contacts_company_phone"),
+    )
 
-    id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
     company_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("companies.id"), nullable=False)
     name = sqlalchemy.Column(sqlalchemy.String(255))
     phone = sqlalchemy.Column(sqlalchemy.String(50))
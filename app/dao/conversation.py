@@ -1,12 +1,28 @@
 import sqlalchemy
-from .base import Base
+from .base import Base, BigIntId
 
 class DAOConversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # find_open_conversation(s): WHERE company_id = ? AND channel_id = ? AND contact_id = ? ORDER BY id DESC
+        sqlalchemy.Index("ix_conversations_company_channel_contact_id", "company_id", "channel_id", "contact_id", "id"),
+        # company inbox: WHERE company_id = ? AND status = ? AND last_message_id < ? ORDER BY last_message_id DESC
+        sqlalchemy.Index("ix_conversations_company_status_last_message", "company_id", "status", "last_message_id"),
+        # archival job: WHERE last_message_at < ? in (last_message_at, id) keyset batches
+        sqlalchemy.Index("ix_conversations_last_message_at_id", "last_message_at", "id"),
+    )
 
-    id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
     company_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("companies.id"), nullable=False)
     channel_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("channels.id"), nullable=False)
     contact_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("contacts.id"), nullable=False)
     owner_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("users.id"))
+    status = sqlalchemy.Column(sqlalchemy.String(20), nullable=False, default="open", server_default="open")  # open | closed
+    # denormalized from messages, kept up to date in the transaction that adds a message
+    last_message_id = sqlalchemy.Column(sqlalchemy.BigInteger)  # no FK: messages already reference conversations
+    last_message_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP)
+    message_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default="0")
+    # messages with id <= archived_upto_id live in the archive segments (app/services/archive.py)
+    archived_upto_id = sqlalchemy.Column(sqlalchemy.BigInteger)
+    restored_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP)  # archival skips it until idle since then
     created_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.current_timestamp())
@@ -1,11 +1,19 @@
 import sqlalchemy
-from .base import Base
+from .base import Base, BigIntId
 
 class DAOMessage(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # keyset pagination of a conversation's history: WHERE conversation_id = ? AND id > ? ORDER BY id
+        sqlalchemy.Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+        # provider retries: the same delivery must never be stored twice
+        sqlalchemy.UniqueConstraint("channel_id", "channel_message_id", name="uq_messages_channel_message"),
+    )
 
-    id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
     conversation_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("conversations.id"), nullable=False)
     sender = sqlalchemy.Column(sqlalchemy.String(50), nullable=False)  # contact | agent | ai
     content = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    channel_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("channels.id"))
+    channel_message_id = sqlalchemy.Column(sqlalchemy.String(255))  # provider message id (inbound only)
     created_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.current_timestamp())
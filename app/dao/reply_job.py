@@ -0,0 +1,23 @@
+import sqlalchemy
+from .base import Base, BigIntId
+
+class DAOReplyJob(Base):
+    """Outbox of pending AI replies, written in the same transaction as the inbound message."""
+    __tablename__ = "reply_jobs"
+    __table_args__ = (
+        # workers poll: WHERE status = ? AND available_at <= now ORDER BY available_at, id
+        sqlalchemy.Index("ix_reply_jobs_status_available", "status", "available_at", "id"),
+    )
+
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
+    company_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("companies.id"), nullable=False)
+    conversation_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("conversations.id"), nullable=False)
+    ai_user_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("users.id"), nullable=False)
+    company_name = sqlalchemy.Column(sqlalchemy.String(255))
+    inbound_text = sqlalchemy.Column(sqlalchemy.Text, nullable=False)
+    status = sqlalchemy.Column(sqlalchemy.String(20), nullable=False, default="pending")  # pending | running | done | failed
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    available_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False)
+    claim_token = sqlalchemy.Column(sqlalchemy.String(36))
+    last_error = sqlalchemy.Column(sqlalchemy.Text)
+    created_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.current_timestamp())
@@ -0,0 +1,38 @@
+import sqlalchemy
+from .base import Base, BigIntId
+
+class DAOSearchBlock(Base):
+    """A block of one term's postings in a company's message search index (app/services/search.py)."""
+    __tablename__ = "search_blocks"
+
+    # (company_id, term, first_id): a company's index is a contiguous key range, a term's blocks are in id order
+    company_id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=False)
+    term = sqlalchemy.Column(sqlalchemy.String(64), primary_key=True)
+    first_id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=False)
+    last_id = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False)
+    postings = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    data = sqlalchemy.Column(sqlalchemy.LargeBinary, nullable=False)  # encoded by app/db_utils/postings.py
+
+
+class DAOSearchPending(Base):
+    """Postings written with their message, not yet folded into blocks by the merge job."""
+    __tablename__ = "search_pending"
+    __table_args__ = (
+        # search: WHERE company_id = ? AND term IN (...) AND message_id < ?; a message is indexed once
+        sqlalchemy.UniqueConstraint("company_id", "term", "message_id", name="uq_search_pending_term_message"),
+    )
+
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)  # merge job walks pending by id
+    company_id = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False)
+    term = sqlalchemy.Column(sqlalchemy.String(64), nullable=False)
+    message_id = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False)
+    conversation_id = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False)
+
+
+class DAOSearchIndexState(Base):
+    """Per-company index state: the merge job leaves a company alone while it is being rebuilt."""
+    __tablename__ = "search_index_state"
+
+    company_id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=False)
+    rebuilding = sqlalchemy.Column(sqlalchemy.Boolean, nullable=False, default=False)
+    rebuilt_at = sqlalchemy.Column(sqlalchemy.TIMESTAMP)
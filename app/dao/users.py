@@ -1,10 +1,16 @@
 import sqlalchemy
-from .base import Base
+from .base import Base, BigIntId
 
 class DAOUser(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # AI-bot / default-agent lookups: WHERE company_id = ? AND role = ? ORDER BY id
+        sqlalchemy.Index("ix_users_company_role_id", "company_id", "role", "id"),
+        # company user listing: WHERE company_id = ? ORDER BY id
+        sqlalchemy.Index("ix_users_company_id_id", "company_id", "id"),
+    )
 
-    id = sqlalchemy.Column(sqlalchemy.BigInteger, primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(BigIntId, primary_key=True, autoincrement=True)
     company_id = sqlalchemy.Column(sqlalchemy.BigInteger, sqlalchemy.ForeignKey("companies.id"), nullable=False)
     name = sqlalchemy.Column(sqlalchemy.String(255), nullable=False)
     role = sqlalchemy.Column(sqlalchemy.String(50), nullable=False)  # agent | admin | ai-bot
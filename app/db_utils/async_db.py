@@ -0,0 +1,97 @@
+"""
+Async counterpart of db_connection: one AsyncEngine per db_label, built from the same
+DB_* configuration with the driver swapped for its asyncio flavour
+(mysql+pymysql -> mysql+aiomysql, sqlite -> sqlite+aiosqlite).
+"""
+
+import os
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.db_utils.db_connection import CheckoutTimingMixin, build_url, describe_pool, load_db_config
+from app.db_utils.instrumentation import instrument_engine, instrumentation_enabled
+
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+class TimedAsyncQueuePool(CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def async_url(s: dict):
+    url = make_url(build_url(s))
+    driver = os.getenv("DB_ASYNC_DRIVER") or ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=driver)
+
+
+_async_engines: dict = {}
+_async_session_factories: dict = {}
+
+
+def get_async_engine(db_label: str = "main") -> AsyncEngine:
+    # only touched from the event loop thread, so no lock is needed
+    engine = _async_engines.get(db_label)
+    if engine is None:
+        s = load_db_config()[db_label]
+        engine = create_async_engine(
+            async_url(s),
+            poolclass=TimedAsyncQueuePool,
+            pool_size=s["pool_size"],
+            max_overflow=s["max_overflow"],
+            pool_recycle=s["pool_recycle"],
+            pool_timeout=s["pool_timeout"],
+        )
+        if instrumentation_enabled():
+            instrument_engine(engine.sync_engine, f"{db_label}:async")
+        _async_engines[db_label] = engine
+        _async_session_factories[db_label] = async_sessionmaker(engine, class_=AsyncSession, autoflush=False,
+                                                                expire_on_commit=False)
+    return engine
+
+
+def get_async_sessionmaker(db_label: str = "main") -> async_sessionmaker:
+    if db_label not in _async_session_factories:
+        get_async_engine(db_label)
+    return _async_session_factories[db_label]
+
+
+def init_async_engines():
+    for db_label in load_db_config():
+        get_async_engine(db_label)
+
+
+async def dispose_async_engines():
+    for engine in _async_engines.values():
+        await engine.dispose()
+    _async_engines.clear()
+    _async_session_factories.clear()
+
+
+def async_pool_stats(db_label: str = "main") -> dict:
+    engine = _async_engines.get(db_label)
+    stats = describe_pool(db_label, engine.sync_engine if engine else None)
+    stats["async"] = True
+    return stats
+
+
+class AsyncDBConn:
+    def __init__(self, db_label: str = "main"):
+        self.db_label = db_label
+        self.session: AsyncSession = None
+
+    def connect(self) -> AsyncSession:
+        """Open an AsyncSession from the shared async engine/connection pool."""
+        if self.session is None:
+            self.session = get_async_sessionmaker(self.db_label)()
+        return self.session
+
+    async def disconnect(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
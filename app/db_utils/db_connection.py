@@ -2,15 +2,185 @@
 Database connection manager for omniAI
 Inspired by previous project style (DBConn), adapted for FastAPI + SQLAlchemy.
 
+Engines are process-wide: one engine (and one connection pool) per db_label,
+built once at app startup and disposed on shutdown. DBConn only hands out
+sessions from the shared sessionmaker.
+
 Created on Aug 2025
 @author: Yara
 """
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
 import os
 import json
+import threading
+import time
+
+from app.db_utils.instrumentation import instrument_engine, instrumentation_enabled, record_pool_wait
+
+
+def load_db_config() -> dict:
+    """Load DB config from environment (scalable to multiple DBs)."""
+    db_config = {
+        "main": {
+            "url": os.getenv("DB_URL"),  # optional full URL, overrides the parts below (e.g. sqlite:///local.db)
+            "driver": os.getenv("DB_DRIVER", "mysql+pymysql"),
+            "user": os.getenv("DB_USER", "sailer_user"),
+            "pwd": os.getenv("DB_PASSWORD", "sailer_pass"), #hardcoded password and credentials just for the challenge. In real-case scenario use ENV VAR
+            "addr": os.getenv("DB_HOST", "db"),
+            "port": os.getenv("DB_PORT", "3306"),
+            "db_name": os.getenv("DB_NAME", "sailer"),
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            "replica": False,
+        }
+    }
+    # read replicas: DB_REPLICAS=replica1,replica2 with DB_REPLICA1_URL (or DB_REPLICA1_HOST/_PORT/...);
+    # unset parts are inherited from the primary
+    main = db_config["main"]
+    for label in filter(None, (l.strip() for l in os.getenv("DB_REPLICAS", "").split(","))):
+        prefix = f"DB_{label.upper()}_"
+        db_config[label] = {
+            **main,
+            "url": os.getenv(prefix + "URL"),
+            "user": os.getenv(prefix + "USER", main["user"]),
+            "pwd": os.getenv(prefix + "PASSWORD", main["pwd"]),
+            "addr": os.getenv(prefix + "HOST", main["addr"]),
+            "port": os.getenv(prefix + "PORT", main["port"]),
+            "db_name": os.getenv(prefix + "NAME", main["db_name"]),
+            "replica": True,
+        }
+    return db_config
+
+
+def replica_labels() -> list:
+    return [label for label, s in load_db_config().items() if s["replica"]]
+
+
+def build_url(s: dict) -> str:
+    if s.get("url"):
+        return s["url"]
+    return f"{s['driver']}://{s['user']}:{s['pwd']}@{s['addr']}:{s['port']}/{s['db_name']}"
+
+
+class CheckoutTimingMixin:
+    """Records how long each pool checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            record_pool_wait(waited)
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                if waited > self.wait_max:
+                    self.wait_max = waited
+
+
+class TimedQueuePool(CheckoutTimingMixin, QueuePool):
+    pass
+
+
+# ==========================================================
+# Process-wide engine registry (one engine/pool per db_label)
+# ==========================================================
+_engines: dict = {}
+_session_factories: dict = {}
+_registry_lock = threading.Lock()
+
+
+def _create_engine(db_label: str) -> Engine:
+    s = load_db_config()[db_label]
+    engine = create_engine(
+        build_url(s),
+        poolclass=TimedQueuePool,
+        pool_size=s["pool_size"],
+        max_overflow=s["max_overflow"],
+        pool_recycle=s["pool_recycle"],
+        pool_timeout=s["pool_timeout"],
+    )
+    if instrumentation_enabled():
+        instrument_engine(engine, db_label)
+    return engine
+
+
+def get_engine(db_label: str = "main") -> Engine:
+    engine = _engines.get(db_label)
+    if engine is not None:
+        return engine
+    with _registry_lock:
+        if db_label not in _engines:
+            engine = _create_engine(db_label)
+            _engines[db_label] = engine
+            # sessions are request-scoped, so objects stay usable after commit without a reload
+            _session_factories[db_label] = sessionmaker(autocommit=False, autoflush=False,
+                                                        expire_on_commit=False, bind=engine)
+        return _engines[db_label]
+
+
+def get_sessionmaker(db_label: str = "main") -> sessionmaker:
+    if db_label not in _session_factories:
+        get_engine(db_label)
+    return _session_factories[db_label]
+
+
+def init_engines():
+    """Build every configured engine once (called from the app lifespan)."""
+    for db_label in load_db_config():
+        get_engine(db_label)
+
+
+def dispose_engines():
+    """Close all pooled connections and forget the engines (app shutdown)."""
+    with _registry_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_factories.clear()
+
+
+def describe_pool(db_label: str, engine) -> dict:
+    if engine is None:
+        return {"db_label": db_label, "initialized": False}
+    pool = engine.pool
+    stats = {
+        "db_label": db_label,
+        "initialized": True,
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+    }
+    if isinstance(pool, CheckoutTimingMixin):
+        with pool._wait_lock:
+            stats.update({
+                "checkouts": pool.wait_count,
+                "wait_seconds_total": round(pool.wait_total, 6),
+                "wait_seconds_max": round(pool.wait_max, 6),
+                "wait_seconds_avg": round(pool.wait_total / pool.wait_count, 6) if pool.wait_count else 0.0,
+            })
+    return stats
+
+
+def pool_stats(db_label: str = "main") -> dict:
+    return describe_pool(db_label, _engines.get(db_label))
+
 
 class DBConn:
     def __init__(self, db_label: str = "main"):
@@ -20,42 +190,19 @@ class DBConn:
         self.db_config = self._load_db_config()
 
     def _load_db_config(self):
-        """Load DB config from environment (scalable to multiple DBs)."""
-        db_config = {
-            "main": {
-                "driver": os.getenv("DB_DRIVER", "mysql+pymysql"),
-                "user": os.getenv("DB_USER", "sailer_user"),
-                "pwd": os.getenv("DB_PASSWORD", "sailer_pass"), #hardcoded password and credentials just for the challenge. In real-case scenario use ENV VAR
-                "addr": os.getenv("DB_HOST", "db"),
-                "port": os.getenv("DB_PORT", "3306"),
-                "db_name": os.getenv("DB_NAME", "sailer"),
-                "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
-                "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
-                "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600")),
-            }
-        }
-        return db_config
+        return load_db_config()
 
     def connect(self):
-        """Open DB engine + session with connection pool."""
+        """Open a session from the shared engine/connection pool."""
         if self.session is not None:
             return self.session
 
-        s = self.db_config[self.db_label]
-        conn_str = f"{s['driver']}://{s['user']}:{s['pwd']}@{s['addr']}:{s['port']}/{s['db_name']}"
-
-        self.engine = create_engine(
-            conn_str,
-            poolclass=QueuePool,
-            pool_size=s["pool_size"],
-            max_overflow=s["max_overflow"],
-            pool_recycle=s["pool_recycle"],
-        )
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        self.session = SessionLocal()
+        self.engine = get_engine(self.db_label)
+        self.session = get_sessionmaker(self.db_label)()
         return self.session
 
     def disconnect(self):
+        # returns the connection to the pool; the engine itself stays alive
         if self.session:
             self.session.close()
             self.session = None
@@ -1,9 +1,114 @@
-from app.db_utils.db_connection import DBConn
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+import anyio
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError
+from app.db_utils.db_connection import DBConn, load_db_config
+from app.db_utils.fair_queue import DEFAULT_TENANT, FairSemaphore, current_tenant
+from app.db_utils.instrumentation import record_pool_wait
+from app.db_utils.async_db import AsyncDBConn
+from app.db_utils.replicas import PRIMARY, choose_read_label, get_replica_monitor
 
-def get_db():
-    conn = DBConn()
-    db = conn.connect()
+# one fair semaphore per event loop and pool, sized to the pool (pool_size + max_overflow)
+_db_slots = weakref.WeakKeyDictionary()
+
+
+def _db_slots_for_running_loop(db_label: str = "main", is_async: bool = False) -> FairSemaphore:
+    per_pool = _db_slots.setdefault(asyncio.get_running_loop(), {})
+    slots = per_pool.get((db_label, is_async))
+    if slots is None:
+        s = load_db_config()[db_label]
+        slots = per_pool[(db_label, is_async)] = FairSemaphore(s["pool_size"] + s["max_overflow"])
+    return slots
+
+
+def db_slot_stats() -> dict:
+    """Fair-queue state of this event loop's pools: slots in use, waiters and per-tenant grants/wait."""
+    per_pool = _db_slots.get(asyncio.get_running_loop(), {})
+    return {f"{label}:async" if is_async else label: slots.describe()
+            for (label, is_async), slots in sorted(per_pool.items())}
+
+
+@asynccontextmanager
+async def pool_slot(db_label: str = "main", is_async: bool = False):
+    """Hold one of the pool's connection slots, queued fairly between tenants when the pool is saturated."""
+    slots = _db_slots_for_running_loop(db_label, is_async)
+    tenant, weight = current_tenant.get() or (DEFAULT_TENANT, 1.0)
+    start = time.perf_counter()
+    await slots.acquire(tenant, weight)
+    record_pool_wait(time.perf_counter() - start)
     try:
-        yield db
+        yield
     finally:
-        conn.disconnect()
+        slots.release()
+
+
+@asynccontextmanager
+async def _pooled_session(db_label: str = "main"):
+    # Wait for a pool slot here on the event loop, never inside a worker thread: sync
+    # endpoints keep their connection until FastAPI has validated the response on
+    # another threadpool slot, so threads blocked on pool checkout could starve the
+    # requests that are about to give connections back (deadlock until pool_timeout).
+    async with pool_slot(db_label):
+        conn = DBConn(db_label)
+        db = conn.connect()
+        try:
+            yield db
+        finally:
+            # own limiter: closing must not wait for a free threadpool slot either
+            await anyio.to_thread.run_sync(conn.disconnect, limiter=anyio.CapacityLimiter(1))
+
+
+@asynccontextmanager
+async def _pooled_async_session(db_label: str = "main"):
+    async with pool_slot(db_label, is_async=True):
+        conn = AsyncDBConn(db_label)
+        db = conn.connect()
+        try:
+            yield db
+        finally:
+            await conn.disconnect()
+
+
+async def get_db():
+    async with _pooled_session() as db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    """Session for read-only endpoints: a healthy replica when one is usable (see replicas.py), else the primary."""
+    db_label = choose_read_label(request.cookies)
+    if db_label != PRIMARY:
+        async with _pooled_session(db_label) as db:
+            try:
+                # check the connection out now, so an unreachable replica falls back instead of failing the request
+                await anyio.to_thread.run_sync(db.connection, limiter=anyio.CapacityLimiter(1))
+            except DBAPIError as e:
+                get_replica_monitor().mark_down(db_label, e)
+            else:
+                yield db
+                return
+    async with _pooled_session() as db:
+        yield db
+
+
+async def get_async_db():
+    async with _pooled_async_session() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    db_label = choose_read_label(request.cookies)
+    if db_label != PRIMARY:
+        async with _pooled_async_session(db_label) as db:
+            try:
+                await db.connection()
+            except DBAPIError as e:
+                get_replica_monitor().mark_down(db_label, e)
+            else:
+                yield db
+                return
+    async with _pooled_async_session() as db:
+        yield db
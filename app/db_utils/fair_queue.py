@@ -0,0 +1,98 @@
+"""
+Weighted fair queuing for the DB pool slots (see deps._pooled_session).
+
+While slots are free a session gets one immediately, as with a plain semaphore. Once the
+pool is saturated, waiters are served by start-time fair queuing instead of FIFO: every
+request gets a virtual start tag, max(virtual clock, its tenant's previous finish tag),
+and each grant advances the tenant's finish tag by 1 / weight. A tenant that floods the
+queue only pushes its own tags ahead, so another tenant's next request is served after
+at most one request of every tenant already waiting, not after the whole backlog.
+
+The tenant of the running request is `current_tenant`, set by the admission middleware
+(app/services/admission.py); sessions opened outside a tenant share one default key.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from typing import Dict, Hashable, Optional, Tuple
+
+# (tenant key, weight) of the running request
+current_tenant: ContextVar[Optional[Tuple[Hashable, float]]] = ContextVar("current_tenant", default=None)
+
+DEFAULT_TENANT = ""
+
+
+class FairSemaphore:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._clock = 0.0  # start tag of the last grant
+        self._finish: Dict[Hashable, float] = {}  # tenant -> finish tag of its last request
+        self._waiters = []  # heap of (start tag, seq, tenant, future)
+        self._seq = itertools.count()
+        self._stats: Dict[Hashable, list] = {}  # tenant -> [grants, queued, waiting now, wait seconds]
+
+    def _tag(self, tenant: Hashable, weight: float) -> float:
+        start = max(self._clock, self._finish.get(tenant, 0.0))
+        self._finish[tenant] = start + 1.0 / max(weight, 1e-6)
+        if len(self._finish) > 4 * max(len(self._waiters), 256):
+            # tenants behind the clock start fresh anyway
+            self._finish = {t: f for t, f in self._finish.items() if f > self._clock}
+        return start
+
+    def _stat(self, tenant: Hashable) -> list:
+        stat = self._stats.get(tenant)
+        if stat is None:
+            if len(self._stats) > 4 * max(len(self._waiters), 256):
+                # bounded like the finish tags: forget the tenants with nothing waiting
+                self._stats = {t: s for t, s in self._stats.items() if s[2]}
+            stat = self._stats[tenant] = [0, 0, 0, 0.0]
+        return stat
+
+    async def acquire(self, tenant: Hashable = DEFAULT_TENANT, weight: float = 1.0):
+        stat = self._stat(tenant)
+        tag = self._tag(tenant, weight)
+        if self.in_use < self.capacity and not self._waiters:
+            self.in_use += 1
+            self._clock = tag
+            stat[0] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (tag, next(self._seq), tenant, future))
+        stat[1] += 1
+        stat[2] += 1
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # granted while being cancelled: pass the slot on
+            else:
+                self._waiters = [w for w in self._waiters if w[3] is not future]
+                heapq.heapify(self._waiters)
+            raise
+        finally:
+            stat[2] -= 1
+            stat[3] += time.perf_counter() - start
+        stat[0] += 1
+
+    def release(self):
+        while self._waiters:
+            tag, _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._clock = tag
+                future.set_result(None)  # the slot goes straight to the waiter
+                return
+        self.in_use -= 1
+
+    def describe(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": len(self._waiters),
+            "tenants": {str(t): {"grants": s[0], "queued": s[1], "waiting": s[2], "wait_seconds": round(s[3], 6)}
+                        for t, s in self._stats.items()},
+        }
@@ -0,0 +1,25 @@
+"""
+WHERE-clause helpers for set-based lookups on composite keys.
+"""
+
+from collections import defaultdict
+from typing import Iterable, Sequence, Tuple
+
+import sqlalchemy
+
+
+def composite_in(columns: Sequence[sqlalchemy.ColumnElement], keys: Iterable[Tuple]) -> sqlalchemy.ColumnElement:
+    """
+    (a, b, c) IN (...) written as OR-ed (a = ? AND b = ? AND c IN (...)) groups.
+
+    Row-value IN lists are not matched against composite indexes by SQLite (and only
+    by some MySQL versions); this form gives an index range lookup per group on both.
+    """
+    groups = defaultdict(list)
+    for key in keys:
+        groups[tuple(key[:-1])].append(key[-1])
+    *prefix_cols, last_col = columns
+    return sqlalchemy.or_(*(
+        sqlalchemy.and_(*(col == value for col, value in zip(prefix_cols, prefix)), last_col.in_(sorted(values)))
+        for prefix, values in sorted(groups.items())
+    ))
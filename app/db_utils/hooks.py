@@ -0,0 +1,87 @@
+"""
+Run callbacks once the current transaction of a session commits.
+Used to keep side effects (caches, queues, ...) in step with the database:
+callbacks staged during a transaction are dropped if it rolls back.
+
+before_commit runs a callback inside the transaction, right before it commits, so
+writes collected along the way go in as one statement (e.g. search index postings).
+
+on_rollback undoes a side effect taken up front (e.g. a reserved queue slot) when the
+transaction ends without committing: rolled back, or the session closed.
+
+Sessions flagged with info[DRY_RUN] (the startup warm-up, whose writes are rolled back
+afterwards) drop their after-commit callbacks and run the on_rollback ones instead.
+"""
+
+import logging
+from typing import Callable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_KEY = "after_commit_callbacks"
+_BEFORE_KEY = "before_commit_callbacks"
+_ROLLBACK_KEY = "after_rollback_callbacks"
+DRY_RUN = "dry_run"
+
+
+def on_commit(db: Session, callback: Callable[[], None]):
+    db.info.setdefault(_KEY, []).append(callback)
+
+
+def on_rollback(db: Session, callback: Callable[[], None]):
+    db.info.setdefault(_ROLLBACK_KEY, []).append(callback)
+
+
+def before_commit(db: Session, key: str, callback: Callable[[], None]) -> bool:
+    """
+    Run `callback` once right before the transaction commits, however often it is staged under `key`.
+    Returns True when this call registered it (the first one in the transaction).
+    """
+    callbacks = db.info.setdefault(_BEFORE_KEY, {})
+    if key in callbacks:
+        return False
+    callbacks[key] = callback
+    return True
+
+
+@event.listens_for(Session, "before_commit")
+def _run_before_commit(session: Session):
+    # a failing callback fails the commit: its writes belong to the transaction
+    callbacks = session.info.pop(_BEFORE_KEY, None)
+    for callback in (callbacks or {}).values():
+        callback()
+
+
+def _run(callbacks, what: str):
+    for callback in callbacks or ():
+        try:
+            callback()
+        except Exception:
+            logger.exception("%s callback failed", what)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    callbacks = session.info.pop(_KEY, None)
+    undo = session.info.pop(_ROLLBACK_KEY, None)
+    if session.info.get(DRY_RUN):
+        _run(undo, "on-rollback")
+        return
+    _run(callbacks, "after-commit")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _run_after_rollback(session: Session, transaction):
+    # the outermost transaction ended without after_commit having taken the callbacks
+    if transaction.parent is None and not transaction.nested:
+        _run(session.info.pop(_ROLLBACK_KEY, None), "on-rollback")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_after_rollback(session: Session, previous_transaction):
+    if previous_transaction.nested:
+        return  # a savepoint: the outer transaction, and what it staged, may still commit
+    session.info.pop(_KEY, None)
+    session.info.pop(_BEFORE_KEY, None)
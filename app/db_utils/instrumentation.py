@@ -0,0 +1,109 @@
+"""
+SQLAlchemy hooks that time every statement and commit, per engine (db_label) and for
+the HTTP request being served.
+
+The request is found through a ContextVar set by the metrics middleware; threadpool
+endpoints and AsyncSession greenlets see the same RequestStats object because the
+context is copied into them. Work outside a request (reply workers) only counts
+towards the per-engine totals.
+"""
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def instrumentation_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "commits", "pool_wait", "keep_statements", "statement_log")
+
+    def __init__(self, keep_statements: int = 0):
+        self.statements = 0
+        self.db_time = 0.0
+        self.commits = 0
+        self.pool_wait = 0.0
+        self.keep_statements = keep_statements  # how many statements to keep for the slow-request log
+        self.statement_log: List[Tuple[str, float]] = []
+
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+class EngineTotals:
+    __slots__ = ("statements", "db_time", "errors", "commits", "connects")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.errors = 0
+        self.commits = 0
+        self.connects = 0
+
+
+_totals: Dict[str, EngineTotals] = {}
+_totals_lock = threading.Lock()
+
+
+def engine_totals() -> Dict[str, EngineTotals]:
+    return dict(_totals)
+
+
+def record_pool_wait(waited: float):
+    """Time the current request waited for a connection (pool checkout, or the request slot in get_db)."""
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.pool_wait += waited
+
+
+def instrument_engine(engine: Engine, db_label: str):
+    """Attach the timing hooks to a (sync) engine; for an AsyncEngine pass engine.sync_engine."""
+    with _totals_lock:
+        totals = _totals.setdefault(db_label, EngineTotals())
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        with _totals_lock:
+            totals.statements += 1
+            totals.db_time += elapsed
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+            if len(stats.statement_log) < stats.keep_statements:
+                stats.statement_log.append((statement, elapsed))
+
+    def handle_error(exception_context):
+        # a failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if exception_context.statement is not None and conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+            with _totals_lock:
+                totals.errors += 1
+
+    def on_commit(conn):
+        with _totals_lock:
+            totals.commits += 1
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.commits += 1
+
+    def on_connect(dbapi_connection, connection_record):
+        with _totals_lock:
+            totals.connects += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+    event.listen(engine, "commit", on_commit)
+    event.listen(engine.pool, "connect", on_connect)
@@ -0,0 +1,61 @@
+"""
+Local stand-in database helpers (SQLite) for tests and benchmarks.
+Builds the schema from the DAO models and loads the same seed rows as sql/001_init.sql.
+"""
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.dao.base import Base
+from app.dao.company import DAOCompany
+from app.dao.channel import DAOChannel
+from app.dao.users import DAOUser
+from app.dao.contact import DAOContact
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+from app.dao.reply_job import DAOReplyJob  # noqa: F401 (registers the table)
+from app.dao.search import DAOSearchBlock, DAOSearchIndexState, DAOSearchPending  # noqa: F401 (registers the tables)
+
+
+def create_schema(engine: Engine):
+    Base.metadata.create_all(engine)
+
+
+def seed_demo_data(engine: Engine):
+    with Session(engine) as db:
+        db.add_all([
+            DAOCompany(id=1, name="Acme Corp"),
+            DAOCompany(id=2, name="Globex Inc"),
+        ])
+        db.flush()
+        db.add_all([
+            DAOChannel(id=1, company_id=1, name="WhatsApp Support", type="whatsapp"),
+            DAOChannel(id=2, company_id=2, name="Email Support", type="email"),
+            DAOUser(id=1, company_id=1, name="AI Assistant", role="ai"),
+            DAOUser(id=2, company_id=1, name="Alice Agent", role="agent"),
+            DAOUser(id=3, company_id=2, name="AI Helper", role="ai"),
+            DAOUser(id=4, company_id=2, name="Bob Agent", role="agent"),
+            DAOContact(id=1, company_id=1, name="Test Contact", phone="+15550001122", email="contact@example.com"),
+            DAOContact(id=2, company_id=2, name="Globex Client", phone=None, email="client@globex.com"),
+        ])
+        db.flush()
+        db.add_all([
+            DAOConversation(id=1, company_id=1, channel_id=1, contact_id=1, owner_id=1),
+            DAOConversation(id=2, company_id=2, channel_id=2, contact_id=2, owner_id=3),
+        ])
+        db.flush()
+        messages = [
+            DAOMessage(conversation_id=1, sender="contact", content="Hello, I need help!"),
+            DAOMessage(conversation_id=1, sender="ai", content="Hi! I am your AI assistant. How can I help you today?"),
+            DAOMessage(conversation_id=2, sender="contact", content="Can I reset my password?"),
+            DAOMessage(conversation_id=2, sender="ai", content="Hello! Sure, I will help you reset it."),
+        ]
+        db.add_all(messages)
+        db.flush()
+        # conversation state, as backfilled by sql/007_conversation_state.sql
+        for conv in db.query(DAOConversation):
+            mine = [m for m in messages if m.conversation_id == conv.id]
+            conv.message_count = len(mine)
+            conv.last_message_id = mine[-1].id
+            conv.last_message_at = mine[-1].created_at
+        db.commit()
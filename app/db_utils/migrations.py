@@ -0,0 +1,156 @@
+"""
+Versioned schema migrations: the numbered files in app/sql (NNN_description.sql),
+applied in order and recorded in the schema_migrations table.
+
+A fresh MySQL container applies every file through docker-entrypoint-initdb.d and
+each file records its own version, so `upgrade` afterwards finds nothing to do.
+On an existing database `upgrade` applies only the missing versions. Databases
+created before schema_migrations existed (from 001_init.sql alone) are marked once
+with `baseline 001`, then upgraded. Baseline a higher version only if every file up
+to it was really applied by hand: `baseline` records versions without checking them,
+and a skipped migration (unique contact phones, delivery ids, reply_jobs) breaks
+the upserts, deduplication and the outbox at runtime.
+
+    python -m app.db_utils.migrations status
+    python -m app.db_utils.migrations baseline 001
+    python -m app.db_utils.migrations upgrade
+
+001_init.sql also creates the database user, so applying it through the runner
+(instead of the container init) needs an account with CREATE USER / GRANT.
+"""
+
+import argparse
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+import sqlalchemy
+from sqlalchemy.engine import Engine
+
+SQL_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "sql"))
+_FILE_RE = re.compile(r"^(\d{3})_[\w-]+\.sql$")
+
+schema_migrations = sqlalchemy.Table(
+    "schema_migrations", sqlalchemy.MetaData(),
+    sqlalchemy.Column("version", sqlalchemy.String(16), primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String(255), nullable=False),
+    sqlalchemy.Column("applied_at", sqlalchemy.TIMESTAMP, server_default=sqlalchemy.func.current_timestamp()),
+)
+
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    path: str
+
+
+class MigrationError(Exception):
+    pass
+
+
+def discover(sql_dir: str = SQL_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(sql_dir)):
+        match = _FILE_RE.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), filename[:-4], os.path.join(sql_dir, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"duplicate migration versions in {sql_dir}: {versions}")
+    return migrations
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a migration file on statement-ending semicolons, dropping `--` comment lines."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    statements, current = [], []
+    for line in lines:
+        current.append(line)
+        if line.rstrip().endswith(";"):
+            statement = "\n".join(current).strip().rstrip(";").strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    tail = "\n".join(current).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def applied_versions(engine: Engine) -> Optional[set]:
+    """Recorded versions, or None when the database predates schema_migrations."""
+    inspector = sqlalchemy.inspect(engine)
+    if not inspector.has_table("schema_migrations"):
+        return set() if not inspector.get_table_names() else None
+    with engine.connect() as conn:
+        return set(conn.execute(sqlalchemy.select(schema_migrations.c.version)).scalars())
+
+
+def _record(conn, migration: Migration):
+    exists = conn.execute(sqlalchemy.select(schema_migrations.c.version)
+                          .where(schema_migrations.c.version == migration.version)).first()
+    if not exists:
+        conn.execute(schema_migrations.insert().values(version=migration.version, name=migration.name))
+
+
+def pending(engine: Engine, sql_dir: str = SQL_DIR) -> List[Migration]:
+    applied = applied_versions(engine)
+    if applied is None:
+        raise MigrationError("database has tables but no schema_migrations; "
+                             "mark the versions it already has with `baseline <version>` first")
+    return [m for m in discover(sql_dir) if m.version not in applied]
+
+
+def upgrade(engine: Engine, sql_dir: str = SQL_DIR) -> List[str]:
+    """Apply pending migrations in order; returns the applied names."""
+    done = []
+    for migration in pending(engine, sql_dir):
+        with open(migration.path, encoding="utf-8") as f:
+            statements = split_statements(f.read())
+        # MySQL commits DDL implicitly, so a migration is recorded only after all its statements ran
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.exec_driver_sql(statement)
+            schema_migrations.create(conn, checkfirst=True)
+            _record(conn, migration)
+        done.append(migration.name)
+    return done
+
+
+def baseline(engine: Engine, version: str, sql_dir: str = SQL_DIR) -> List[str]:
+    """Record every migration up to `version` as applied without running it."""
+    marked = []
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        for migration in discover(sql_dir):
+            if migration.version <= version:
+                _record(conn, migration)
+                marked.append(migration.name)
+    return marked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    sub.add_parser("upgrade")
+    sub.add_parser("baseline").add_argument("version")
+    args = parser.parse_args()
+
+    from app.db_utils.db_connection import get_engine
+    engine = get_engine()
+    if args.command == "status":
+        applied = applied_versions(engine) or set()
+        for m in discover():
+            print(f"{'applied' if m.version in applied else 'pending'}  {m.name}")
+    elif args.command == "upgrade":
+        names = upgrade(engine)
+        print("\n".join(f"applied  {n}" for n in names) or "up to date")
+    else:
+        print("\n".join(f"marked   {n}" for n in baseline(engine, args.version)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Compact posting lists for the message search index (app/services/search.py).
+
+A posting is (message_id, conversation_id). A term's postings are stored in blocks of
+ascending message ids; a block is encoded as varints: the message id as a delta from the
+previous one (small numbers, 1-3 bytes), then the conversation id.
+
+PostingCursor walks one term's postings in descending message id order and can skip
+ahead (`seek`) without decoding the blocks it jumps over; `intersect` leapfrogs a set
+of cursors to the ids present in all of them, newest first.
+"""
+
+from bisect import bisect_right
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+Posting = Tuple[int, int]  # (message_id, conversation_id)
+
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def encode_postings(postings: Sequence[Posting]) -> bytes:
+    """Postings in ascending message id order -> bytes."""
+    out = bytearray()
+    prev = 0
+    for message_id, conversation_id in postings:
+        _put_varint(out, message_id - prev)
+        _put_varint(out, conversation_id)
+        prev = message_id
+    return bytes(out)
+
+
+def decode_postings(data: bytes) -> List[Posting]:
+    postings = []
+    values = []
+    n = shift = 0
+    for byte in data:
+        n |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(n)
+        n = shift = 0
+    prev = 0
+    for i in range(0, len(values), 2):
+        prev += values[i]
+        postings.append((prev, values[i + 1]))
+    return postings
+
+
+class PostingCursor:
+    """
+    Descending postings of one term, merged from its stored blocks and a (small) list of
+    postings not yet folded into blocks.
+
+    `fetch_blocks(upto)` returns the next blocks whose first message id is <= upto, as
+    (first_id, data) in descending first_id order (an empty list when there are none).
+    Blocks of a term never overlap, so a block whose first id is above the current target
+    can be skipped without decoding it.
+    """
+
+    def __init__(self, fetch_blocks: Callable[[int], List[Tuple[int, bytes]]], pending: Sequence[Posting],
+                 before_id: int):
+        self._fetch_blocks = fetch_blocks
+        self._pending = sorted(pending)
+        self._pending_pos = len(self._pending) - 1
+        self._queued: List[Tuple[int, bytes]] = []  # fetched blocks, descending first_id
+        self._fetch_upto: Optional[int] = before_id - 1  # None once every block was fetched
+        self._block: List[Posting] = []
+        self._block_pos = -1
+        self.seek(before_id - 1)
+
+    def _block_head(self) -> Optional[Posting]:
+        return self._block[self._block_pos] if self._block_pos >= 0 else None
+
+    def head(self) -> Optional[Posting]:
+        """Largest remaining posting, or None when exhausted."""
+        block = self._block_head()
+        pending = self._pending[self._pending_pos] if self._pending_pos >= 0 else None
+        if block is None or (pending is not None and pending[0] > block[0]):
+            return pending
+        return block
+
+    def seek(self, target: int):
+        """Drop postings with a message id above `target`."""
+        key = (target, float("inf"))
+        self._pending_pos = bisect_right(self._pending, key, 0, self._pending_pos + 1) - 1
+        if self._block_pos >= 0 and self._block[self._block_pos][0] > target:
+            self._block_pos = bisect_right(self._block, key, 0, self._block_pos + 1) - 1
+        while self._block_pos < 0:
+            first_id, data = self._next_block(target)
+            if data is None:
+                return
+            if first_id <= target:
+                self._block = decode_postings(data)
+                self._block_pos = bisect_right(self._block, key) - 1
+
+    def _next_block(self, target: int):
+        if not self._queued:
+            if self._fetch_upto is None:
+                return None, None
+            upto = min(self._fetch_upto, target)
+            self._queued = self._fetch_blocks(upto)
+            if not self._queued:
+                self._fetch_upto = None
+                return None, None
+            self._fetch_upto = self._queued[-1][0] - 1
+        return self._queued.pop(0)
+
+    def advance(self):
+        """Drop the current head."""
+        head = self.head()
+        if head is not None:
+            self.seek(head[0] - 1)
+
+
+def intersect(cursors: Sequence[PostingCursor]) -> Iterator[Posting]:
+    """Postings whose message id is in every cursor, in descending message id order."""
+    if not cursors:
+        return
+    while True:
+        heads = [c.head() for c in cursors]
+        if any(h is None for h in heads):
+            return
+        target = min(h[0] for h in heads)
+        if all(h[0] == target for h in heads):
+            yield heads[0]
+            for c in cursors:
+                c.advance()
+            continue
+        for c, h in zip(cursors, heads):
+            if h[0] > target:
+                c.seek(target)
@@ -0,0 +1,192 @@
+"""
+Read-replica routing.
+
+Replicas are extra db_labels (DB_REPLICAS, see load_db_config). Read-only endpoints take
+their session from get_read_db, which asks choose_read_label for a label:
+
+  - the primary ("main") when no replica is configured or healthy,
+  - the primary when the client wrote recently: any successful non-GET request sets a
+    short-lived cookie (DB_READ_STICKY_SECONDS) so the client reads its own writes,
+  - otherwise a healthy replica, round robin, skipping replicas lagging more than
+    DB_REPLICA_MAX_LAG_SECONDS.
+
+A background monitor checks every replica each DB_REPLICA_CHECK_INTERVAL seconds
+(SELECT 1 plus the replication lag on MySQL); a replica that fails a check, or a
+request's connection attempt, is taken out of rotation until a later check succeeds.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import anyio
+from sqlalchemy.exc import DBAPIError
+
+from app.db_utils.db_connection import get_engine, replica_labels
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "main"
+STICKY_COOKIE = "omni_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def measure_lag(conn) -> Optional[float]:
+    """Replication lag in seconds; None when unknown or not replicating (e.g. two independent local DBs)."""
+    query = os.getenv("DB_REPLICA_LAG_QUERY")  # e.g. a heartbeat table: SELECT NOW() - MAX(ts) FROM heartbeat
+    if query:
+        value = conn.exec_driver_sql(query).scalar()
+        return float(value) if value is not None else None
+    if conn.dialect.name != "mysql":
+        return None
+    for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                              ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+        try:
+            row = conn.exec_driver_sql(statement).mappings().first()
+        except DBAPIError:
+            continue  # older server syntax, or no REPLICATION CLIENT privilege
+        if row is None:
+            return None
+        value = row.get(column)
+        return float(value) if value is not None else float("inf")  # NULL: replication is stopped
+    return None
+
+
+class ReplicaMonitor:
+    def __init__(self, labels: List[str], max_lag: Optional[float] = None, interval: float = 5.0):
+        self.labels = list(labels)
+        self.max_lag = max_lag
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state: Dict[str, dict] = {label: {"healthy": False, "lag": None, "error": "not checked yet",
+                                                "checked_at": None} for label in self.labels}
+        self._round_robin = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def check(self, label: str) -> bool:
+        try:
+            with get_engine(label).connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+                lag = measure_lag(conn)
+        except Exception as e:
+            self.mark_down(label, e)
+            return False
+        with self._lock:
+            if not self._state[label]["healthy"]:
+                logger.info("replica %s is back in rotation", label)
+            self._state[label].update(healthy=True, lag=lag, error=None, checked_at=time.time())
+        return True
+
+    def check_all(self):
+        for label in self.labels:
+            self.check(label)
+
+    def mark_down(self, label: str, error: Exception):
+        with self._lock:
+            if self._state[label]["healthy"]:
+                logger.warning("replica %s out of rotation: %s", label, error)
+            self._state[label].update(healthy=False, error=str(error), checked_at=time.time())
+
+    def pick(self) -> Optional[str]:
+        """Next healthy replica within the lag limit, or None."""
+        with self._lock:
+            candidates = [label for label in self.labels
+                          if self._state[label]["healthy"] and
+                          (self.max_lag is None or self._state[label]["lag"] is None or
+                           self._state[label]["lag"] <= self.max_lag)]
+            if not candidates:
+                return None
+            return candidates[next(self._round_robin) % len(candidates)]
+
+    def describe(self) -> List[dict]:
+        with self._lock:
+            return [{"db_label": label, **state} for label, state in self._state.items()]
+
+    async def _loop(self):
+        limiter = anyio.CapacityLimiter(1)  # health checks never take a request thread
+        while True:
+            await asyncio.sleep(self.interval)
+            await anyio.to_thread.run_sync(self.check_all, limiter=limiter)
+
+    async def start(self):
+        if not self.labels:
+            return
+        await anyio.to_thread.run_sync(self.check_all, limiter=anyio.CapacityLimiter(1))
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _sticky_seconds() -> float:
+    return float(os.getenv("DB_READ_STICKY_SECONDS", "5"))
+
+
+_monitor: Optional[ReplicaMonitor] = None
+
+
+def get_replica_monitor() -> ReplicaMonitor:
+    global _monitor
+    if _monitor is None:
+        max_lag = os.getenv("DB_REPLICA_MAX_LAG_SECONDS")
+        _monitor = ReplicaMonitor(replica_labels(), max_lag=float(max_lag) if max_lag else None,
+                                  interval=float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5")))
+    return _monitor
+
+
+async def start_replica_monitor():
+    global _monitor
+    _monitor = None  # pick up the current configuration
+    await get_replica_monitor().start()
+
+
+async def stop_replica_monitor():
+    global _monitor
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
+
+
+def choose_read_label(cookies: Dict[str, str]) -> str:
+    monitor = get_replica_monitor()
+    if not monitor.labels:
+        return PRIMARY
+    try:
+        if float(cookies.get(STICKY_COOKIE, 0)) > time.time():
+            return PRIMARY  # read-your-writes window after this client's last write
+    except ValueError:
+        pass
+    return monitor.pick() or PRIMARY
+
+
+class ReadYourWritesMiddleware:
+    """Marks clients that just wrote (successful non-GET request) so their reads go to the primary."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            return await self.app(scope, receive, send)
+        sticky = _sticky_seconds()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400 and sticky > 0 \
+                    and get_replica_monitor().labels:
+                cookie = (f"{STICKY_COOKIE}={time.time() + sticky:.3f}; Max-Age={int(sticky) or 1}; Path=/; "
+                          f"HttpOnly; SameSite=Lax")
+                message = {**message, "headers": list(message.get("headers", [])) +
+                           [(b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
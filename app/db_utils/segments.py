@@ -0,0 +1,252 @@
+"""
+Append-only segment files for archived messages.
+
+A segment is a pair of files in the archive directory:
+
+    segment-000001.seg   compressed blocks (zlib'd JSON arrays of message rows), back to back
+    segment-000001.idx   one fixed-size record per block, in write order:
+                         conversation_id, offset, length, crc32, first_id, last_id, count
+
+A record with length 0 is a tombstone: blocks of that conversation written before it
+(in any earlier segment) are no longer part of the archive (the messages were restored).
+Files are only ever appended to; a new segment starts once the current one reaches
+`segment_bytes`. Readers keep the index in memory, pick up records appended by other
+processes incrementally, and read blocks through a memory map of the segment file.
+
+One writer at a time (an exclusive lock file); any number of readers.
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows; the archiver runs in the Linux container
+    fcntl = None
+
+RECORD = struct.Struct("<QQIIQQI")
+SEGMENT_RE = re.compile(r"^segment-(\d{6})\.seg$")
+
+# column order of a stored message row
+ROW_FIELDS = ("id", "sender", "content", "channel_id", "channel_message_id", "created_at")
+
+
+class SegmentCorrupted(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class BlockRef:
+    segment: int
+    offset: int
+    length: int
+    crc: int
+    first_id: int
+    last_id: int
+    count: int
+
+
+def _seg_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"segment-{segment:06d}.seg")
+
+
+def _idx_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"segment-{segment:06d}.idx")
+
+
+class SegmentStore:
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, cache_blocks: int = 256):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.cache_blocks = cache_blocks
+        self._lock = threading.Lock()
+        self._blocks: Dict[int, List[BlockRef]] = {}  # conversation_id -> live blocks in write order
+        self._idx_read: Dict[int, int] = {}  # segment -> bytes of its .idx already loaded
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._cache: OrderedDict = OrderedDict()  # BlockRef -> decoded rows
+        os.makedirs(directory, exist_ok=True)
+
+    # -- index ---------------------------------------------------------------
+    def _segments(self) -> List[int]:
+        return sorted(int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(self.directory)) if m)
+
+    def refresh(self):
+        """Load index records appended since the last refresh (by this or another process)."""
+        with self._lock:
+            for segment in self._segments():
+                path = _idx_path(self.directory, segment)
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    continue
+                done = self._idx_read.get(segment, 0)
+                size -= (size - done) % RECORD.size  # a record still being written
+                if size <= done:
+                    continue
+                with open(path, "rb") as f:
+                    f.seek(done)
+                    data = f.read(size - done)
+                for fields in RECORD.iter_unpack(data):
+                    self._apply(segment, *fields)
+                self._idx_read[segment] = size
+
+    def _apply(self, segment, conversation_id, offset, length, crc, first_id, last_id, count):
+        if length == 0:
+            self._blocks.pop(conversation_id, None)
+        else:
+            self._blocks.setdefault(conversation_id, []).append(
+                BlockRef(segment, offset, length, crc, first_id, last_id, count))
+
+    def blocks(self, conversation_id: int) -> List[BlockRef]:
+        with self._lock:
+            return list(self._blocks.get(conversation_id, ()))
+
+    def conversations(self) -> List[int]:
+        with self._lock:
+            return sorted(self._blocks)
+
+    def describe(self) -> dict:
+        with self._lock:
+            blocks = [b for refs in self._blocks.values() for b in refs]
+        segments = self._segments()
+        return {
+            "directory": self.directory,
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(_seg_path(self.directory, s)) for s in segments),
+            "conversations": len(self._blocks),
+            "blocks": len(blocks),
+            "messages": sum(b.count for b in blocks),
+        }
+
+    # -- reading -------------------------------------------------------------
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        m = self._maps.get(segment)
+        if m is None or len(m) < end:
+            # the segment grew since it was mapped
+            if m is not None:
+                m.close()
+            with open(_seg_path(self.directory, segment), "rb") as f:
+                m = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def read_block(self, ref: BlockRef) -> List[dict]:
+        with self._lock:
+            rows = self._cache.get(ref)
+            if rows is not None:
+                self._cache.move_to_end(ref)
+                return rows
+            data = self._map(ref.segment, ref.offset + ref.length)[ref.offset:ref.offset + ref.length]
+        if zlib.crc32(data) != ref.crc:
+            raise SegmentCorrupted(f"segment {ref.segment} offset {ref.offset}: checksum mismatch")
+        rows = [dict(zip(ROW_FIELDS, values)) for values in json.loads(zlib.decompress(data))]
+        with self._lock:
+            self._cache[ref] = rows
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        return rows
+
+    def read(self, conversation_id: int, after_id: Optional[int] = None, before_id: Optional[int] = None,
+             limit: Optional[int] = None, descending: bool = False) -> List[dict]:
+        """
+        Archived rows of a conversation in id order, restricted to (after_id, before_id). With `limit`,
+        only blocks that can hold the first `limit` ids in the scan direction are decompressed.
+        """
+        refs = [ref for ref in self.blocks(conversation_id)
+                if (after_id is None or ref.last_id > after_id) and (before_id is None or ref.first_id < before_id)]
+        refs.sort(key=lambda ref: -ref.last_id if descending else ref.first_id)
+        rows = {}
+        for ref in refs:
+            if limit is not None and len(rows) >= limit:
+                boundary = sorted(rows, reverse=descending)[limit - 1]
+                if (ref.last_id < boundary) if descending else (ref.first_id > boundary):
+                    break
+            for row in self.read_block(ref):
+                if (after_id is None or row["id"] > after_id) and (before_id is None or row["id"] < before_id):
+                    rows[row["id"]] = row
+        ids = sorted(rows, reverse=descending)
+        if limit is not None:
+            ids = ids[:limit]
+        return [rows[i] for i in sorted(ids)]
+
+    def close(self):
+        with self._lock:
+            for m in self._maps.values():
+                m.close()
+            self._maps.clear()
+            self._cache.clear()
+
+    # -- writing -------------------------------------------------------------
+    def writer(self) -> "SegmentWriter":
+        return SegmentWriter(self)
+
+
+class SegmentWriter:
+    """Appends blocks and tombstones; holds the archive's writer lock while open."""
+
+    def __init__(self, store: SegmentStore):
+        self.store = store
+        self._lock_file = None
+        self._seg = self._idx = None
+        self.segment = 0
+
+    def __enter__(self):
+        self._lock_file = open(os.path.join(self.store.directory, "writer.lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        segments = self.store._segments()
+        self._open(segments[-1] if segments else 1)
+        return self
+
+    def __exit__(self, *exc):
+        self._close_files()
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the flock
+            self._lock_file = None
+        self.store.refresh()
+
+    def _open(self, segment: int):
+        self._close_files()
+        self.segment = segment
+        self._seg = open(_seg_path(self.store.directory, segment), "ab")
+        self._idx = open(_idx_path(self.store.directory, segment), "ab")
+        # drop a torn tail left by a crash, so offsets and records stay aligned
+        idx_size = self._idx.tell()
+        if idx_size % RECORD.size:
+            self._idx.truncate(idx_size - idx_size % RECORD.size)
+
+    def _close_files(self):
+        for f in (self._seg, self._idx):
+            if f is not None:
+                f.close()
+        self._seg = self._idx = None
+
+    def append(self, conversation_id: int, rows: Sequence[dict]) -> BlockRef:
+        """Write one block of rows (ascending ids) for a conversation."""
+        data = zlib.compress(json.dumps([[row[f] for f in ROW_FIELDS] for row in rows],
+                                        separators=(",", ":"), default=str).encode(), 6)
+        if self._seg.tell() and self._seg.tell() + len(data) > self.store.segment_bytes:
+            self._open(self.segment + 1)
+        offset = self._seg.tell()
+        self._seg.write(data)
+        self._seg.flush()  # readers must never see an index record before its block
+        ref = BlockRef(self.segment, offset, len(data), zlib.crc32(data), rows[0]["id"], rows[-1]["id"], len(rows))
+        self._idx.write(RECORD.pack(conversation_id, ref.offset, ref.length, ref.crc, ref.first_id, ref.last_id,
+                                    ref.count))
+        return ref
+
+    def tombstone(self, conversation_id: int):
+        self._idx.write(RECORD.pack(conversation_id, 0, 0, 0, 0, 0, 0))
+
+    def sync(self):
+        """Make everything appended so far durable (before the rows are deleted from the database)."""
+        for f in (self._seg, self._idx):
+            f.flush()
+            os.fsync(f.fileno())
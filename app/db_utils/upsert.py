@@ -0,0 +1,70 @@
+"""
+Dialect-aware INSERT helpers used by the get-or-create paths.
+MySQL gets INSERT ... ON DUPLICATE KEY UPDATE, SQLite (local stand-in) gets INSERT ... ON CONFLICT.
+"""
+
+from typing import Sequence
+import sqlalchemy
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import mysql, sqlite
+
+
+def insert_ignore(db: Session, table: sqlalchemy.Table, values: dict, pk: str = "id"):
+    """Insert a row unless its key already exists (race-safe, no error on duplicates)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update({pk: stmt.inserted[pk]})
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).values(**values).on_conflict_do_nothing()
+    else:
+        exists = db.execute(sqlalchemy.select(table.c[pk]).where(table.c[pk] == values[pk])).first()
+        if exists:
+            return
+        stmt = sqlalchemy.insert(table).values(**values)
+    db.execute(stmt)
+
+
+def insert_ignore_many(db: Session, table: sqlalchemy.Table, rows: Sequence[dict], pk: str = "id"):
+    """Multi-row INSERT skipping rows whose unique key already exists (single statement on MySQL/SQLite)."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(list(rows))
+        stmt = stmt.on_duplicate_key_update({pk: table.c[pk]})
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).values(list(rows)).on_conflict_do_nothing()
+    else:
+        for values in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(sqlalchemy.insert(table).values(**values))
+            except sqlalchemy.exc.IntegrityError:
+                pass
+        return
+    db.execute(stmt)
+
+
+def upsert_returning_id(db: Session, table: sqlalchemy.Table, values: dict, keys: Sequence[str]) -> int:
+    """
+    Insert a row or find the existing one by its unique `keys`, in a single statement.
+    Returns the row id either way.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        # LAST_INSERT_ID(id) makes lastrowid report the existing row on duplicates
+        stmt = mysql.insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update(id=sqlalchemy.func.last_insert_id(table.c.id))
+        return db.execute(stmt).lastrowid
+    if dialect == "sqlite":
+        stmt = sqlite.insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=list(keys),
+                                          set_={keys[0]: stmt.excluded[keys[0]]})
+        return db.execute(stmt.returning(table.c.id)).scalar_one()
+
+    where = [table.c[k] == values[k] for k in keys]
+    row_id = db.execute(sqlalchemy.select(table.c.id).where(*where)).scalar()
+    if row_id is None:
+        row_id = db.execute(sqlalchemy.insert(table).values(**values)).inserted_primary_key[0]
+    return row_id
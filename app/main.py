@@ -1,11 +1,101 @@
-from fastapi import FastAPI
-from app.routers.webhooks import router as webhooks_router
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.db_utils.db_connection import init_engines, dispose_engines
+from app.db_utils.async_db import init_async_engines, dispose_async_engines
+from app.db_utils.instrumentation import instrumentation_enabled
+from app.db_utils.replicas import ReadYourWritesMiddleware, start_replica_monitor, stop_replica_monitor
+from app.routers.async_routes import router as async_router
+from app.routers.webhooks import coalesced_router, router as webhooks_router
 from app.routers.conversations import router as conversations_router
 from app.routers.users import router as users_router
+from app.routers.companies import router as companies_router
+from app.routers.system import router as system_router
+from app.routers.metrics import router as metrics_router
+from app.routers.health import router as health_router
+from app.services.admission import AdmissionMiddleware, admission_enabled
+from app.services.archive import ArchiveUnavailable, start_archiver, stop_archiver
+from app.services.events import get_broker
+from app.services.leader import release_leadership
+from app.services.metrics import MetricsMiddleware
+from app.services.search import start_search_merger, stop_search_merger
+from app.services.warmup import start_warm_up, stop_warm_up
+from app.services.reply_queue import ReplyQueueFull, start_reply_workers, stop_reply_workers
+from app.services.write_coalescer import start_write_coalescer, stop_write_coalescer, write_coalesce_enabled
 
 
-app = FastAPI(title="omniAI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines/pools are process-wide: build once, dispose on shutdown
+    init_engines()
+    if app.state.async_mode:
+        init_async_engines()
+    await start_replica_monitor()
+    # before the reply workers and the coalescer, so it rehearses the inline write path
+    await start_warm_up(app.state.async_mode)
+    await get_broker().start()
+    await start_reply_workers()
+    await start_write_coalescer()
+    await start_archiver()
+    await start_search_merger()
+    yield
+    await stop_warm_up()
+    await stop_search_merger()
+    await stop_archiver()
+    release_leadership()  # another worker picks the jobs up while this one drains
+    # before the reply workers: a flushed batch may still enqueue AI reply jobs
+    await stop_write_coalescer()
+    await stop_reply_workers()
+    # ends open event streams, so the server does not wait on them to shut down
+    await get_broker().stop()
+    await stop_replica_monitor()
+    if app.state.async_mode:
+        await dispose_async_engines()
+    dispose_engines()
 
-app.include_router(webhooks_router)
-app.include_router(conversations_router)
-app.include_router(users_router)
+
+async def reply_queue_full_handler(request: Request, exc: ReplyQueueFull):
+    # backpressure: ask the provider to redeliver later (the retry is deduplicated)
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+async def archive_unavailable_handler(request: Request, exc: ArchiveUnavailable):
+    # the history would be missing its archived part: fail rather than answer with a partial one
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+def create_app(async_mode: Optional[bool] = None) -> FastAPI:
+    """DB_ASYNC=1 serves the request-path endpoints with AsyncSession instead of the threadpool."""
+    if async_mode is None:
+        async_mode = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+    app = FastAPI(title="omniAI", lifespan=lifespan)
+    app.state.async_mode = async_mode
+    app.add_exception_handler(ReplyQueueFull, reply_queue_full_handler)
+    app.add_exception_handler(ArchiveUnavailable, archive_unavailable_handler)
+    app.add_middleware(ReadYourWritesMiddleware)
+    if admission_enabled():
+        # inside the metrics middleware, so rejected requests are counted too
+        app.add_middleware(AdmissionMiddleware)
+    if instrumentation_enabled():
+        app.add_middleware(MetricsMiddleware)
+
+    if write_coalesce_enabled():
+        app.include_router(coalesced_router)
+    if async_mode:
+        # registered first so it shadows the sync handlers of the same paths
+        app.include_router(async_router)
+    app.include_router(webhooks_router)
+    app.include_router(conversations_router)
+    app.include_router(users_router)
+    app.include_router(companies_router)
+    app.include_router(system_router)
+    app.include_router(metrics_router)
+    app.include_router(health_router)
+    return app
+
+
+app = create_app()
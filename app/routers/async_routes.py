@@ -0,0 +1,119 @@
+# app/routers/async_routes.py
+"""
+Async (AsyncSession) variants of the request-path endpoints, enabled with DB_ASYNC=1.
+Included ahead of the sync routers, so they take over the same paths; every other
+endpoint keeps being served by the sync routers.
+"""
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_utils.deps import get_async_db, get_async_read_db
+from app.dao.conversation import DAOConversation
+from app.dao.users import DAOUser
+from app.schemas.conversations import ConversationOut, AgentMessageIn, InboxConversationOut
+from app.schemas.inbound import InboundMessageIn, InboundBatchIn, InboundBatchOut
+from app.schemas.messages import MessageOut
+from app.schemas.users import UserOut
+from app.routers.webhooks import batch_response, parse_batch
+from app.services import conversation_async as svc
+from app.services.messages import page_headers
+from app.services.serialization import JSONBytesResponse
+
+router = APIRouter()
+
+
+async def _conversation_or_404(db: AsyncSession, conversation_id: int) -> DAOConversation:
+    conv = await db.get(DAOConversation, conversation_id)
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conv
+
+
+@router.post("/webhooks/inbound", response_model=ConversationOut, status_code=status.HTTP_201_CREATED,
+             tags=["webhooks"])
+async def inbound_webhook(payload: InboundMessageIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    result = await svc.process_inbound_message(db, company_id=payload.company_id, channel_id=payload.channel_id,
+                                               phone=payload.from_, text=payload.text,
+                                               channel_message_id=payload.channel_message_id)
+    conv = result.conversation
+    if result.duplicate:
+        response.status_code = status.HTTP_200_OK
+    return ConversationOut(id=conv.id, company_id=conv.company_id, channel_id=conv.channel_id,
+                           contact_id=conv.contact_id, owner_id=conv.owner_id, status=conv.status)
+
+
+@router.post("/webhooks/inbound/batch", response_model=InboundBatchOut, tags=["webhooks"])
+async def inbound_webhook_batch(payload: InboundBatchIn, db: AsyncSession = Depends(get_async_db)):
+    indexes, items, results = parse_batch(payload)
+    if items:
+        for i, result in zip(indexes, await svc.process_inbound_batch(db, items)):
+            results[i] = result
+    return batch_response(results)
+
+
+@router.get("/conversations/{conversation_id}", response_model=ConversationOut, tags=["conversations"])
+async def get_conversation(conversation_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    conv = await svc.get_conversation_row(db, conversation_id)
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return JSONBytesResponse(conv)
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=List[MessageOut], tags=["conversations"])
+async def list_conversation_messages(conversation_id: int,
+                                     after_id: Optional[int] = Query(None, ge=0),
+                                     before_id: Optional[int] = Query(None, ge=1),
+                                     limit: int = Query(100, ge=1, le=1000),
+                                     db: AsyncSession = Depends(get_async_read_db)):
+    if not await svc.conversation_exists(db, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    rows, has_more = await svc.list_messages_page(db, conversation_id, after_id=after_id, before_id=before_id,
+                                                  limit=limit)
+    return JSONBytesResponse(rows, headers=page_headers(rows, has_more, after_id, before_id))
+
+
+@router.post("/conversations/{conversation_id}/messages", response_model=MessageOut,
+             status_code=status.HTTP_201_CREATED, tags=["conversations"])
+async def agent_send_message(conversation_id: int, payload: AgentMessageIn, db: AsyncSession = Depends(get_async_db)):
+    conv = await _conversation_or_404(db, conversation_id)
+    user = (await db.execute(sqlalchemy.select(DAOUser.id)
+                             .where(DAOUser.id == payload.author_id, DAOUser.company_id == conv.company_id))).first()
+    if not user:
+        raise HTTPException(status_code=400, detail="Author (agent) not found for this company")
+
+    msg = await svc.add_message(db, conversation_id=conversation_id, sender="agent", content=payload.text)
+    return {"id": msg.id, "conversation_id": msg.conversation_id, "sender": msg.sender, "content": msg.content}
+
+
+@router.post("/conversations/{conversation_id}/transfer-toggle", tags=["conversations"])
+async def transfer_toggle(conversation_id: int, db: AsyncSession = Depends(get_async_db)):
+    conv = await _conversation_or_404(db, conversation_id)
+    new_role = await svc.toggle_conversation_owner(db, conv)
+    return {"detail": f"switched ownership to {new_role}"}
+
+
+@router.post("/conversations/{conversation_id}/close", response_model=ConversationOut, tags=["conversations"])
+async def close_conversation(conversation_id: int, db: AsyncSession = Depends(get_async_db)):
+    conv = await _conversation_or_404(db, conversation_id)
+    await svc.close_conversation(db, conv)
+    return conv
+
+
+@router.get("/companies/{company_id}/conversations", response_model=List[InboxConversationOut],
+            tags=["companies"])
+async def list_company_conversations(company_id: int,
+                                     status: Literal["open", "closed"] = "open",
+                                     before_message_id: Optional[int] = Query(None, ge=1),
+                                     limit: int = Query(50, ge=1, le=500),
+                                     db: AsyncSession = Depends(get_async_db)):
+    rows, has_more = await svc.list_inbox_page(db, company_id, status=status, before_message_id=before_message_id,
+                                               limit=limit)
+    headers = {"X-Next-Before-Message-Id": str(rows[-1]["last_message_id"])} if has_more and rows else None
+    return JSONBytesResponse(rows, headers=headers)
+
+
+@router.get("/companies/{company_id}/users", response_model=List[UserOut])
+async def list_company_users(company_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    return JSONBytesResponse(await svc.get_company_users(db, company_id))
@@ -0,0 +1,51 @@
+# app/routers/companies.py
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.db_utils.deps import get_db, get_read_db
+from app.schemas.conversations import InboxConversationOut
+from app.schemas.messages import MessageOut
+from app.services.events import company_topic, sse_stream
+from app.services.inbox import list_inbox_page
+from app.services.search import search_messages
+from app.services.serialization import JSONBytesResponse
+
+router = APIRouter(prefix="/companies", tags=["companies"])
+
+@router.get("/{company_id}/conversations", response_model=List[InboxConversationOut])
+def list_company_conversations(company_id: int,
+                               status: Literal["open", "closed"] = "open",
+                               before_message_id: Optional[int] = Query(None, ge=1),
+                               limit: int = Query(50, ge=1, le=500),
+                               db: Session = Depends(get_db)):
+    """
+    Company inbox, most recent activity first. The cursor for the next page
+    comes back in the X-Next-Before-Message-Id header.
+    """
+    rows, has_more = list_inbox_page(db, company_id, status=status, before_message_id=before_message_id, limit=limit)
+    headers = {"X-Next-Before-Message-Id": str(rows[-1]["last_message_id"])} if has_more and rows else None
+    return JSONBytesResponse(rows, headers=headers)
+
+@router.get("/{company_id}/search", response_model=List[MessageOut])
+def search_company_messages(company_id: int, q: str = Query(..., min_length=1, max_length=500),
+                            before_id: Optional[int] = Query(None, ge=1),
+                            limit: int = Query(20, ge=1, le=200),
+                            db: Session = Depends(get_read_db)):
+    """
+    Messages of the company containing every word of `q` (case and accent insensitive), newest
+    first. The cursor for the next page comes back in the X-Next-Before-Id header.
+    """
+    rows, next_before_id = search_messages(db, company_id, q, before_id=before_id, limit=limit)
+    headers = {"X-Next-Before-Id": str(next_before_id)} if next_before_id else None
+    return JSONBytesResponse(rows, headers=headers)
+
+@router.get("/{company_id}/events")
+async def company_events(company_id: int, last_event_id: Optional[str] = Query(None),
+                         last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """
+    Server-Sent Events for every conversation of the company (new messages, ownership changes,
+    closes). Reconnect with Last-Event-ID (or ?last_event_id=) to receive what was missed.
+    """
+    return StreamingResponse(sse_stream([company_topic(company_id)], last_event_id_header or last_event_id),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
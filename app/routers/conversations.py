@@ -1,38 +1,69 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.db_utils.deps import get_db
+from app.db_utils.deps import get_db, get_read_db
 from app.dao.conversation import DAOConversation
 from app.dao.users import DAOUser
-from app.dao.message import DAOMessage
 from app.schemas.conversations import ConversationOut, AgentMessageIn
 from app.schemas.messages import MessageOut
-from app.services.conversation import add_message, toggle_conversation_owner
+from app.services.archive import check_archive
+from app.services.conversation import add_message, close_conversation, toggle_conversation_owner
+from app.services.events import conversation_topic, sse_stream
+from app.services.messages import list_messages_page, page_headers, stream_messages_ndjson_pooled
+from app.services.projections import conversation_exists, get_conversation_row
+from app.services.serialization import JSONBytesResponse
 
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
 @router.get("/{conversation_id}", response_model=ConversationOut)
-def get_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    conv = db.query(DAOConversation).filter(DAOConversation.id == conversation_id).first()
+def get_conversation(conversation_id: int, db: Session = Depends(get_read_db)):
+    conv = get_conversation_row(db, conversation_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return conv
+    return JSONBytesResponse(conv)
 
 
 @router.get("/{conversation_id}/messages", response_model=List[MessageOut])
-def list_conversation_messages(conversation_id: int, db: Session = Depends(get_db)):
-    conv = db.query(DAOConversation).filter(DAOConversation.id == conversation_id).first()
-    if not conv:
+def list_conversation_messages(conversation_id: int,
+                               after_id: Optional[int] = Query(None, ge=0),
+                               before_id: Optional[int] = Query(None, ge=1),
+                               limit: int = Query(100, ge=1, le=1000),
+                               db: Session = Depends(get_read_db)):
+    """
+    Keyset-paginated history (ascending ids within a page). Without a cursor the page is the newest
+    `limit` messages. Next page cursors come back in headers: X-Next-Before-Id (scrolling back,
+    no cursor or before_id) or X-Next-After-Id (scrolling forward with after_id; after_id=0 starts
+    from the oldest). Rows are encoded straight to JSON, without per-row response_model validation.
+    """
+    if not conversation_exists(db, conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    rows = (db.query(DAOMessage)
-              .filter(DAOMessage.conversation_id == conversation_id)
-              .order_by(DAOMessage.id.asc())
-              .all())
+    rows, has_more = list_messages_page(db, conversation_id, after_id=after_id, before_id=before_id, limit=limit)
     # returning extra info in response for easier use of endpoints
-    return [{"id": m.id, "conversation_id": m.conversation_id, "sender": m.sender, "content": m.content}
-            for m in rows]
+    return JSONBytesResponse(rows, headers=page_headers(rows, has_more, after_id, before_id))
+
+@router.get("/{conversation_id}/messages/export")
+def export_conversation_messages(conversation_id: int, db: Session = Depends(get_db)):
+    """Whole history streamed as NDJSON (one MessageOut per line). The session is released before the stream starts."""
+    if not conversation_exists(db, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    check_archive(db, conversation_id)  # fail with 503 now rather than cut the stream short
+    return StreamingResponse(stream_messages_ndjson_pooled(conversation_id), media_type="application/x-ndjson")
+
+@router.get("/{conversation_id}/events")
+def conversation_events(conversation_id: int, last_event_id: Optional[str] = Query(None),
+                        last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+                        db: Session = Depends(get_db)):
+    """
+    Server-Sent Events for one conversation. The session is released before the stream starts;
+    reconnect with Last-Event-ID (or ?last_event_id=) to receive what was missed.
+    """
+    if not conversation_exists(db, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return StreamingResponse(sse_stream([conversation_topic(conversation_id)], last_event_id_header or last_event_id),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @router.post("/{conversation_id}/messages", response_model=MessageOut, status_code=status.HTTP_201_CREATED)
 def agent_send_message(conversation_id: int, payload: AgentMessageIn, db: Session = Depends(get_db)):
@@ -61,3 +92,12 @@ def transfer_toggle(conversation_id: int, db: Session = Depends(get_db)):
 
     new_role = toggle_conversation_owner(db, conv)
     return {"detail": f"switched ownership to {new_role}"}
+
+@router.post("/{conversation_id}/close", response_model=ConversationOut)
+def close(conversation_id: int, db: Session = Depends(get_db)):
+    """Close the conversation; the contact's next inbound message starts a new one."""
+    conv = db.get(DAOConversation, conversation_id)
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    close_conversation(db, conv)
+    return conv
@@ -0,0 +1,18 @@
+# app/routers/health.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.warmup import readiness
+
+router = APIRouter(tags=["health"])
+
+@router.get("/healthz")
+async def liveness():
+    """Liveness: the process serves requests. No DB access, so a database outage does not restart it."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readiness_probe():
+    """Readiness: 503 until the startup warm-up has finished, and again once shutdown has begun."""
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
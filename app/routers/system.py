@@ -0,0 +1,62 @@
+# app/routers/system.py
+from fastapi import APIRouter, Request
+from app.db_utils.db_connection import load_db_config, pool_stats
+from app.db_utils.async_db import async_pool_stats
+from app.db_utils.deps import db_slot_stats
+from app.db_utils.replicas import get_replica_monitor
+from app.services.admission import admission_enabled, get_admission_controller
+from app.services.archive import get_archive_store
+from app.services.events import get_broker
+from app.services.tenant_cache import get_tenant_cache
+from app.services.reply_queue import get_reply_workers
+from app.services.write_coalescer import get_write_coalescer
+
+router = APIRouter(prefix="/system", tags=["system"])
+
+@router.get("/db/pool")
+def db_pool_stats(request: Request):
+    """Connection pool usage per db_label (checked-out, overflow, checkout wait time)."""
+    stats = [pool_stats(db_label) for db_label in load_db_config()]
+    if request.app.state.async_mode:
+        stats += [async_pool_stats(db_label) for db_label in load_db_config()]
+    return stats
+
+@router.get("/db/replicas")
+def db_replica_stats():
+    """Read replicas: in rotation or not, last measured lag and last error."""
+    return get_replica_monitor().describe()
+
+@router.get("/cache/tenants")
+def tenant_cache_stats():
+    """Hit/miss counters of the tenant metadata cache."""
+    return get_tenant_cache().stats()
+
+@router.get("/reply-queue")
+def reply_queue_stats():
+    """AI reply workers: backlog depth and job outcomes (mode "inline" when no workers run)."""
+    workers = get_reply_workers()
+    return workers.describe() if workers else {"mode": "inline"}
+
+@router.get("/write-coalescer")
+def write_coalescer_stats():
+    """Group commit of inbound deliveries: batches flushed, their size and commit time (off unless WRITE_COALESCE=1)."""
+    coalescer = get_write_coalescer()
+    return coalescer.describe() if coalescer else {"enabled": False}
+
+@router.get("/events")
+def events_stats():
+    """Event broker: open subscriptions, published/delivered events and lagged subscribers."""
+    return get_broker().describe()
+
+@router.get("/archive")
+def archive_stats():
+    """Cold-message archive: segment files, bytes on disk and archived conversations/messages."""
+    store = get_archive_store()
+    store.refresh()
+    return store.describe()
+
+@router.get("/admission")
+async def admission_stats():
+    """Per-company admission counters and limits, and how the pool slots are shared between tenants."""
+    stats = get_admission_controller().describe() if admission_enabled() else {}
+    return {"enabled": admission_enabled(), **stats, "pool_slots": db_slot_stats()}
@@ -2,12 +2,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-from app.db_utils.deps import get_db
-from app.dao.users import DAOUser
+from app.db_utils.deps import get_read_db
+from app.schemas.users import UserOut
+from app.services.projections import get_company_users
+from app.services.serialization import JSONBytesResponse
 
 router = APIRouter()
 
-@router.get("/companies/{company_id}/users")
-def list_company_users(company_id: int, db: Session = Depends(get_db)):
-    users = db.query(DAOUser).filter(DAOUser.company_id == company_id).order_by(DAOUser.id.asc()).all()
-    return [{"id": u.id, "name": u.name, "role": u.role} for u in users]
+@router.get("/companies/{company_id}/users", response_model=List[UserOut])
+def list_company_users(company_id: int, db: Session = Depends(get_read_db)):
+    return JSONBytesResponse(get_company_users(db, company_id))
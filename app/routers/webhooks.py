@@ -1,50 +1,87 @@
 # app/routers/webhooks.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 from app.db_utils.deps import get_db
-from app.schemas.inbound import InboundMessageIn
+from app.schemas.inbound import InboundMessageIn, InboundBatchIn, InboundBatchItemOut, InboundBatchOut
 from app.schemas.conversations import ConversationOut
-from app.services.conversation import (
-    get_or_create_company,
-    get_or_create_channel,
-    get_or_create_contact_by_phone,
-    get_or_create_ai_user,
-    find_open_conversation,
-    create_conversation,
-    add_message,
-    add_ai_autoreply,  # <-- mock reply
-)
+from app.services.inbound import BatchItemResult, InboundItem, process_inbound_message, process_inbound_batch
+from app.services.write_coalescer import get_write_coalescer
 
 router = APIRouter()
+# WRITE_COALESCE=1: included ahead of the other routers so it takes over POST /webhooks/inbound
+coalesced_router = APIRouter()
 
 @router.post("/webhooks/inbound", response_model=ConversationOut, status_code=status.HTTP_201_CREATED)
-def inbound_webhook(payload: InboundMessageIn, db: Session = Depends(get_db)):
-    # 1) ensure company/channel/contact exist
-    company = get_or_create_company(db, payload.company_id)
-    channel = get_or_create_channel(db, company_id=company.id, channel_id=payload.channel_id)
-    contact = get_or_create_contact_by_phone(db, company_id=company.id, phone=payload.from_)
+def inbound_webhook(payload: InboundMessageIn, response: Response, db: Session = Depends(get_db)):
+    # company/channel/contact/AI owner/conversation/messages in one transaction
+    result = process_inbound_message(db, company_id=payload.company_id, channel_id=payload.channel_id,
+                                     phone=payload.from_, text=payload.text,
+                                     channel_message_id=payload.channel_message_id)
+    conv = result.conversation
+    if result.duplicate:
+        # provider retry of a delivery we already stored: nothing new was created
+        response.status_code = status.HTTP_200_OK
 
-    # 2) ensure an AI-bot owner exists (role="ai")
-    ai_user = get_or_create_ai_user(db, company_id=company.id)
-
-    # 3) find existing conversation or create a new one
-    conv = find_open_conversation(db, company_id=company.id, channel_id=channel.id, contact_id=contact.id)
-    if not conv:
-        conv = create_conversation(db, company_id=company.id, channel_id=channel.id, contact_id=contact.id, owner_id=ai_user.id)
-
-    # 4) add inbound message (from contact)
-    add_message(db, conversation_id=conv.id, sender="contact", content=payload.text)
-
-    # 5) mock AI auto-reply (no network calls, always succeeds)
-    if conv.owner_id == ai_user.id:
-        add_ai_autoreply(db, conversation=conv, inbound_text=payload.text)
-
-    # 6) return conversation summary
+    # return conversation summary
     return ConversationOut(
         id=conv.id,
         company_id=conv.company_id,
         channel_id=conv.channel_id,
         contact_id=conv.contact_id,
         owner_id=conv.owner_id,
+        status=conv.status,
     )
+
+
+def parse_batch(payload: InboundBatchIn) -> Tuple[List[int], List[InboundItem], List[BatchItemResult]]:
+    """Validate each batch item on its own; returns (indexes, items) of the valid ones and per-index results."""
+    indexes, items = [], []
+    results: List[BatchItemResult] = [None] * len(payload.messages)
+    for i, raw in enumerate(payload.messages):
+        try:
+            msg = InboundMessageIn.model_validate(raw)
+        except ValidationError as e:
+            err = e.errors()[0]
+            results[i] = BatchItemResult("error", error=f"{'.'.join(map(str, err['loc']))}: {err['msg']}")
+            continue
+        indexes.append(i)
+        items.append(InboundItem(company_id=msg.company_id, channel_id=msg.channel_id, phone=msg.from_,
+                                 text=msg.text, channel_message_id=msg.channel_message_id))
+    return indexes, items, results
+
+
+def batch_response(results: List[BatchItemResult]) -> InboundBatchOut:
+    statuses = [r.status for r in results]
+    return InboundBatchOut(
+        accepted=statuses.count("created") + statuses.count("appended"),
+        duplicates=statuses.count("duplicate"),
+        errors=statuses.count("error"),
+        results=[InboundBatchItemOut(index=i, status=r.status, conversation_id=r.conversation_id, error=r.error)
+                 for i, r in enumerate(results)],
+    )
+
+
+@router.post("/webhooks/inbound/batch", response_model=InboundBatchOut)
+def inbound_webhook_batch(payload: InboundBatchIn, db: Session = Depends(get_db)):
+    # every valid item is stored in one transaction; malformed items are reported per index
+    indexes, items, results = parse_batch(payload)
+    if items:
+        for i, result in zip(indexes, process_inbound_batch(db, items)):
+            results[i] = result
+    return batch_response(results)
+
+
+@coalesced_router.post("/webhooks/inbound", response_model=ConversationOut, status_code=status.HTTP_201_CREATED,
+                       tags=["webhooks"])
+async def inbound_webhook_coalesced(payload: InboundMessageIn, response: Response):
+    # no session of its own: the delivery is stored in a batch shared with concurrent requests,
+    # and this returns once that batch has committed
+    result, conv = await get_write_coalescer().submit(InboundItem(
+        company_id=payload.company_id, channel_id=payload.channel_id, phone=payload.from_, text=payload.text,
+        channel_message_id=payload.channel_message_id))
+    if result.status == "duplicate":
+        response.status_code = status.HTTP_200_OK
+    return ConversationOut(**conv)
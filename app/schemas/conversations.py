@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, ConfigDict
 from typing import Optional, Literal
 
@@ -7,8 +8,19 @@ class ConversationOut(BaseModel):
     channel_id: int
     contact_id: int
     owner_id: Optional[int] = None
+    status: Literal["open", "closed"] = "open"
     model_config = ConfigDict(from_attributes=True)
 
 class AgentMessageIn(BaseModel):
     author_id: int
     text: str
+
+class InboxConversationOut(BaseModel):
+    id: int
+    channel_id: int
+    contact_id: int
+    owner_id: Optional[int] = None
+    status: Literal["open", "closed"]
+    last_message_id: int
+    last_message_at: Optional[datetime] = None
+    message_count: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional
 
 class InboundMessageIn(BaseModel):
     company_id: int
@@ -9,3 +9,19 @@ class InboundMessageIn(BaseModel):
     channel_message_id: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
+
+class InboundBatchIn(BaseModel):
+    # items are validated one by one so a malformed item fails alone (see routers/webhooks.py)
+    messages: List[Dict[str, Any]] = Field(min_length=1, max_length=1000)
+
+class InboundBatchItemOut(BaseModel):
+    index: int
+    status: Literal["created", "appended", "duplicate", "error"]
+    conversation_id: Optional[int] = None
+    error: Optional[str] = None
+
+class InboundBatchOut(BaseModel):
+    accepted: int
+    duplicates: int
+    errors: int
+    results: List[InboundBatchItemOut]
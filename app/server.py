@@ -0,0 +1,60 @@
+"""
+Production serving: gunicorn preforks the workers, each one running uvicorn (see gunicorn.conf.py).
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+DrainingUvicornWorker adds a drain period to the graceful shutdown. On SIGTERM a worker
+first reports not-ready on GET /readyz and keeps serving for SHUTDOWN_DRAIN_SECONDS, so
+the load balancer takes it out of rotation before it stops accepting connections; then
+it finishes the requests in flight (at most GRACEFUL_TIMEOUT seconds) and runs the
+lifespan shutdown. A second SIGTERM/SIGINT skips the drain period.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from typing import Optional
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.main import Server
+from uvicorn.workers import UvicornWorker
+
+from app.services.warmup import mark_draining
+
+logger = logging.getLogger(__name__)
+
+
+def drain_seconds() -> float:
+    return float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "5"))
+
+
+class DrainingServer(Server):
+    drain_seconds = 0.0
+    _drain: Optional[asyncio.TimerHandle] = None
+
+    def handle_exit(self, sig, frame):
+        if self._drain is not None:
+            self._drain.cancel()  # second signal: stop draining
+        elif not self.should_exit and self.drain_seconds > 0:
+            mark_draining()
+            logger.info("draining for %.1fs before shutting down", self.drain_seconds)
+            self._drain = asyncio.get_event_loop().call_later(self.drain_seconds, super().handle_exit, sig, frame)
+            return
+        super().handle_exit(sig, frame)
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # what is left of gunicorn's graceful_timeout after the drain period, for the requests in flight
+        self.config.timeout_graceful_shutdown = max(1, int(self.cfg.graceful_timeout - drain_seconds()) - 1)
+
+    async def _serve(self):
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        server.drain_seconds = drain_seconds()
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
@@ -0,0 +1,362 @@
+"""
+Per-tenant admission control in front of the DB pool.
+
+Every company shares one connection pool, so one tenant's burst (a campaign reply storm
+hitting /webhooks/inbound) could take every connection and slow everyone else down.
+AdmissionMiddleware finds the company of each request (the body of the inbound webhooks,
+the path of /companies/{id}/..., the conversation of /conversations/{id}/...) and:
+
+  - takes a token from the company's bucket (ADMISSION_RATE per second, ADMISSION_BURST),
+  - caps the company's requests in flight (ADMISSION_MAX_CONCURRENT),
+  - answers 429 with Retry-After right away when either is exceeded, instead of queueing
+    (a webhook provider redelivers later; redeliveries are deduplicated),
+  - tags the request with the company and its weight, so that when the pool is saturated
+    its sessions are queued fairly against other tenants' (app/db_utils/fair_queue.py).
+
+0 disables a limit. ADMISSION_TENANTS overrides them per company, as JSON:
+{"42": {"rate": 200, "burst": 400, "max_concurrent": 16, "weight": 4}}.
+Requests that belong to no company (system endpoints, event streams) are not limited.
+Buckets and counters live in the worker process: with several workers each one applies
+the limits on its own. Companies without overrides are tracked in an LRU of
+ADMISSION_MAX_TENANTS; beyond it they share one bucket (AdmissionController).
+"""
+
+import itertools
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+import anyio
+import sqlalchemy
+from fastapi.responses import JSONResponse
+
+from app.dao.conversation import DAOConversation
+from app.db_utils.db_connection import get_engine
+from app.db_utils.deps import pool_slot
+from app.db_utils.fair_queue import current_tenant
+from app.services.cache import InMemoryLRUBackend
+from app.services.metrics import registry
+
+admission_requests = registry.counter("admission_requests_total", "Requests by company and admission outcome.",
+                                      ("company_id", "outcome"))
+
+COMPANY_PATH = re.compile(r"^/companies/(\d+)(?:/|$)")
+CONVERSATION_PATH = re.compile(r"^/conversations/(\d+)(?:/|$)")
+WEBHOOK_PATHS = {"/webhooks/inbound", "/webhooks/inbound/batch"}
+OTHER = "other"  # the shared key of companies not tracked on their own
+
+
+def admission_enabled() -> bool:
+    return os.getenv("ADMISSION_ENABLED", "0").lower() in ("1", "true", "yes")
+
+
+class TenantLimits(NamedTuple):
+    rate: float  # tokens per second, 0 = unlimited
+    burst: int
+    max_concurrent: int  # 0 = unlimited
+    weight: float
+
+
+def load_limits() -> Tuple[TenantLimits, Dict[int, TenantLimits]]:
+    """Default limits and per-company overrides from the environment."""
+    rate = float(os.getenv("ADMISSION_RATE", "0"))
+    default = TenantLimits(rate=rate, burst=int(os.getenv("ADMISSION_BURST", "0")) or max(1, math.ceil(rate)),
+                           max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "0")), weight=1.0)
+    overrides = {}
+    for company_id, fields in json.loads(os.getenv("ADMISSION_TENANTS") or "{}").items():
+        limits = default._replace(**fields)
+        if "rate" in fields and "burst" not in fields:
+            limits = limits._replace(burst=max(1, math.ceil(limits.rate)))
+        overrides[int(company_id)] = limits
+    return default, overrides
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+    def refill(self, rate: float, burst: int, now: float):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class TenantState:
+    __slots__ = ("bucket", "in_flight", "counts")
+
+    def __init__(self):
+        self.bucket: Optional[TokenBucket] = None
+        self.in_flight = 0
+        self.counts: Dict[str, int] = {}
+
+
+class AdmissionController:
+    """
+    Buckets, in-flight counts and counters per company. Used from the event loop only.
+
+    Company ids come from request bodies, so the state is bounded: companies with
+    overrides are always tracked, the others in an LRU of `max_tenants` entries. Idle
+    entries (nothing in flight) are evicted from it; once it is full of busy ones, new
+    companies share the OTHER bucket with the default limits. Metrics are labelled by
+    company only for the overrides, every other company is counted under OTHER.
+    """
+
+    def __init__(self, default: TenantLimits, overrides: Optional[Dict[int, TenantLimits]] = None,
+                 clock: Callable[[], float] = time.monotonic, max_tenants: int = 10000):
+        self.default = default
+        self.overrides = overrides or {}
+        self.clock = clock
+        self.max_tenants = max_tenants
+        self._fixed: Dict[Hashable, TenantState] = {}  # overrides and OTHER, never evicted
+        self._recent: "OrderedDict[int, TenantState]" = OrderedDict()
+        self.evictions = 0
+
+    def _state(self, key: Hashable) -> Optional[TenantState]:
+        state = self._recent.get(key)
+        if state is not None:
+            self._recent.move_to_end(key)
+            return state
+        state = self._fixed.get(key)
+        if state is None and (key == OTHER or key in self.overrides):
+            state = self._fixed[key] = TenantState()
+        return state
+
+    def _track(self, company_id: int, keep) -> Hashable:
+        """The key company_id is limited under, making room in the LRU if needed."""
+        if company_id in self._recent or company_id in self.overrides:
+            return company_id
+        if len(self._recent) >= self.max_tenants:
+            for _ in range(len(self._recent)):
+                key, state = next(iter(self._recent.items()))
+                if state.in_flight or key in keep:
+                    self._recent.move_to_end(key)  # busy: looked at again after the others
+                    continue
+                del self._recent[key]
+                self.evictions += 1
+                break
+            else:
+                return OTHER
+        self._recent[company_id] = TenantState()
+        return company_id
+
+    def tenant_costs(self, costs: Dict[int, int]) -> Dict[Hashable, int]:
+        """(company -> tokens) to (key -> tokens): the company itself if tracked, else OTHER."""
+        keyed: Dict[Hashable, int] = {}
+        for company_id, cost in costs.items():
+            key = company_id if company_id == OTHER else self._track(company_id, costs)
+            keyed[key] = keyed.get(key, 0) + cost
+        return keyed
+
+    def _count(self, key: Hashable, state: TenantState, outcome: str):
+        state.counts[outcome] = state.counts.get(outcome, 0) + 1
+        admission_requests.inc((metric_label(key, self.overrides), outcome))
+
+    def limits(self, key: Hashable) -> TenantLimits:
+        return self.overrides.get(key, self.default)
+
+    def try_admit(self, costs: Dict[int, int]) -> Optional[Tuple[Hashable, str, int]]:
+        """
+        Admit a request charging `costs` (company -> tokens), all or nothing.
+        Returns None when admitted, else (company_id or OTHER, reason, retry_after seconds).
+        """
+        now = self.clock()
+        charges = [(key, self._state(key), cost) for key, cost in self.tenant_costs(costs).items()]
+        for key, state, cost in charges:
+            limits = self.limits(key)
+            if limits.max_concurrent and state.in_flight >= limits.max_concurrent:
+                return self._reject(key, state, "concurrency_limited", 1)
+            if limits.rate:
+                if state.bucket is None:
+                    state.bucket = TokenBucket(limits.burst, now)
+                state.bucket.refill(limits.rate, limits.burst, now)
+                missing = min(cost, limits.burst) - state.bucket.tokens  # a batch larger than the burst takes it all
+                if missing > 0:
+                    return self._reject(key, state, "rate_limited", max(1, math.ceil(missing / limits.rate)))
+        for key, state, cost in charges:
+            limits = self.limits(key)
+            if limits.rate:
+                state.bucket.tokens -= min(cost, limits.burst)
+            state.in_flight += 1
+            self._count(key, state, "admitted")
+        return None
+
+    def _reject(self, key: Hashable, state: TenantState, reason: str,
+                retry_after: int) -> Tuple[Hashable, str, int]:
+        self._count(key, state, reason)
+        return key, reason, retry_after
+
+    def release(self, costs: Dict[Hashable, int]):
+        """Release an admitted request; `costs` as returned by tenant_costs (tracked while in flight)."""
+        for key in costs:
+            self._state(key).in_flight -= 1
+
+    def in_flight(self) -> Dict[str, int]:
+        """Requests in flight by metric label."""
+        totals: Dict[str, int] = {}
+        for key, state in itertools.chain(self._fixed.items(), self._recent.items()):
+            label = metric_label(key, self.overrides)
+            totals[label] = totals.get(label, 0) + state.in_flight
+        return totals
+
+    def describe(self) -> dict:
+        now = self.clock()
+        for company_id in self.overrides:
+            self._state(company_id)
+        tenants = {}
+        for key, state in itertools.chain(self._fixed.items(), self._recent.items()):
+            limits = self.limits(key)
+            if state.bucket is not None:
+                state.bucket.refill(limits.rate, limits.burst, now)
+            tenants[str(key)] = {
+                **limits._asdict(),
+                "in_flight": state.in_flight,
+                "tokens": round(state.bucket.tokens, 3) if state.bucket is not None else limits.burst,
+                **{outcome: state.counts.get(outcome, 0)
+                   for outcome in ("admitted", "rate_limited", "concurrency_limited")},
+            }
+        return {"default": self.default._asdict(), "max_tenants": self.max_tenants,
+                "tracked": len(self._recent), "evictions": self.evictions, "tenants": tenants}
+
+
+def metric_label(key: Hashable, overrides: Dict[int, TenantLimits]) -> str:
+    return str(key) if key in overrides else OTHER
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(*load_limits(),
+                                          max_tenants=int(os.getenv("ADMISSION_MAX_TENANTS", "10000")))
+    return _controller
+
+
+def set_admission_controller(controller: Optional[AdmissionController]) -> Optional[AdmissionController]:
+    """Swap the controller (None: rebuilt from the environment on next use)."""
+    global _controller
+    _controller = controller
+    return controller
+
+
+def collect_admission_metrics():
+    if _controller is None:
+        return []
+    samples = sorted(_controller.in_flight().items())
+    return ["# HELP admission_in_flight Admitted requests in flight by company.",
+            "# TYPE admission_in_flight gauge"] + [f'admission_in_flight{{company_id="{c}"}} {n}' for c, n in samples]
+
+
+registry.add_collector(collect_admission_metrics)
+
+
+# -- which company a request belongs to ---------------------------------------------------
+# conversation -> company never changes
+_conversation_companies = InMemoryLRUBackend(maxsize=int(os.getenv("ADMISSION_CONVERSATION_CACHE_SIZE", "100000")),
+                                             ttl=None)
+
+
+def _load_conversation_company(conversation_id: int) -> Optional[int]:
+    with get_engine().connect() as conn:
+        return conn.execute(sqlalchemy.select(DAOConversation.company_id)
+                            .where(DAOConversation.id == conversation_id)).scalar()
+
+
+async def conversation_company(conversation_id: int) -> Optional[int]:
+    key = str(conversation_id)
+    company_id = _conversation_companies.get(key)
+    if company_id is None:
+        async with pool_slot():
+            company_id = await anyio.to_thread.run_sync(_load_conversation_company, conversation_id)
+        if company_id is not None:
+            _conversation_companies.set(key, company_id)
+    return company_id
+
+
+def _body_costs(path: str, body: bytes) -> Dict[int, int]:
+    try:
+        payload = json.loads(body)
+        if path == "/webhooks/inbound":
+            return {int(payload["company_id"]): 1}
+        costs: Dict[int, int] = {}
+        for message in payload["messages"]:  # a batch costs each company its number of messages
+            company_id = int(message["company_id"])
+            costs[company_id] = costs.get(company_id, 0) + 1
+        return costs
+    except (ValueError, TypeError, KeyError):
+        return {}  # malformed: let the endpoint answer 422
+
+
+async def _read_body(receive) -> Tuple[bytes, Callable]:
+    chunks, more = [], True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        more = message.get("more_body", False)
+    body, replayed = b"".join(chunks), False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+async def request_costs(scope, receive) -> Tuple[Dict[int, int], Callable]:
+    """(company -> tokens) for a request, and the receive callable to pass on (the body may have been read)."""
+    path = scope["path"]
+    if path.endswith("/events"):
+        return {}, receive  # long-lived streams hold no connection
+    if path in WEBHOOK_PATHS and scope["method"] == "POST":
+        body, receive = await _read_body(receive)
+        return _body_costs(path, body), receive
+    match = COMPANY_PATH.match(path)
+    if match:
+        return {int(match.group(1)): 1}, receive
+    match = CONVERSATION_PATH.match(path)
+    if match:
+        company_id = await conversation_company(int(match.group(1)))
+        return ({company_id: 1} if company_id is not None else {}), receive
+    return {}, receive
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        costs, receive = await request_costs(scope, receive)
+        if not costs:
+            return await self.app(scope, receive, send)
+
+        controller = get_admission_controller()
+        costs = controller.tenant_costs(costs)
+        rejected = controller.try_admit(costs)
+        if rejected is not None:
+            key, reason, retry_after = rejected
+            response = JSONResponse(status_code=429, headers={"Retry-After": str(retry_after)},
+                                    content={"detail": f"company {key}: {reason.replace('_', ' ')}"})
+            return await response(scope, receive, send)
+
+        # a batch spanning companies is queued as the one with most messages
+        key = max(costs, key=costs.get)
+        token = current_tenant.set((key, controller.limits(key).weight))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(token)
+            controller.release(costs)
@@ -0,0 +1,48 @@
+"""
+AI reply providers. AI_MODE selects one:
+  - mock:      deterministic reply, no external calls (default)
+  - mock_slow: same reply after AI_MOCK_LATENCY_MS, failing with probability AI_MOCK_FAILURE_RATE;
+               stands in for a real model call when testing latency isolation offline
+"""
+
+import asyncio
+import os
+import random
+from typing import Optional
+
+
+class AIProviderError(Exception):
+    pass
+
+
+def mock_reply_text(company_name: Optional[str], inbound_text: str) -> str:
+    brand = f" ({company_name})" if company_name else ""
+    return f"Auto-reply from AI bot{brand}: I received your message: '{inbound_text}'"
+
+
+class MockAIProvider:
+    async def generate_reply(self, company_name: Optional[str], inbound_text: str) -> str:
+        return mock_reply_text(company_name, inbound_text)
+
+
+class SlowMockAIProvider(MockAIProvider):
+    def __init__(self, latency: float = 2.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    async def generate_reply(self, company_name: Optional[str], inbound_text: str) -> str:
+        await asyncio.sleep(self.latency)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise AIProviderError("mock provider failure")
+        return mock_reply_text(company_name, inbound_text)
+
+
+def provider_from_env():
+    mode = os.getenv("AI_MODE", "mock")
+    if mode == "mock":
+        return MockAIProvider()
+    if mode == "mock_slow":
+        return SlowMockAIProvider(latency=float(os.getenv("AI_MOCK_LATENCY_MS", "2000")) / 1000,
+                                  failure_rate=float(os.getenv("AI_MOCK_FAILURE_RATE", "0")))
+    raise ValueError(f"Unknown AI_MODE: {mode}")
@@ -0,0 +1,287 @@
+"""
+Cold-message archival tier.
+
+Messages of conversations idle for longer than ARCHIVE_MIN_IDLE_DAYS move out of the
+`messages` table into compressed append-only segment files (app/db_utils/segments.py)
+under ARCHIVE_DIR, so the hot table and its indexes stay small. A conversation records
+how far its history was archived (conversations.archived_upto_id); the message read
+paths (app/services/messages.py) merge archived and live rows, so callers do not notice.
+
+Archiving a conversation: stream its messages in blocks of ARCHIVE_BLOCK_MESSAGES into
+the segment, fsync, then set archived_upto_id and delete the rows in one transaction.
+A crash in between leaves rows in both places; readers prefer the live row. Restoring
+puts the rows back in the table and tombstones the archived blocks, under the same
+writer lock; the conversation is archived again only once it is idle since the restore
+(conversations.restored_at).
+
+Every API process reads the segments, so with several hosts ARCHIVE_DIR must be storage
+they share (NFS, a shared volume); a conversation archived elsewhere whose blocks are not
+found raises ArchiveUnavailable (503) instead of serving a truncated history.
+
+Archived messages are not seen by the inbound dedup (a provider retry arrives within
+minutes, long before a conversation is idle enough to be archived).
+
+    python -m app.services.archive archive --older-than-days 30
+    python -m app.services.archive restore 42
+    python -m app.services.archive status
+
+With ARCHIVE_INTERVAL_SECONDS > 0 the API process also runs the archival job periodically
+(one worker per host, see app/services/leader.py).
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import anyio
+import sqlalchemy
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+from app.db_utils.db_connection import get_sessionmaker
+from app.db_utils.segments import ROW_FIELDS, SegmentStore, SegmentWriter
+from app.db_utils.upsert import insert_ignore_many
+from app.services.leader import is_leader
+
+logger = logging.getLogger(__name__)
+
+_store: Optional[SegmentStore] = None
+
+
+def get_archive_store() -> SegmentStore:
+    global _store
+    if _store is None:
+        _store = SegmentStore(os.getenv("ARCHIVE_DIR", "archive"),
+                              segment_bytes=int(os.getenv("ARCHIVE_SEGMENT_MB", "64")) * 1024 * 1024)
+        _store.refresh()
+    return _store
+
+
+def set_archive_store(store: Optional[SegmentStore]) -> Optional[SegmentStore]:
+    global _store
+    if _store is not None and _store is not store:
+        _store.close()
+    _store = store
+    return store
+
+
+# -- read-through --------------------------------------------------------------
+def archived_upto(db: Session, conversation_id: int) -> Optional[int]:
+    """Highest archived message id of the conversation, or None; one column unless it is already in the session."""
+    conv = db.identity_map.get(identity_key(DAOConversation, conversation_id))
+    if conv is not None:
+        return conv.archived_upto_id
+    return db.execute(sqlalchemy.select(DAOConversation.archived_upto_id)
+                      .where(DAOConversation.id == conversation_id)).scalar()
+
+
+class ArchiveUnavailable(Exception):
+    """The conversation is archived, but this process cannot see its blocks in ARCHIVE_DIR."""
+
+
+def _archive_with(conversation_id: int, upto_id: int) -> SegmentStore:
+    store = get_archive_store()
+    blocks = store.blocks(conversation_id)
+    if not blocks or max(b.last_id for b in blocks) < upto_id:
+        store.refresh()  # archived by another process since this one loaded the index
+        blocks = store.blocks(conversation_id)
+        if not blocks or max(b.last_id for b in blocks) < upto_id:
+            # a partial history must not pass for the whole one: ARCHIVE_DIR is not shared with the archiver
+            raise ArchiveUnavailable(f"archived messages of conversation {conversation_id} (up to id {upto_id}) "
+                                     f"are not in {store.directory}")
+    return store
+
+
+def check_archive(db: Session, conversation_id: int):
+    """Raise ArchiveUnavailable up front (e.g. before a response starts streaming) if read_archived would."""
+    upto_id = archived_upto(db, conversation_id)
+    if upto_id is not None:
+        _archive_with(conversation_id, upto_id)
+
+
+def read_archived(conversation_id: int, upto_id: int, after_id: Optional[int] = None,
+                  before_id: Optional[int] = None, limit: Optional[int] = None,
+                  descending: bool = False) -> List[dict]:
+    """Archived rows as message dicts (id, conversation_id, sender, content), oldest first."""
+    store = _archive_with(conversation_id, upto_id)
+    rows = store.read(conversation_id, after_id=after_id, before_id=before_id, limit=limit, descending=descending)
+    return [{"id": r["id"], "conversation_id": conversation_id, "sender": r["sender"], "content": r["content"]}
+            for r in rows]
+
+
+# -- archiving -----------------------------------------------------------------
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def idle_conversations(db: Session, cutoff: datetime, after: Optional[tuple], limit: int) -> List[tuple]:
+    """
+    Next batch of (last_message_at, id, last_message_id, fully_archived) of the conversations idle
+    (and not restored) since before `cutoff`, in (last_message_at, id) order after the `after` cursor.
+    """
+    c = DAOConversation
+    stmt = sqlalchemy.select(c.last_message_at, c.id, c.last_message_id, c.archived_upto_id) \
+        .where(c.last_message_at < cutoff, sqlalchemy.or_(c.restored_at.is_(None), c.restored_at < cutoff))
+    if after is not None:
+        stmt = stmt.where(sqlalchemy.or_(c.last_message_at > after[0],
+                                         sqlalchemy.and_(c.last_message_at == after[0], c.id > after[1])))
+    rows = db.execute(stmt.order_by(c.last_message_at, c.id).limit(limit)).all()
+    return [(r.last_message_at, r.id, r.last_message_id, r.archived_upto_id is not None and
+             r.last_message_id <= r.archived_upto_id) for r in rows]
+
+
+def archive_conversation(db: Session, writer: SegmentWriter, conversation_id: int, upto_id: int,
+                         block_messages: int = 1000) -> int:
+    """Move the conversation's messages with id <= upto_id to the archive. Returns how many moved."""
+    stmt = (sqlalchemy.select(DAOMessage.id, DAOMessage.sender, DAOMessage.content, DAOMessage.channel_id,
+                              DAOMessage.channel_message_id, DAOMessage.created_at)
+            .where(DAOMessage.conversation_id == conversation_id, DAOMessage.id <= upto_id)
+            .order_by(DAOMessage.id)
+            .execution_options(yield_per=block_messages))
+    moved = 0
+    for rows in db.execute(stmt).partitions():
+        writer.append(conversation_id, [dict(zip(ROW_FIELDS, row)) for row in rows])
+        moved += len(rows)
+    if not moved:
+        db.rollback()
+        return 0
+    writer.sync()
+
+    # archival only moves forward: idle_conversations skips conversations archived up to their last message
+    db.execute(sqlalchemy.update(DAOConversation).where(DAOConversation.id == conversation_id)
+               .values(archived_upto_id=upto_id))
+    db.execute(sqlalchemy.delete(DAOMessage).where(DAOMessage.conversation_id == conversation_id,
+                                                   DAOMessage.id <= upto_id))
+    db.commit()
+    return moved
+
+
+def archive_idle(older_than: timedelta, batch_size: int = 100, block_messages: int = 1000,
+                 max_conversations: Optional[int] = None, store: Optional[SegmentStore] = None) -> dict:
+    """
+    Archive every conversation idle for longer than `older_than`, `batch_size` conversations
+    per index query and one transaction per conversation; memory is bounded by one block.
+    """
+    store = store or get_archive_store()
+    cutoff = _utcnow() - older_than
+    stats = {"conversations": 0, "messages": 0}
+    cursor = None
+    with store.writer() as writer, get_sessionmaker()() as db:
+        while max_conversations is None or stats["conversations"] < max_conversations:
+            batch = idle_conversations(db, cutoff, cursor, batch_size)
+            db.rollback()  # end the read transaction before the per-conversation ones
+            if not batch:
+                break
+            for last_at, conversation_id, last_message_id, done in batch:
+                cursor = (last_at, conversation_id)
+                if done or last_message_id is None:
+                    continue
+                moved = archive_conversation(db, writer, conversation_id, last_message_id, block_messages)
+                if moved:
+                    stats["conversations"] += 1
+                    stats["messages"] += moved
+                if max_conversations is not None and stats["conversations"] >= max_conversations:
+                    break
+    return stats
+
+
+def restore_conversation(db: Session, conversation_id: int, chunk_size: int = 500) -> int:
+    """
+    Move a conversation's archived messages back into the table. Returns how many came back.
+    The conversation then stays out of archival until it has been idle again since the restore.
+    """
+    store = get_archive_store()
+    # the writer lock keeps archive_idle off the conversation until its blocks are tombstoned
+    with store.writer() as writer:
+        conv = db.get(DAOConversation, conversation_id, populate_existing=True)
+        if conv is None or conv.archived_upto_id is None:
+            db.rollback()
+            return 0
+        store.refresh()
+        rows = store.read(conversation_id)
+        for i in range(0, len(rows), chunk_size):
+            insert_ignore_many(db, DAOMessage.__table__, [
+                {**row, "conversation_id": conversation_id,
+                 "created_at": datetime.fromisoformat(row["created_at"]) if row["created_at"] else None}
+                for row in rows[i:i + chunk_size]])
+        conv.archived_upto_id = None
+        conv.restored_at = _utcnow()
+        db.commit()
+        # the rows are safe in the table: drop them from the archive
+        writer.tombstone(conversation_id)
+        writer.sync()
+    return len(rows)
+
+
+# -- background job --------------------------------------------------------------
+_archiver_task: Optional[asyncio.Task] = None
+
+
+async def _archive_loop(interval: float, older_than: timedelta, block_messages: int):
+    limiter = anyio.CapacityLimiter(1)  # never takes a request thread
+    run = functools.partial(archive_idle, older_than, block_messages=block_messages)
+    while True:
+        try:
+            if is_leader():  # otherwise another worker runs it
+                stats = await anyio.to_thread.run_sync(run, limiter=limiter)
+                if stats["conversations"]:
+                    logger.info("archived %(messages)d messages of %(conversations)d conversations", stats)
+        except Exception:
+            logger.exception("archival run failed")
+        await asyncio.sleep(interval)
+
+
+async def start_archiver():
+    global _archiver_task
+    interval = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))
+    if interval > 0 and _archiver_task is None:
+        older_than = timedelta(days=float(os.getenv("ARCHIVE_MIN_IDLE_DAYS", "30")))
+        block_messages = int(os.getenv("ARCHIVE_BLOCK_MESSAGES", "1000"))
+        _archiver_task = asyncio.create_task(_archive_loop(interval, older_than, block_messages))
+
+
+async def stop_archiver():
+    global _archiver_task
+    if _archiver_task is not None:
+        _archiver_task.cancel()
+        try:
+            await _archiver_task
+        except asyncio.CancelledError:
+            pass
+        _archiver_task = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-message archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    archive = sub.add_parser("archive", help="archive conversations idle longer than --older-than-days")
+    archive.add_argument("--older-than-days", type=float, default=float(os.getenv("ARCHIVE_MIN_IDLE_DAYS", "30")))
+    archive.add_argument("--batch-size", type=int, default=100)
+    archive.add_argument("--block-messages", type=int, default=int(os.getenv("ARCHIVE_BLOCK_MESSAGES", "1000")))
+    archive.add_argument("--max-conversations", type=int)
+    restore = sub.add_parser("restore", help="move a conversation's archived messages back to the table")
+    restore.add_argument("conversation_id", type=int)
+    sub.add_parser("status", help="segment files and archived volume")
+    args = parser.parse_args(argv)
+
+    if args.command == "archive":
+        result = archive_idle(timedelta(days=args.older_than_days), batch_size=args.batch_size,
+                              block_messages=args.block_messages, max_conversations=args.max_conversations)
+    elif args.command == "restore":
+        with get_sessionmaker()() as db:
+            result = {"conversation_id": args.conversation_id,
+                      "restored": restore_conversation(db, args.conversation_id)}
+    else:
+        result = get_archive_store().describe()
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
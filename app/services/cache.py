@@ -0,0 +1,99 @@
+"""
+Small key/value cache backends shared by the service-layer caches.
+InMemoryLRUBackend is per process; RedisBackend can be swapped in when several
+workers must see the same entries (and each other's invalidations).
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Protocol
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[Any]: ...
+    def set(self, key: str, value: Any) -> None: ...
+    def delete(self, key: str) -> None: ...
+    def clear(self) -> None: ...
+
+
+class InMemoryLRUBackend:
+    """Bounded LRU with per-entry TTL. Thread-safe."""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Shared backend for multi-worker deployments (values stored as JSON). Needs the `redis` package."""
+
+    def __init__(self, url: str, ttl: Optional[float] = 300.0, prefix: str = "omni:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RedisBackend requires the 'redis' package (pip install redis)") from e
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        self._client.set(self.prefix + key, json.dumps(value), ex=int(self.ttl) if self.ttl else None)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+def backend_from_env(prefix: str, default_size: int, default_ttl: float) -> CacheBackend:
+    """Build a backend from <PREFIX>_BACKEND / <PREFIX>_SIZE / <PREFIX>_TTL (+ REDIS_URL)."""
+    kind = os.getenv(f"{prefix}_BACKEND", "memory")
+    ttl = float(os.getenv(f"{prefix}_TTL", str(default_ttl)))
+    if kind == "redis":
+        return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl=ttl,
+                            prefix=f"omni:{prefix.lower()}:")
+    return InMemoryLRUBackend(maxsize=int(os.getenv(f"{prefix}_SIZE", str(default_size))), ttl=ttl)
@@ -1,41 +1,62 @@
-from typing import Optional
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import sqlalchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
 from app.dao.company import DAOCompany
 from app.dao.channel import DAOChannel
 from app.dao.users import DAOUser
 from app.dao.contact import DAOContact
 from app.dao.conversation import DAOConversation
 from app.dao.message import DAOMessage
+from app.db_utils.filters import composite_in
+from app.db_utils.upsert import insert_ignore, insert_ignore_many, upsert_returning_id
+from app.services.ai_provider import mock_reply_text
+from app.services.events import publish_after_commit
+from app.services.search import index_enabled, index_messages
+from app.services.tenant_cache import get_tenant_cache, update_after_commit, invalidate_after_commit
 
 
+def _save(db: Session, commit: bool):
+    """Commit the unit of work, or only flush when the caller owns the transaction."""
+    if commit:
+        db.commit()
+    else:
+        db.flush()
 
-
-def get_or_create_company(db: Session, company_id: int) -> DAOCompany:
-    company = db.query(DAOCompany).filter(DAOCompany.id == company_id).first()
+def get_or_create_company(db: Session, company_id: int, commit: bool = True) -> DAOCompany:
+    company = db.get(DAOCompany, company_id)
     if not company:
-        company = DAOCompany(id=company_id, name=f"Company {company_id}")
-        db.add(company)
-        db.commit()
+        insert_ignore(db, DAOCompany.__table__, {"id": company_id, "name": f"Company {company_id}"})
+        company = db.get(DAOCompany, company_id)
+        invalidate_after_commit(db, company_id)
+        _save(db, commit)
     return company
 
-def get_or_create_channel(db: Session, company_id: int, channel_id: int) -> DAOChannel:
-    ch = db.query(DAOChannel).filter(DAOChannel.id == channel_id).first()
+def get_or_create_channel(db: Session, company_id: int, channel_id: int, commit: bool = True) -> DAOChannel:
+    ch = db.get(DAOChannel, channel_id)
     if not ch:
-        ch = DAOChannel(id=channel_id, company_id=company_id, name=f"channel-{channel_id}", type="whatsapp")
-        db.add(ch)
-        db.commit()
+        insert_ignore(db, DAOChannel.__table__,
+                      {"id": channel_id, "company_id": company_id, "name": f"channel-{channel_id}", "type": "whatsapp"})
+        ch = db.get(DAOChannel, channel_id)
+        invalidate_after_commit(db, company_id)
+        _save(db, commit)
     return ch
 
-def get_or_create_ai_user(db: Session, company_id: int) -> DAOUser:
-    bot = db.query(DAOUser).filter(DAOUser.company_id == company_id, DAOUser.role == "ai").first()
+def get_or_create_ai_user(db: Session, company_id: int, commit: bool = True) -> DAOUser:
+    bot = (db.query(DAOUser)
+             .filter(DAOUser.company_id == company_id, DAOUser.role == "ai")
+             .order_by(DAOUser.id.asc())
+             .first())
     if not bot:
         bot = DAOUser(company_id=company_id, name="AI Bot", role="ai")
         db.add(bot)
-        db.commit()
-        db.refresh(bot)
+        invalidate_after_commit(db, company_id)
+        _save(db, commit)
     return bot
 
-def get_or_create_default_agent(db: Session, company_id: int) -> DAOUser:
+def get_or_create_default_agent(db: Session, company_id: int, commit: bool = True) -> DAOUser:
     """
     Returns a default human agent for the company. Creates one if missing.
     """
@@ -46,53 +67,324 @@ def get_or_create_default_agent(db: Session, company_id: int) -> DAOUser:
     if not agent:
         agent = DAOUser(company_id=company_id, name="Default Agent", role="agent")
         db.add(agent)
-        db.commit()
-        db.refresh(agent)
+        invalidate_after_commit(db, company_id)
+        _save(db, commit)
     return agent
 
-def get_or_create_contact_by_phone(db: Session, company_id: int, phone: str) -> DAOContact:
-    contact = db.query(DAOContact).filter(DAOContact.company_id == company_id, DAOContact.phone == phone).first()
-    if not contact:
-        contact = DAOContact(company_id=company_id, phone=phone, name=None, email=None)
-        db.add(contact)
-        db.commit()
-        db.refresh(contact)
+@dataclass
+class TenantMeta:
+    company_id: int
+    company_name: str
+    channel_id: int
+    ai_user_id: int
+
+def resolve_tenant(db: Session, company_id: int, channel_id: int) -> TenantMeta:
+    """
+    Company, channel and AI-bot user for an inbound message.
+    Served from the tenant cache when warm (no queries); otherwise get-or-create in the caller's transaction.
+    """
+    cache = get_tenant_cache()
+    entry = cache.get(company_id)
+    if entry.get("name") is not None and entry.get("ai_user_id") and channel_id in entry.get("channels", ()):
+        cache.record(hit=True)
+        return TenantMeta(company_id, entry["name"], channel_id, entry["ai_user_id"])
+
+    cache.record(hit=False)
+    company = get_or_create_company(db, company_id, commit=False)
+    channel = get_or_create_channel(db, company_id=company.id, channel_id=channel_id, commit=False)
+    ai_user = get_or_create_ai_user(db, company_id=company.id, commit=False)
+    update_after_commit(db, company.id, name=company.name, channel_id=channel.id, ai_user_id=ai_user.id)
+    return TenantMeta(company.id, company.name, channel.id, ai_user.id)
+
+def resolve_tenants(db: Session, pairs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], TenantMeta]:
+    """
+    Set-based resolve_tenant for a batch of (company_id, channel_id) pairs:
+    cache hits cost nothing, misses are fetched (and created) with one IN query per table.
+    """
+    cache = get_tenant_cache()
+    tenants, missing = {}, set()
+    for company_id, channel_id in set(pairs):
+        entry = cache.get(company_id)
+        if entry.get("name") is not None and entry.get("ai_user_id") and channel_id in entry.get("channels", ()):
+            cache.record(hit=True)
+            tenants[(company_id, channel_id)] = TenantMeta(company_id, entry["name"], channel_id, entry["ai_user_id"])
+        else:
+            cache.record(hit=False)
+            missing.add((company_id, channel_id))
+    if not missing:
+        return tenants
+
+    company_ids = {company_id for company_id, _ in missing}
+    channel_ids = {channel_id for _, channel_id in missing}
+
+    companies = {c.id: c for c in db.query(DAOCompany).filter(DAOCompany.id.in_(company_ids))}
+    new_companies = sorted(company_ids - companies.keys())
+    if new_companies:
+        insert_ignore_many(db, DAOCompany.__table__, [{"id": c, "name": f"Company {c}"} for c in new_companies])
+        companies.update({c.id: c for c in db.query(DAOCompany).filter(DAOCompany.id.in_(new_companies))})
+
+    channels = {ch.id: ch for ch in db.query(DAOChannel).filter(DAOChannel.id.in_(channel_ids))}
+    # keyed by (company_id, channel_id): a new channel id sent for two companies is created once,
+    # for the lowest company id (the insert ignores the other), as one message at a time would
+    new_channels = sorted((company_id, channel_id) for company_id, channel_id in missing if channel_id not in channels)
+    if new_channels:
+        insert_ignore_many(db, DAOChannel.__table__,
+                           [{"id": ch, "company_id": company_id, "name": f"channel-{ch}", "type": "whatsapp"}
+                            for company_id, ch in new_channels])
+        channels.update({ch.id: ch for ch in db.query(DAOChannel)
+                         .filter(DAOChannel.id.in_({ch for _, ch in new_channels}))})
+
+    bots = {}
+    for bot in (db.query(DAOUser)
+                  .filter(DAOUser.company_id.in_(company_ids), DAOUser.role == "ai")
+                  .order_by(DAOUser.id.desc())):
+        bots[bot.company_id] = bot  # lowest id wins, like get_or_create_ai_user's .first()
+    new_bots = [DAOUser(company_id=c, name="AI Bot", role="ai") for c in sorted(company_ids - bots.keys())]
+    if new_bots:
+        db.add_all(new_bots)
+        db.flush()
+        bots.update({bot.company_id: bot for bot in new_bots})
+
+    for company_id in set(new_companies) | {c for c, _ in new_channels} | {b.company_id for b in new_bots}:
+        invalidate_after_commit(db, company_id)
+    for company_id, channel_id in missing:
+        company, channel, bot = companies[company_id], channels[channel_id], bots[company_id]
+        update_after_commit(db, company.id, name=company.name, channel_id=channel.id, ai_user_id=bot.id)
+        tenants[(company_id, channel_id)] = TenantMeta(company.id, company.name, channel.id, bot.id)
+    return tenants
+
+def resolve_ai_user_id(db: Session, company_id: int) -> int:
+    cache = get_tenant_cache()
+    bot_id = cache.get(company_id).get("ai_user_id")
+    cache.record(hit=bot_id is not None)
+    if bot_id is None:
+        bot_id = get_or_create_ai_user(db, company_id, commit=False).id
+        update_after_commit(db, company_id, ai_user_id=bot_id)
+    return bot_id
+
+def resolve_default_agent_id(db: Session, company_id: int) -> int:
+    cache = get_tenant_cache()
+    agent_id = cache.get(company_id).get("default_agent_id")
+    cache.record(hit=agent_id is not None)
+    if agent_id is None:
+        agent_id = get_or_create_default_agent(db, company_id, commit=False).id
+        update_after_commit(db, company_id, default_agent_id=agent_id)
+    return agent_id
+
+def upsert_contact_id(db: Session, company_id: int, phone: str) -> int:
+    """Single-statement get-or-create of a contact; returns its id (relies on uq_contacts_company_phone)."""
+    return upsert_returning_id(db, DAOContact.__table__,
+                               {"company_id": company_id, "phone": phone},
+                               keys=("company_id", "phone"))
+
+def upsert_contact_ids(db: Session, keys: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], int]:
+    """Set-based upsert_contact_id: (company_id, phone) -> contact id, creating missing contacts in one INSERT."""
+    def lookup(wanted):
+        rows = db.execute(sqlalchemy.select(DAOContact.id, DAOContact.company_id, DAOContact.phone)
+                          .where(composite_in((DAOContact.company_id, DAOContact.phone), wanted)))
+        return {(company_id, phone): contact_id for contact_id, company_id, phone in rows}
+
+    keys = set(keys)
+    contact_ids = lookup(keys) if keys else {}
+    missing = keys - contact_ids.keys()
+    if missing:
+        insert_ignore_many(db, DAOContact.__table__,
+                           [{"company_id": company_id, "phone": phone} for company_id, phone in sorted(missing)])
+        contact_ids.update(lookup(missing))
+    return contact_ids
+
+def get_or_create_contact_by_phone(db: Session, company_id: int, phone: str, commit: bool = True) -> DAOContact:
+    contact_id = upsert_contact_id(db, company_id, phone)
+    contact = db.get(DAOContact, contact_id)
+    _save(db, commit)
     return contact
 
 def find_open_conversation(db: Session, company_id: int, channel_id: int, contact_id: int) -> Optional[DAOConversation]:
     return (db.query(DAOConversation)
               .filter(DAOConversation.company_id == company_id,
                       DAOConversation.channel_id == channel_id,
-                      DAOConversation.contact_id == contact_id)
+                      DAOConversation.contact_id == contact_id,
+                      DAOConversation.status == "open")
               .order_by(DAOConversation.id.desc())
               .first())
 
-def create_conversation(db: Session, company_id: int, channel_id: int, contact_id: int, owner_id: Optional[int]) -> DAOConversation:
+def find_open_conversations(db: Session, keys: Iterable[Tuple[int, int, int]]
+                            ) -> Dict[Tuple[int, int, int], DAOConversation]:
+    """Set-based find_open_conversation: (company_id, channel_id, contact_id) -> latest open conversation."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    key_cols = (DAOConversation.company_id, DAOConversation.channel_id, DAOConversation.contact_id)
+    latest = {}
+    # a contact has few conversations; picking the newest here avoids a GROUP BY sort in the database
+    for conv in db.query(DAOConversation).filter(composite_in(key_cols, keys), DAOConversation.status == "open"):
+        key = (conv.company_id, conv.channel_id, conv.contact_id)
+        if key not in latest or conv.id > latest[key].id:
+            latest[key] = conv
+    return latest
+
+def create_conversations(db: Session, rows: List[dict]) -> Dict[Tuple[int, int, int], DAOConversation]:
+    """
+    Create conversations with one multi-row INSERT (rows: company_id, channel_id, contact_id, owner_id)
+    and load them back by key, since MySQL cannot return the generated ids of a multi-row insert.
+    """
+    if not rows:
+        return {}
+    db.execute(sqlalchemy.insert(DAOConversation.__table__).values(rows))
+    return find_open_conversations(db, [(r["company_id"], r["channel_id"], r["contact_id"]) for r in rows])
+
+def create_conversation(db: Session, company_id: int, channel_id: int, contact_id: int, owner_id: Optional[int],
+                        commit: bool = True) -> DAOConversation:
     conv = DAOConversation(company_id=company_id, channel_id=channel_id, contact_id=contact_id, owner_id=owner_id)
     db.add(conv)
-    db.commit()
-    db.refresh(conv)
+    _save(db, commit)
     return conv
 
-def add_message(db: Session, conversation_id: int, sender: str, content: str) -> DAOMessage:
-    msg = DAOMessage(conversation_id=conversation_id, sender=sender, content=content)
+def _expire_state(db: Session, conversation_ids: Iterable[int]):
+    """Loaded conversations no longer match the row after a Core UPDATE of their state columns."""
+    for conversation_id in conversation_ids:
+        conv = db.identity_map.get(identity_key(DAOConversation, conversation_id))
+        if conv is not None:
+            db.expire(conv, ["last_message_id", "last_message_at", "message_count"])
+
+def _company_id(db: Session, conversation_id: int) -> int:
+    """Company of a conversation, from the session when it is already loaded (the usual case)."""
+    conv = db.identity_map.get(identity_key(DAOConversation, conversation_id)) or db.get(DAOConversation, conversation_id)
+    return conv.company_id
+
+def touch_conversation(db: Session, conversation_id: int, last_message_id: int, added: int = 1):
+    """
+    Count `added` new messages and move the last-message pointer, in the caller's transaction.
+    The pointer only moves forward, so concurrent writers committing out of order cannot rewind it.
+    """
+    t = DAOConversation.__table__
+    newer = sqlalchemy.or_(t.c.last_message_id.is_(None), t.c.last_message_id < last_message_id)
+    db.execute(t.update().where(t.c.id == conversation_id).values(
+        message_count=t.c.message_count + added,
+        last_message_id=sqlalchemy.case((newer, last_message_id), else_=t.c.last_message_id),
+        last_message_at=sqlalchemy.case((newer, sqlalchemy.func.current_timestamp()), else_=t.c.last_message_at),
+    ))
+    _expire_state(db, [conversation_id])
+
+def touch_conversations_bulk(db: Session, added: Dict[int, int]):
+    """
+    touch_conversation for messages inserted in bulk (ids unknown): conversation_id -> messages added.
+    One UPDATE per distinct count; the pointer is read back from ix_messages_conversation_id_id.
+    """
+    t, m = DAOConversation.__table__, DAOMessage.__table__
+    by_count = {}
+    for conversation_id, n in added.items():
+        by_count.setdefault(n, []).append(conversation_id)
+    last_id = (sqlalchemy.select(sqlalchemy.func.max(m.c.id))
+               .where(m.c.conversation_id == t.c.id)
+               .scalar_subquery())
+    for n, conversation_ids in sorted(by_count.items()):
+        db.execute(t.update().where(t.c.id.in_(sorted(conversation_ids))).values(
+            message_count=t.c.message_count + n,
+            last_message_id=last_id,
+            last_message_at=sqlalchemy.func.current_timestamp(),
+        ))
+    _expire_state(db, added)
+
+def add_message(db: Session, conversation_id: int, sender: str, content: str, commit: bool = True,
+                channel_id: Optional[int] = None, channel_message_id: Optional[str] = None,
+                touch: bool = True) -> DAOMessage:
+    """
+    Store a message and update the conversation's last-message pointer and count.
+    Pass touch=False when the caller adds several messages and touches the conversation once.
+    """
+    msg = DAOMessage(conversation_id=conversation_id, sender=sender, content=content,
+                     channel_id=channel_id, channel_message_id=channel_message_id)
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    db.flush()
+    if touch:
+        touch_conversation(db, conversation_id, msg.id)
+    company_id = _company_id(db, conversation_id)
+    index_messages(db, [(company_id, msg.id, conversation_id, content)])
+    publish_after_commit(db, "message.created", company_id, conversation_id,
+                         message={"id": msg.id, "conversation_id": conversation_id, "sender": sender,
+                                  "content": content})
+    _save(db, commit)
     return msg
 
-def add_ai_autoreply(db: Session, conversation: DAOConversation, inbound_text: str) -> DAOMessage:
+
+def _first_inserted_id(db: Session, result, n: int) -> int:
+    """Id of the first row of a multi-row INSERT: MySQL reports it as lastrowid, SQLite the last row's."""
+    if db.get_bind().dialect.name == "sqlite":
+        return result.lastrowid - n + 1
+    return result.lastrowid
+
+
+def _inserted_messages(db: Session, rows: List[dict], first_id: int) -> List[Tuple[int, int, str]]:
+    """
+    (id, conversation_id, content) of the rows one multi-row INSERT of add_messages_bulk just stored.
+    SQLite numbers a statement's rows consecutively from first_id; MySQL may interleave them with
+    concurrent writers' (innodb_autoinc_lock_mode=2), so there they are read back.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return [(first_id + i, row["conversation_id"], row["content"]) for i, row in enumerate(rows)]
+    return _read_back_inserted(db, rows, first_id)
+
+
+def _read_back_inserted(db: Session, rows: List[dict], first_id: int) -> List[Tuple[int, int, str]]:
+    """
+    Match the statement's rows against those stored from first_id on in their conversations, in id
+    order, and stop once all are found: rows of concurrent writers are left to them (they index their own).
+    """
+    m = DAOMessage.__table__
+    wanted = Counter((row["conversation_id"], row["sender"], row["content"], row["channel_message_id"])
+                     for row in rows)
+    stored = db.execute(sqlalchemy.select(m.c.id, m.c.conversation_id, m.c.sender, m.c.content, m.c.channel_message_id)
+                        .where(m.c.conversation_id.in_(sorted({row["conversation_id"] for row in rows})),
+                               m.c.id >= first_id)
+                        .order_by(m.c.id)).all()
+    found = []
+    for message_id, *key in stored:
+        key = tuple(key)
+        if wanted[key] > 0:
+            wanted[key] -= 1
+            found.append((message_id, key[0], key[2]))
+            if len(found) == len(rows):
+                break
+    return found
+
+
+def add_messages_bulk(db: Session, rows: List[dict], chunk_size: int = 500):
+    """
+    Insert message rows (conversation_id, sender, content[, channel_id, channel_message_id])
+    with multi-row INSERTs; ids are not returned. Conversations are touched once each.
+    """
+    rows = [{"channel_id": None, "channel_message_id": None, **row} for row in rows]
+    inserted = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        result = db.execute(sqlalchemy.insert(DAOMessage.__table__).values(chunk))
+        if index_enabled():
+            inserted += _inserted_messages(db, chunk, _first_inserted_id(db, result, len(chunk)))
+    added = {}
+    for row in rows:
+        added[row["conversation_id"]] = added.get(row["conversation_id"], 0) + 1
+    touch_conversations_bulk(db, added)
+    if inserted:
+        index_messages(db, [(_company_id(db, conversation_id), message_id, conversation_id, content)
+                            for message_id, conversation_id, content in inserted])
+    # ids of a multi-row insert are not returned on MySQL: subscribers fetch the new messages over REST
+    for conversation_id, count in added.items():
+        publish_after_commit(db, "messages.appended", _company_id(db, conversation_id), conversation_id,
+                             count=count)
+
+
+def add_ai_autoreply(db: Session, conversation: DAOConversation, inbound_text: str,
+                     company_name: Optional[str] = None, commit: bool = True, touch: bool = True) -> DAOMessage:
     """
     Deterministic mock AI reply. No external calls.
+    Pass `company_name` when the caller already has it (e.g. from the tenant cache) to skip the lookup.
     """
-    company = db.query(DAOCompany).filter(DAOCompany.id == conversation.company_id).first()
-    brand = f" ({company.name})" if company and company.name else ""
-    content = f"Auto-reply from AI bot{brand}: I received your message: '{inbound_text}'"
-    msg = DAOMessage(conversation_id=conversation.id, sender="ai", content=content)
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
-    return msg
+    if company_name is None:
+        company = db.get(DAOCompany, conversation.company_id)
+        company_name = company.name if company else None
+    content = mock_reply_text(company_name, inbound_text)
+    return add_message(db, conversation_id=conversation.id, sender="ai", content=content, commit=commit, touch=touch)
 
 def toggle_conversation_owner(db: Session, conversation: DAOConversation) -> str:
     """
@@ -100,21 +392,33 @@ def toggle_conversation_owner(db: Session, conversation: DAOConversation) -> str
     If current owner is human/agent -> switch to AI.
     Returns the new role string: "human" or "ai".
     """
-    # figure out current role
+    # figure out current role (cached AI/default-agent ids avoid the user lookup)
     cur_role = None
     if conversation.owner_id:
-        owner = db.query(DAOUser).filter(DAOUser.id == conversation.owner_id).first()
-        cur_role = owner.role if owner else None
+        entry = get_tenant_cache().get(conversation.company_id)
+        if conversation.owner_id == entry.get("ai_user_id"):
+            cur_role = "ai"
+        elif conversation.owner_id == entry.get("default_agent_id"):
+            cur_role = "agent"
+        else:
+            owner = db.get(DAOUser, conversation.owner_id)
+            cur_role = owner.role if owner else None
 
     if cur_role == "agent":
         # switch to AI
-        bot = get_or_create_ai_user(db, conversation.company_id)
-        conversation.owner_id = bot.id
-        db.commit()
-        return "ai"
+        conversation.owner_id = resolve_ai_user_id(db, conversation.company_id)
+        new_role = "ai"
     else:
         # switch to human
-        agent = get_or_create_default_agent(db, conversation.company_id)
-        conversation.owner_id = agent.id
-        db.commit()
-        return "human"
+        conversation.owner_id = resolve_default_agent_id(db, conversation.company_id)
+        new_role = "human"
+    publish_after_commit(db, "conversation.owner_changed", conversation.company_id, conversation.id,
+                         owner_id=conversation.owner_id, owner_role=new_role)
+    db.commit()
+    return new_role
+
+def close_conversation(db: Session, conversation: DAOConversation):
+    """Close a conversation; the contact's next inbound message opens a new one."""
+    conversation.status = "closed"
+    publish_after_commit(db, "conversation.closed", conversation.company_id, conversation.id)
+    db.commit()
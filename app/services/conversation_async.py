@@ -0,0 +1,42 @@
+"""
+Async versions of the conversation services for AsyncSession callers.
+
+Each function runs the sync implementation through AsyncSession.run_sync: the code
+executes in a greenlet on the event loop and every DB round trip is awaited on the
+async driver, so no threadpool slot is held while waiting on MySQL. Keeping a single
+implementation means the transaction, cache and dedup behaviour stays identical.
+"""
+
+import functools
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import conversation, inbound, inbox, messages, projections
+
+
+def _async_version(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+get_or_create_company = _async_version(conversation.get_or_create_company)
+get_or_create_channel = _async_version(conversation.get_or_create_channel)
+get_or_create_ai_user = _async_version(conversation.get_or_create_ai_user)
+get_or_create_default_agent = _async_version(conversation.get_or_create_default_agent)
+get_or_create_contact_by_phone = _async_version(conversation.get_or_create_contact_by_phone)
+resolve_tenant = _async_version(conversation.resolve_tenant)
+find_open_conversation = _async_version(conversation.find_open_conversation)
+create_conversation = _async_version(conversation.create_conversation)
+add_message = _async_version(conversation.add_message)
+add_ai_autoreply = _async_version(conversation.add_ai_autoreply)
+toggle_conversation_owner = _async_version(conversation.toggle_conversation_owner)
+close_conversation = _async_version(conversation.close_conversation)
+
+process_inbound_message = _async_version(inbound.process_inbound_message)
+process_inbound_batch = _async_version(inbound.process_inbound_batch)
+list_messages_page = _async_version(messages.list_messages_page)
+list_inbox_page = _async_version(inbox.list_inbox_page)
+get_conversation_row = _async_version(projections.get_conversation_row)
+conversation_exists = _async_version(projections.conversation_exists)
+get_company_users = _async_version(projections.get_company_users)
@@ -0,0 +1,55 @@
+"""
+Duplicate-delivery detection for inbound webhooks.
+
+Providers retry deliveries, so the same channel_message_id can arrive more than once.
+A cache of recently stored deliveries (channel_id, channel_message_id) -> conversation_id
+answers most retries without touching the write path; the unique index
+uq_messages_channel_message is the final check for anything the cache has not seen.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from app.dao.message import DAOMessage
+from app.db_utils.filters import composite_in
+from app.db_utils.hooks import on_commit
+from app.services.cache import CacheBackend, backend_from_env
+
+recent_deliveries: CacheBackend = backend_from_env("INBOUND_DEDUP", default_size=100000, default_ttl=3600)
+
+
+def set_dedup_backend(backend: CacheBackend):
+    global recent_deliveries
+    recent_deliveries = backend
+
+
+def _key(channel_id: int, channel_message_id: str) -> str:
+    return f"delivery:{channel_id}:{channel_message_id}"
+
+
+def recent_delivery(channel_id: int, channel_message_id: str) -> Optional[int]:
+    """Conversation id of an already stored delivery, if it is still in the cache."""
+    return recent_deliveries.get(_key(channel_id, channel_message_id))
+
+
+def remember_delivery_after_commit(db: Session, channel_id: int, channel_message_id: str, conversation_id: int):
+    on_commit(db, lambda: recent_deliveries.set(_key(channel_id, channel_message_id), conversation_id))
+
+
+def stored_delivery(db: Session, channel_id: int, channel_message_id: str) -> Optional[int]:
+    """Conversation id of a stored delivery, looked up through uq_messages_channel_message."""
+    return db.execute(sqlalchemy.select(DAOMessage.conversation_id)
+                      .where(DAOMessage.channel_id == channel_id,
+                             DAOMessage.channel_message_id == channel_message_id)).scalar()
+
+
+def stored_deliveries(db: Session, keys: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], int]:
+    """Set-based stored_delivery: (channel_id, channel_message_id) -> conversation id for the stored ones."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    rows = db.execute(sqlalchemy.select(DAOMessage.channel_id, DAOMessage.channel_message_id, DAOMessage.conversation_id)
+                      .where(composite_in((DAOMessage.channel_id, DAOMessage.channel_message_id), keys)))
+    return {(channel_id, channel_message_id): conversation_id
+            for channel_id, channel_message_id, conversation_id in rows}
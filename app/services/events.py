@@ -0,0 +1,471 @@
+"""
+Real-time events for agent consoles (served as SSE by the routers).
+
+Services publish after commit (publish_after_commit); the broker fans each event out
+to the subscribers of its topics, "conversation:{id}" and "company:{id}".
+
+Brokers (EVENTS_BROKER):
+  - local: in-process fan-out with a bounded replay log per topic
+  - relay: events go through a shared transport and every worker fans out what it
+           reads back, so subscribers see events published by any worker.
+           EVENTS_TRANSPORT=memory is an in-process stand-in (tests, single host);
+           redis uses a Redis stream (needs the `redis` package)
+
+Subscribers resume with the id of the last event they saw (Last-Event-ID) and first get
+what they missed from the replay log, or a `reset` event when it is no longer there in
+full or would not fit in their buffer (the client then reloads over REST). Each
+subscriber has a bounded buffer: when a slow consumer lets it fill up, the buffer is
+dropped and the stream ends with a `lagged` event, so the client reconnects and catches
+up from the log instead of growing memory.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db_utils.hooks import on_commit
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+
+def conversation_topic(conversation_id: int) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def company_topic(company_id: int) -> str:
+    return f"company:{company_id}"
+
+
+class Subscription:
+    """Bounded buffer of (event_id, event) for one subscriber; consumed from the event loop."""
+
+    def __init__(self, broker, topics: Tuple[str, ...], maxsize: int):
+        self.broker = broker
+        self.topics = topics
+        self.maxsize = maxsize
+        self.lagged = False
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._last_key = None
+        self._held: Optional[list] = None  # live events that arrive while the missed ones are being read
+
+    def _offer(self, item, ordered: bool = True):
+        if self.lagged:
+            return
+        if self._held is not None and ordered:
+            self._held.append(item)
+            return
+        if ordered:
+            # the same event can reach a subscriber from the replay log and live; keep the first
+            key = _id_key(item[0])
+            if self._last_key is not None and key <= self._last_key:
+                return
+            self._last_key = key
+        if self._queue.qsize() >= self.maxsize:
+            # drop the backlog rather than let a slow consumer grow it; the client resumes from the log
+            self.lagged = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(_CLOSED)
+            return
+        self._queue.put_nowait(item)
+
+    def _replay(self, last_event_id: Optional[str], missed: List, gap: bool):
+        """
+        Queue the missed events, preceded by a `reset` if some were already dropped; when they
+        would not fit in the buffer, only the `reset` (the client reloads over REST instead).
+        """
+        if gap + len(missed) > self.maxsize:
+            gap, missed = True, []
+        if gap:
+            self._offer((last_event_id, {"type": "reset"}), ordered=False)
+        for item in missed:
+            self._offer(item)
+
+    async def next(self, timeout: Optional[float] = None):
+        """Next (event_id, event); None on timeout; raises StopAsyncIteration once closed or lagged."""
+        try:
+            item = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process fan-out. publish() may be called from any thread; subscribers live on the event loop."""
+
+    def __init__(self, buffer_size: int = 256, replay_size: int = 1000, max_topics: int = 10000):
+        self.buffer_size = buffer_size
+        self.replay_size = replay_size
+        self.max_topics = max_topics
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        # ids are "<epoch>-<seq>" (same shape as Redis stream ids); a new epoch after a restart
+        # tells resuming clients that the log they knew is gone
+        self._epoch = int(time.time() * 1000)
+        self._seq = 0
+        self._logs: OrderedDict = OrderedDict()  # topic -> deque[(seq, event)], LRU-bounded
+        self._dropped = {}  # topic -> seq of the newest event that fell out of its log
+        self._evicted_upto = 0  # newest seq of any topic log evicted by the LRU
+        self._subscribers = {}  # topic -> set[Subscription]
+        self.stats = {"published": 0, "delivered": 0, "lagged": 0}
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        with self._lock:
+            subscriptions = {sub for subs in self._subscribers.values() for sub in subs}
+            self._subscribers.clear()
+        for sub in subscriptions:
+            sub._queue.put_nowait(_CLOSED)
+
+    # -- publishing ---------------------------------------------------------
+    def publish(self, topics: Iterable[str], event: dict):
+        with self._lock:
+            self._seq += 1
+            self._append(self._seq, tuple(topics), event)
+
+    def _append(self, seq: int, topics: Tuple[str, ...], event: dict):
+        """Log and dispatch one event; caller holds the lock (so subscribe() sees no gap or duplicate)."""
+        self.stats["published"] += 1
+        targets = set()
+        for topic in topics:
+            log = self._logs.get(topic)
+            if log is None:
+                log = self._logs[topic] = deque(maxlen=self.replay_size)
+                while len(self._logs) > self.max_topics:
+                    evicted, evicted_log = self._logs.popitem(last=False)
+                    self._dropped.pop(evicted, None)
+                    if evicted_log:
+                        self._evicted_upto = max(self._evicted_upto, evicted_log[-1][0])
+            self._logs.move_to_end(topic)
+            if len(log) == log.maxlen:
+                self._dropped[topic] = log[0][0]
+            log.append((seq, event))
+            targets |= self._subscribers.get(topic, set())
+        if targets and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, targets, (f"{self._epoch}-{seq}", event))
+
+    def _deliver(self, targets, item):
+        for sub in targets:
+            was_lagged = sub.lagged
+            sub._offer(item)
+            if sub.lagged and not was_lagged:
+                self.stats["lagged"] += 1
+            elif not sub.lagged:
+                self.stats["delivered"] += 1
+
+    # -- subscribing --------------------------------------------------------
+    def _backlog(self, topics: Tuple[str, ...], after: int) -> Tuple[List, bool]:
+        """Logged events after `after` for these topics, and whether some of them were already dropped."""
+        events, gap = {}, False
+        for topic in topics:
+            log = self._logs.get(topic)
+            if log is None:
+                gap = gap or after < self._evicted_upto
+                continue
+            gap = gap or after < self._dropped.get(topic, 0)
+            for seq, event in log:
+                if seq > after:
+                    events[seq] = event
+        return [(f"{self._epoch}-{seq}", event) for seq, event in sorted(events.items())], gap
+
+    def subscribe(self, topics: Iterable[str], last_event_id: Optional[str] = None) -> Subscription:
+        """
+        New subscription; with `last_event_id` it first receives the missed events still in the log,
+        preceded by a `reset` event if some of them were already dropped (client reloads over REST);
+        only the `reset` when there are more than its buffer holds.
+        """
+        topics = tuple(topics)
+        sub = Subscription(self, topics, self.buffer_size)
+        with self._lock:
+            if last_event_id is not None:
+                try:
+                    epoch, after = _id_key(last_event_id)
+                except ValueError:
+                    epoch, after = None, 0
+                if epoch == self._epoch:
+                    backlog, gap = self._backlog(topics, after)
+                else:
+                    backlog, gap = [], True
+                sub._replay(last_event_id, backlog, gap)
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            for topic in sub.topics:
+                subs = self._subscribers.get(topic)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[topic]
+
+    def describe(self) -> dict:
+        with self._lock:
+            subscribers = len({sub for subs in self._subscribers.values() for sub in subs})
+            return {"broker": type(self).__name__, "subscribers": subscribers, "topics_logged": len(self._logs),
+                    **self.stats}
+
+
+class InMemoryTransport:
+    """
+    Shared append-only event stream, standing in for Redis when several brokers (workers)
+    run in one process, e.g. in tests. Same interface as RedisStreamTransport.
+    """
+
+    def __init__(self, maxlen: int = 10000):
+        self._entries = deque(maxlen=maxlen)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def append(self, payload: str) -> str:
+        with self._cond:
+            self._seq += 1
+            self._entries.append((str(self._seq), payload))
+            self._cond.notify_all()
+            return str(self._seq)
+
+    def read_after(self, last_id: Optional[str], block_ms: int = 0) -> List[Tuple[str, str]]:
+        """Entries after `last_id` (None: only new ones), waiting up to block_ms for one to arrive."""
+        with self._cond:
+            after = self._seq if last_id is None else int(last_id)
+            if block_ms and self._seq <= after:
+                self._cond.wait(block_ms / 1000)
+            return [(i, p) for i, p in self._entries if int(i) > after]
+
+    def oldest_id(self) -> Optional[str]:
+        with self._cond:
+            return self._entries[0][0] if self._entries else None
+
+    def last_id(self) -> Optional[str]:
+        with self._cond:
+            return str(self._seq) if self._seq else None
+
+
+class RedisStreamTransport:
+    """Redis stream (XADD/XREAD/XRANGE) shared by every worker. Needs the `redis` package."""
+
+    def __init__(self, url: str, stream: str = "omni:events", maxlen: int = 10000):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RedisStreamTransport requires the 'redis' package (pip install redis)") from e
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def append(self, payload: str) -> str:
+        return self._client.xadd(self.stream, {"e": payload}, maxlen=self.maxlen, approximate=True)
+
+    def read_after(self, last_id: Optional[str], block_ms: int = 0) -> List[Tuple[str, str]]:
+        if last_id is None:
+            result = self._client.xread({self.stream: "$"}, block=block_ms or None)
+        elif block_ms:
+            result = self._client.xread({self.stream: last_id}, block=block_ms)
+        else:
+            return [(i, f["e"]) for i, f in self._client.xrange(self.stream, min=f"({last_id}")]
+        return [(i, f["e"]) for _, entries in result for i, f in entries]
+
+    def oldest_id(self) -> Optional[str]:
+        entries = self._client.xrange(self.stream, count=1)
+        return entries[0][0] if entries else None
+
+    def last_id(self) -> Optional[str]:
+        entries = self._client.xrevrange(self.stream, count=1)
+        return entries[0][0] if entries else None
+
+
+class RelayBroker(LocalBroker):
+    """
+    Fan-out across workers: publish() only appends to the shared transport; a reader task
+    in every worker dispatches what it reads to its local subscribers (including events
+    this worker published). The transport is the replay log.
+    """
+
+    def __init__(self, transport, buffer_size: int = 256, block_ms: int = 1000):
+        super().__init__(buffer_size=buffer_size, replay_size=0, max_topics=0)
+        self.transport = transport
+        self.block_ms = block_ms
+        self._reader: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._replays = {}  # subscription -> task reading what it missed
+        # a blocking read must not hold a request thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="events-relay")
+
+    async def start(self):
+        await super().start()
+        self._stopping = False
+        self._cursor = self.transport.last_id() or "0"
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def stop(self):
+        self._stopping = True
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        replays = list(self._replays.values())
+        for task in replays:
+            task.cancel()
+        await asyncio.gather(*replays, return_exceptions=True)
+        await super().stop()
+
+    def publish(self, topics: Iterable[str], event: dict):
+        self.transport.append(json.dumps({"topics": list(topics), "event": event}))
+
+    async def _read_loop(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                entries = await loop.run_in_executor(self._executor, self.transport.read_after,
+                                                     self._cursor, self.block_ms)
+            except Exception:
+                logger.exception("event relay read failed")
+                await asyncio.sleep(1)
+                continue
+            for entry_id, payload in entries:
+                self._cursor = entry_id
+                message = json.loads(payload)
+                with self._lock:
+                    self.stats["published"] += 1
+                    targets = set()
+                    for topic in message["topics"]:
+                        targets |= self._subscribers.get(topic, set())
+                if targets:
+                    self._deliver(targets, (entry_id, message["event"]))
+
+    def subscribe(self, topics: Iterable[str], last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Registered first, so no event published meanwhile is missed; the missed events are then
+        read from the transport off the event loop, and live ones are held back until they are queued.
+        """
+        topics = tuple(topics)
+        sub = Subscription(self, topics, self.buffer_size)
+        if last_event_id is not None:
+            sub._held = []
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+        if last_event_id is not None:
+            task = asyncio.get_running_loop().create_task(self._resume(sub, last_event_id))
+            self._replays[sub] = task
+            task.add_done_callback(lambda _: self._replays.pop(sub, None))
+        return sub
+
+    async def _resume(self, sub: Subscription, last_event_id: str):
+        loop = asyncio.get_running_loop()
+        try:
+            oldest = await loop.run_in_executor(None, self.transport.oldest_id)
+            try:
+                gap = oldest is None or _id_key(oldest) > _id_key(last_event_id, next_of=True)
+                entries = await loop.run_in_executor(None, self.transport.read_after, last_event_id)
+            except ValueError:
+                gap, entries, last_event_id = True, [], None
+            missed = []
+            for entry_id, payload in entries:
+                message = json.loads(payload)
+                if set(message["topics"]) & set(sub.topics):
+                    missed.append((entry_id, message["event"]))
+        except Exception:
+            logger.exception("event relay replay failed")
+            gap, missed = True, []
+        held, sub._held = sub._held, None
+        sub._replay(last_event_id, missed, gap)
+        for item in held:
+            sub._offer(item)
+
+    def unsubscribe(self, sub: Subscription):
+        task = self._replays.pop(sub, None)
+        if task is not None:
+            task.cancel()
+        super().unsubscribe(sub)
+
+    def describe(self) -> dict:
+        stats = super().describe()
+        stats["transport"] = type(self.transport).__name__
+        return stats
+
+
+def _id_key(entry_id: str, next_of: bool = False):
+    """Sort key for event ids ("42", "<epoch>-<seq>" or Redis "1700000000000-3"); next_of gives the id right after."""
+    ms, _, seq = str(entry_id).partition("-")
+    key = (int(ms), int(seq or 0))
+    if next_of:
+        key = (key[0] + 1, 0) if not seq else (key[0], key[1] + 1)
+    return key
+
+
+def broker_from_env() -> LocalBroker:
+    buffer_size = int(os.getenv("EVENTS_SUBSCRIBER_BUFFER", "256"))
+    if os.getenv("EVENTS_BROKER", "local") == "relay":
+        if os.getenv("EVENTS_TRANSPORT", "memory") == "redis":
+            transport = RedisStreamTransport(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        else:
+            transport = InMemoryTransport(maxlen=int(os.getenv("EVENTS_REPLAY_SIZE", "10000")))
+        return RelayBroker(transport, buffer_size=buffer_size)
+    return LocalBroker(buffer_size=buffer_size, replay_size=int(os.getenv("EVENTS_REPLAY_SIZE", "1000")))
+
+
+broker: LocalBroker = broker_from_env()
+
+
+def set_broker(new_broker: LocalBroker) -> LocalBroker:
+    global broker
+    broker = new_broker
+    return broker
+
+
+def get_broker() -> LocalBroker:
+    return broker
+
+
+def publish_after_commit(db: Session, event_type: str, company_id: int, conversation_id: int, **data):
+    """Publish to the conversation and company topics once the current transaction commits."""
+    event = {"type": event_type, "company_id": company_id, "conversation_id": conversation_id, **data}
+    topics = (conversation_topic(conversation_id), company_topic(company_id))
+    on_commit(db, lambda: get_broker().publish(topics, event))
+
+
+async def sse_stream(topics: Iterable[str], last_event_id: Optional[str] = None, heartbeat: float = 15.0):
+    """
+    Server-Sent Events body for a subscription. Comments keep idle proxies from closing the
+    connection; a lagged subscriber gets a final `lagged` event and reconnects with Last-Event-ID.
+    """
+    sub = get_broker().subscribe(topics, last_event_id)
+    try:
+        yield "retry: 2000\n\n"
+        while True:
+            try:
+                item = await sub.next(timeout=heartbeat)
+            except StopAsyncIteration:
+                if sub.lagged:
+                    yield "event: lagged\ndata: {}\n\n"
+                return
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            event_id, event = item
+            head = f"id: {event_id}\n" if event_id is not None else ""
+            yield f"{head}event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+    finally:
+        # also runs when the client disconnects and the response task is cancelled
+        sub.close()
@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.dao.conversation import DAOConversation
+from app.services.conversation import (
+    resolve_tenant,
+    resolve_tenants,
+    upsert_contact_id,
+    upsert_contact_ids,
+    find_open_conversation,
+    find_open_conversations,
+    create_conversation,
+    create_conversations,
+    add_message,
+    add_messages_bulk,
+    add_ai_autoreply,
+    touch_conversation,
+)
+from app.services.ai_provider import mock_reply_text
+from app.services.dedup import recent_delivery, remember_delivery_after_commit, stored_delivery, stored_deliveries
+from app.services.reply_queue import ReplyJob, get_reply_workers
+
+
+@dataclass
+class InboundResult:
+    conversation: DAOConversation
+    created: bool  # True when this message opened a new conversation
+    duplicate: bool = False  # True when the delivery had already been stored (provider retry)
+
+
+def _duplicate(db: Session, conversation_id: int) -> Optional[InboundResult]:
+    conv = db.get(DAOConversation, conversation_id)
+    return InboundResult(conversation=conv, created=False, duplicate=True) if conv else None
+
+
+def process_inbound_message(db: Session, company_id: int, channel_id: int, phone: str, text: str,
+                            channel_message_id: Optional[str] = None) -> InboundResult:
+    """
+    Unit of work for one inbound message: every step flushes into a single
+    transaction which is committed once at the end (or rolled back as a whole).
+    Objects loaded along the way are reused instead of being fetched again.
+
+    Deliveries carrying a channel_message_id are idempotent: a retry returns the
+    original conversation without writing anything.
+    """
+    if channel_message_id:
+        conversation_id = recent_delivery(channel_id, channel_message_id)
+        if conversation_id is not None:
+            result = _duplicate(db, conversation_id)
+            if result:
+                return result
+
+    try:
+        # 1) ensure company/channel and an AI-bot owner exist (tenant cache, no queries when warm)
+        tenant = resolve_tenant(db, company_id=company_id, channel_id=channel_id)
+
+        # 2) ensure the contact exists (race-safe upsert)
+        contact_id = upsert_contact_id(db, company_id=tenant.company_id, phone=phone)
+
+        # 3) find existing conversation or create a new one
+        conv = find_open_conversation(db, company_id=tenant.company_id, channel_id=tenant.channel_id,
+                                      contact_id=contact_id)
+        created = conv is None
+        if created:
+            conv = create_conversation(db, company_id=tenant.company_id, channel_id=tenant.channel_id,
+                                       contact_id=contact_id, owner_id=tenant.ai_user_id, commit=False)
+
+        # 4) add inbound message (from contact)
+        # (flushing the insert hits uq_messages_channel_message for a retried delivery)
+        last = add_message(db, conversation_id=conv.id, sender="contact", content=text, commit=False,
+                           channel_id=tenant.channel_id, channel_message_id=channel_message_id, touch=False)
+        added = 1
+        if channel_message_id:
+            remember_delivery_after_commit(db, channel_id, channel_message_id, conv.id)
+
+        # 5) AI reply: queued for the reply workers when they run (AI_REPLY_MODE=queue),
+        #    otherwise the mock reply is written inline
+        if conv.owner_id == tenant.ai_user_id:
+            workers = get_reply_workers()
+            if workers is not None:
+                workers.enqueue(db, ReplyJob(company_id=tenant.company_id, conversation_id=conv.id,
+                                             ai_user_id=tenant.ai_user_id, company_name=tenant.company_name,
+                                             inbound_text=text))
+            else:
+                last = add_ai_autoreply(db, conversation=conv, inbound_text=text, company_name=tenant.company_name,
+                                        commit=False, touch=False)
+                added = 2
+
+        # 6) last-message pointer and count, once for both messages
+        touch_conversation(db, conv.id, last.id, added=added)
+
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        conversation_id = stored_delivery(db, channel_id, channel_message_id) if channel_message_id else None
+        if conversation_id is None:
+            raise
+        return _duplicate(db, conversation_id)
+    except Exception:
+        db.rollback()
+        raise
+    return InboundResult(conversation=conv, created=created)
+
+
+@dataclass
+class InboundItem:
+    company_id: int
+    channel_id: int
+    phone: str
+    text: str
+    channel_message_id: Optional[str] = None
+
+
+@dataclass
+class BatchItemResult:
+    status: str  # created | appended | duplicate | error
+    conversation_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+def _store_batch(db: Session, items: List[InboundItem]) -> List[BatchItemResult]:
+    results: List[Optional[BatchItemResult]] = [None] * len(items)
+
+    # 1) duplicates: recent-delivery cache, then one lookup for the rest, then repeats inside the batch
+    keyed = {i: (item.channel_id, item.channel_message_id) for i, item in enumerate(items) if item.channel_message_id}
+    for i, key in keyed.items():
+        conversation_id = recent_delivery(*key)
+        if conversation_id is not None:
+            results[i] = BatchItemResult("duplicate", conversation_id)
+    stored = stored_deliveries(db, [key for i, key in keyed.items() if results[i] is None])
+    first, repeats = {}, {}
+    for i, key in keyed.items():
+        if results[i] is None and key in stored:
+            results[i] = BatchItemResult("duplicate", stored[key])
+        elif results[i] is None and key in first:
+            # answered with the first delivery's conversation below; its own phone is never
+            # resolved, so a repeat cannot create a contact or an empty conversation
+            repeats[i] = first[key]
+            results[i] = BatchItemResult("duplicate")
+        first.setdefault(key, i)
+    todo = [i for i in range(len(items)) if results[i] is None]
+    if not todo:
+        return results
+
+    # 2) tenants and contacts, one round trip per table
+    tenants = resolve_tenants(db, {(items[i].company_id, items[i].channel_id) for i in todo})
+    contact_ids = upsert_contact_ids(db, {(tenants[items[i].company_id, items[i].channel_id].company_id, items[i].phone)
+                                          for i in todo})
+
+    def conversation_key(i):
+        tenant = tenants[items[i].company_id, items[i].channel_id]
+        return tenant.company_id, tenant.channel_id, contact_ids[tenant.company_id, items[i].phone]
+
+    # 3) open conversations, the missing ones created with one multi-row INSERT
+    convs = find_open_conversations(db, {conversation_key(i) for i in todo})
+    new_keys = sorted({conversation_key(i) for i in todo} - convs.keys())
+    convs.update(create_conversations(db, [
+        {"company_id": company_id, "channel_id": channel_id, "contact_id": contact_id,
+         "owner_id": tenants[company_id, channel_id].ai_user_id}
+        for company_id, channel_id, contact_id in new_keys]))
+
+    # 4) inbound messages and inline AI replies in conversation order, queued replies as jobs
+    workers = get_reply_workers()
+    rows, opened = [], set(new_keys)
+    for i in todo:
+        item, tenant, key = items[i], tenants[items[i].company_id, items[i].channel_id], conversation_key(i)
+        conv = convs[key]
+        results[i] = BatchItemResult("created" if key in opened else "appended", conv.id)
+        opened.discard(key)
+        rows.append({"conversation_id": conv.id, "sender": "contact", "content": item.text,
+                     "channel_id": tenant.channel_id, "channel_message_id": item.channel_message_id})
+        if item.channel_message_id:
+            remember_delivery_after_commit(db, item.channel_id, item.channel_message_id, conv.id)
+        if conv.owner_id == tenant.ai_user_id:
+            if workers is not None:
+                workers.enqueue(db, ReplyJob(company_id=tenant.company_id, conversation_id=conv.id,
+                                             ai_user_id=tenant.ai_user_id, company_name=tenant.company_name,
+                                             inbound_text=item.text))
+            else:
+                rows.append({"conversation_id": conv.id, "sender": "ai",
+                             "content": mock_reply_text(tenant.company_name, item.text)})
+    for i, first_i in repeats.items():
+        results[i].conversation_id = results[first_i].conversation_id
+    add_messages_bulk(db, rows)
+    return results
+
+
+def process_inbound_batch(db: Session, items: List[InboundItem]) -> List[BatchItemResult]:
+    """
+    Bulk version of process_inbound_message: tenants, contacts and conversations are resolved
+    with set-based queries and every message (plus inline AI replies) goes in with multi-row
+    INSERTs, all in one transaction. Returns one result per item, in order.
+
+    A delivery that a concurrent request stored first trips uq_messages_channel_message;
+    the batch is then rolled back and retried once, which reports it as a duplicate.
+    """
+    for attempt in (1, 2):
+        try:
+            results = _store_batch(db, items)
+            db.commit()
+            return results
+        except IntegrityError:
+            db.rollback()
+            if attempt == 2 or not any(item.channel_message_id for item in items):
+                raise
+        except Exception:
+            db.rollback()
+            raise
@@ -0,0 +1,34 @@
+"""
+Company inbox: a company's conversations by recency, read from the denormalized
+conversation state (status, last_message_id, message_count) without touching messages.
+"""
+
+from typing import List, Optional, Tuple
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from app.dao.conversation import DAOConversation
+
+INBOX_FIELDS = ("id", "channel_id", "contact_id", "owner_id", "status", "last_message_id", "last_message_at",
+                "message_count")  # InboxConversationOut
+INBOX_COLUMNS = tuple(getattr(DAOConversation, f) for f in INBOX_FIELDS)
+
+
+def list_inbox_page(db: Session, company_id: int, status: str = "open",
+                    before_message_id: Optional[int] = None, limit: int = 50) -> Tuple[List[dict], bool]:
+    """
+    One keyset page of conversations, most recent activity first.
+
+    Message ids only grow, so last_message_id orders conversations by recency and is the cursor:
+    the next page is the conversations whose last message is older than `before_message_id`.
+    Served as a range scan of ix_conversations_company_status_last_message.
+    Conversations that have no message yet are not listed.
+    """
+    stmt = (sqlalchemy.select(*INBOX_COLUMNS)
+            .where(DAOConversation.company_id == company_id,
+                   DAOConversation.status == status,
+                   DAOConversation.last_message_id.is_not(None)))
+    if before_message_id is not None:
+        stmt = stmt.where(DAOConversation.last_message_id < before_message_id)
+    rows = db.execute(stmt.order_by(DAOConversation.last_message_id.desc()).limit(limit + 1)).all()
+    return [dict(zip(INBOX_FIELDS, r)) for r in rows[:limit]], len(rows) > limit
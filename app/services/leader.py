@@ -0,0 +1,52 @@
+"""
+One process per host runs the periodic jobs (archival, search index merge).
+
+Under gunicorn every worker runs the app lifespan, so without this each of them would
+start its own archiver and merger. The jobs call is_leader() before each run: the first
+process to take an exclusive lock on JOBS_LOCK_FILE runs them, the others skip the run.
+The OS drops the lock when that process exits, and another worker takes it on its next
+check. Several hosts do not share the lock: set the job intervals to 0 on all but one,
+or run the jobs from cron with their CLIs.
+"""
+
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single local process
+    fcntl = None
+
+_lock = threading.Lock()
+_lock_file = None
+
+
+def lock_path() -> str:
+    return os.getenv("JOBS_LOCK_FILE") or os.path.join(tempfile.gettempdir(), "omni-jobs.lock")
+
+
+def is_leader() -> bool:
+    """Whether this process runs the periodic jobs; takes the lock if no live process holds it."""
+    global _lock_file
+    with _lock:
+        if _lock_file is not None or fcntl is None:
+            return True
+        f = open(lock_path(), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.write(str(os.getpid()))
+        f.flush()
+        _lock_file = f
+        return True
+
+
+def release_leadership():
+    global _lock_file
+    with _lock:
+        if _lock_file is not None:
+            _lock_file.close()  # closing the file drops the lock
+            _lock_file = None
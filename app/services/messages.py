@@ -0,0 +1,108 @@
+"""
+Read paths for a conversation's message history.
+Only the columns MessageOut needs are selected; rows become plain dicts (no ORM objects)
+that the routes encode straight to JSON (app/services/serialization.py).
+Histories partly moved to the archive tier (app/services/archive.py) are merged back in.
+"""
+
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import sqlalchemy
+from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
+
+from app.dao.message import DAOMessage
+from app.db_utils.db_connection import get_sessionmaker
+from app.db_utils.deps import pool_slot
+from app.services.archive import archived_upto, read_archived
+from app.services.serialization import dumps
+
+MESSAGE_FIELDS = ("id", "conversation_id", "sender", "content")  # MessageOut
+MESSAGE_COLUMNS = tuple(getattr(DAOMessage, f) for f in MESSAGE_FIELDS)
+
+
+def message_dicts(rows) -> List[dict]:
+    # zip over the row tuple: several times cheaper than named attribute access on Row
+    return [dict(zip(MESSAGE_FIELDS, r)) for r in rows]
+
+
+def list_messages_page(db: Session, conversation_id: int, after_id: Optional[int] = None,
+                       before_id: Optional[int] = None, limit: int = 100) -> Tuple[List[dict], bool]:
+    """
+    One keyset page of messages in ascending id order, served by ix_messages_conversation_id_id.
+    Without `after_id` the page is the `limit` messages right before `before_id`, or the newest
+    ones when there is no cursor at all (scrolling back); after_id=0 starts from the oldest.
+    Returns (rows, has_more) where has_more says whether rows exist past the page in the scroll direction.
+    """
+    stmt = sqlalchemy.select(*MESSAGE_COLUMNS).where(DAOMessage.conversation_id == conversation_id)
+    if after_id is not None:
+        stmt = stmt.where(DAOMessage.id > after_id)
+    if before_id is not None:
+        stmt = stmt.where(DAOMessage.id < before_id)
+
+    backwards = after_id is None
+    order = DAOMessage.id.desc() if backwards else DAOMessage.id.asc()
+    rows = message_dicts(db.execute(stmt.order_by(order).limit(limit + 1)).all())
+
+    upto_id = archived_upto(db, conversation_id)
+    if upto_id is not None and (after_id is None or after_id < upto_id):
+        # archived ids are all <= upto_id; on an id in both (archival interrupted) the live row wins
+        merged = {r["id"]: r for r in read_archived(conversation_id, upto_id, after_id=after_id,
+                                                    before_id=before_id, limit=limit + 1, descending=backwards)}
+        merged.update((r["id"], r) for r in rows)
+        rows = [merged[i] for i in sorted(merged, reverse=backwards)[:limit + 1]]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    return rows, has_more
+
+
+def page_headers(rows: List[dict], has_more: bool, after_id: Optional[int], before_id: Optional[int]) -> dict:
+    """Cursor of the next page: X-Next-After-Id when scrolling forward (after_id), X-Next-Before-Id otherwise."""
+    if not (has_more and rows):
+        return {}
+    if after_id is None:
+        return {"X-Next-Before-Id": str(rows[0]["id"])}
+    return {"X-Next-After-Id": str(rows[-1]["id"])}
+
+
+def stream_messages_ndjson(conversation_id: int, batch_size: int = 1000) -> Iterator[bytes]:
+    """
+    Full history as NDJSON, pulled in server-side batches (stream_results/yield_per)
+    so memory stays flat however long the conversation is. Uses its own session because
+    the response body is produced after the request-scoped session has been closed.
+    """
+    stmt = (sqlalchemy.select(*MESSAGE_COLUMNS)
+            .where(DAOMessage.conversation_id == conversation_id)
+            .order_by(DAOMessage.id.asc())
+            .execution_options(yield_per=batch_size))
+    with get_sessionmaker()() as db:
+        upto_id = archived_upto(db, conversation_id)
+        if upto_id is not None:
+            # the archived part first (all ids <= upto_id), a block at a time
+            after_id = None
+            while True:
+                rows = read_archived(conversation_id, upto_id, after_id=after_id, limit=batch_size)
+                if not rows:
+                    break
+                yield b"".join(dumps(r) + b"\n" for r in rows)
+                after_id = rows[-1]["id"]
+            stmt = stmt.where(DAOMessage.id > upto_id)
+        result = db.execute(stmt)
+        for batch in result.partitions():
+            yield b"".join(dumps(r) + b"\n" for r in message_dicts(batch))
+
+
+async def stream_messages_ndjson_pooled(conversation_id: int, batch_size: int = 1000) -> AsyncIterator[bytes]:
+    """
+    stream_messages_ndjson holding a pool slot (app/db_utils/deps.py) for as long as its session
+    reads, like request-scoped sessions do; the batches are read in the threadpool.
+    """
+    async with pool_slot():
+        chunks = stream_messages_ndjson(conversation_id, batch_size)
+        try:
+            async for chunk in iterate_in_threadpool(chunks):
+                yield chunk
+        finally:
+            chunks.close()  # client gone: release the session before the slot
@@ -0,0 +1,261 @@
+"""
+Process metrics in the Prometheus text format, served on GET /metrics.
+
+A small dependency-free registry (counters and histograms with labels) plus the ASGI
+middleware that times each request and collects what the SQL hooks recorded for it
+(app/db_utils/instrumentation.py): statements, DB time, commits and pool wait.
+Requests slower than METRICS_SLOW_REQUEST_MS are logged with their SQL.
+
+Recording is a few dict lookups and additions per request/statement, so it stays on in
+production (METRICS_ENABLED=0 turns it off); see app/benchmarks/bench_instrumentation.py.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from app.db_utils.async_db import async_pool_stats
+from app.db_utils.db_connection import load_db_config, pool_stats
+from app.db_utils.instrumentation import RequestStats, current_request_stats, engine_totals
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple = ()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0]
+            row[i] += 1
+            row[-1] += value
+
+    def count(self, labels: Tuple = ()) -> int:
+        row = self._values.get(labels)
+        return sum(row[:-1]) if row else 0
+
+    def sum(self, labels: Tuple = ()) -> float:
+        row = self._values.get(labels)
+        return row[-1] if row else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(row)) for labels, row in self._values.items())
+        for labels, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), row[:-1]):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """Callback producing exposition lines at scrape time (gauges read from elsewhere)."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status.",
+                                 ("method", "route", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_statements = registry.histogram("http_request_db_statements", "SQL statements per HTTP request.",
+                                     ("method", "route"), buckets=COUNT_BUCKETS)
+http_db_time = registry.histogram("http_request_db_seconds", "Time spent in SQL statements per HTTP request.",
+                                  ("method", "route"))
+http_commits = registry.histogram("http_request_db_commits", "Commits per HTTP request.",
+                                  ("method", "route"), buckets=COUNT_BUCKETS)
+http_pool_wait = registry.histogram("http_request_db_pool_wait_seconds",
+                                    "Time a request waited for a database connection.", ("method", "route"))
+http_slow_requests = registry.counter("http_slow_requests_total", "Requests slower than METRICS_SLOW_REQUEST_MS.",
+                                      ("method", "route"))
+
+
+def _family(name: str, kind: str, documentation: str, samples: Iterable[Tuple[str, float]]) -> List[str]:
+    samples = list(samples)
+    if not samples:
+        return []
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"] + \
+        [f'{name}{{db_label="{label}"}} {_format_value(value)}' for label, value in samples]
+
+
+def collect_db_metrics() -> List[str]:
+    """Per-engine totals from the SQL hooks and the current state of every connection pool."""
+    totals = sorted(engine_totals().items())
+    pools = [pool_stats(label) for label in load_db_config()] + [async_pool_stats(label) for label in load_db_config()]
+    pools = [(p["db_label"] + (":async" if p.get("async") else ""), p) for p in pools if p["initialized"]]
+    lines = []
+    for name, attr, documentation in (
+            ("db_statements_total", "statements", "SQL statements executed."),
+            ("db_statement_seconds_total", "db_time", "Time spent executing SQL statements."),
+            ("db_statement_errors_total", "errors", "SQL statements that raised."),
+            ("db_commits_total", "commits", "Committed transactions."),
+            ("db_connections_created_total", "connects", "New DBAPI connections opened by the pool.")):
+        lines += _family(name, "counter", documentation, ((label, getattr(t, attr)) for label, t in totals))
+    for name, key, kind, documentation in (
+            ("db_pool_size", "pool_size", "gauge", "Configured pool size."),
+            ("db_pool_checked_out", "checked_out", "gauge", "Connections currently checked out."),
+            ("db_pool_overflow", "overflow", "gauge", "Overflow connections in use."),
+            ("db_pool_checkouts_total", "checkouts", "counter", "Pool checkouts."),
+            ("db_pool_wait_seconds_total", "wait_seconds_total", "counter", "Time spent waiting on pool checkout."),
+            ("db_pool_wait_seconds_max", "wait_seconds_max", "gauge", "Longest pool checkout wait.")):
+        lines += _family(name, kind, documentation, ((label, p[key]) for label, p in pools if key in p))
+    return lines
+
+
+registry.add_collector(collect_db_metrics)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Times each HTTP request and records its SQL counters per route template
+    (/conversations/{conversation_id}, not the concrete path, to bound cardinality).
+    Event streams are counted but kept out of the latency histograms.
+    """
+
+    def __init__(self, app, slow_request_ms: float = None, slow_log_statements: int = None):
+        self.app = app
+        if slow_request_ms is None:
+            slow_request_ms = float(os.getenv("METRICS_SLOW_REQUEST_MS", "1000"))
+        if slow_log_statements is None:
+            slow_log_statements = int(os.getenv("METRICS_SLOW_LOG_STATEMENTS", "50"))
+        self.slow_request_s = slow_request_ms / 1000 if slow_request_ms > 0 else None
+        self.slow_log_statements = slow_log_statements
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(keep_statements=self.slow_log_statements if self.slow_request_s else 0)
+        token = current_request_stats.set(stats)
+        status = [500, False]  # status code, is an event stream
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        status[1] = True
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request_stats.reset(token)
+            self._record(scope, status[0], status[1], elapsed, stats)
+
+    def _record(self, scope, status_code: int, streaming: bool, elapsed: float, stats: RequestStats):
+        method, route = scope["method"], _route_label(scope)
+        labels = (method, route)
+        http_requests.inc((method, route, str(status_code)))
+        if streaming:
+            return
+        http_latency.observe(elapsed, labels)
+        http_statements.observe(stats.statements, labels)
+        http_db_time.observe(stats.db_time, labels)
+        http_commits.observe(stats.commits, labels)
+        http_pool_wait.observe(stats.pool_wait, labels)
+        if self.slow_request_s is not None and elapsed >= self.slow_request_s:
+            http_slow_requests.inc(labels)
+            self._log_slow(method, scope.get("path", route), status_code, elapsed, stats)
+
+    def _log_slow(self, method: str, path: str, status_code: int, elapsed: float, stats: RequestStats):
+        lines = [f"  {duration * 1000:8.2f} ms  {' '.join(statement.split())[:500]}"
+                 for statement, duration in stats.statement_log]
+        if stats.statements > len(stats.statement_log):
+            lines.append(f"  ... {stats.statements - len(stats.statement_log)} more")
+        logger.warning("slow request %s %s -> %s in %.1f ms: %d statements, %.1f ms in SQL, %d commits, "
+                       "%.1f ms pool wait\n%s", method, path, status_code, elapsed * 1000, stats.statements,
+                       stats.db_time * 1000, stats.commits, stats.pool_wait * 1000, "\n".join(lines))
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,32 @@
+"""
+Single-row and small-list reads for the API: Core selects of only the response columns,
+returned as plain dicts (no ORM objects, no identity map bookkeeping).
+"""
+
+from typing import List, Optional
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from app.dao.conversation import DAOConversation
+from app.dao.users import DAOUser
+
+CONVERSATION_FIELDS = ("id", "company_id", "channel_id", "contact_id", "owner_id", "status")  # ConversationOut
+USER_FIELDS = ("id", "name", "role")
+
+
+def conversation_exists(db: Session, conversation_id: int) -> bool:
+    return db.execute(sqlalchemy.select(DAOConversation.id).where(DAOConversation.id == conversation_id)).first() \
+        is not None
+
+
+def get_conversation_row(db: Session, conversation_id: int) -> Optional[dict]:
+    row = db.execute(sqlalchemy.select(*(getattr(DAOConversation, f) for f in CONVERSATION_FIELDS))
+                     .where(DAOConversation.id == conversation_id)).first()
+    return dict(zip(CONVERSATION_FIELDS, row)) if row is not None else None
+
+
+def get_company_users(db: Session, company_id: int) -> List[dict]:
+    rows = db.execute(sqlalchemy.select(DAOUser.id, DAOUser.name, DAOUser.role)
+                      .where(DAOUser.company_id == company_id)
+                      .order_by(DAOUser.id.asc())).all()
+    return [dict(zip(USER_FIELDS, r)) for r in rows]
@@ -0,0 +1,382 @@
+"""
+AI reply jobs, decoupled from the inbound webhook response (AI_REPLY_MODE=queue).
+
+The webhook enqueues a ReplyJob inside its transaction and returns right away;
+a pool of asyncio workers generates the replies through the AI provider and
+persists them in batches. Backends (AI_REPLY_QUEUE_BACKEND):
+  - memory: asyncio queue inside the worker process (fast, lost on restart)
+  - outbox: reply_jobs table written in the inbound transaction, so pending
+            replies survive restarts; stale claims are picked up again after a lease,
+            done jobs are deleted after AI_REPLY_DONE_RETENTION_HOURS
+
+Per-company concurrency caps the AI calls in flight for one tenant, failed calls
+are retried with exponential backoff, and a full queue rejects new jobs
+(ReplyQueueFull -> 503 + Retry-After) instead of growing without bound.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import anyio
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from app.dao.conversation import DAOConversation
+from app.dao.reply_job import DAOReplyJob
+from app.db_utils.db_connection import get_sessionmaker
+from app.db_utils.hooks import on_commit, on_rollback
+from app.services.ai_provider import provider_from_env
+from app.services.conversation import add_message
+
+logger = logging.getLogger(__name__)
+
+
+class ReplyQueueFull(Exception):
+    """Raised at enqueue time when the backlog is at capacity (backpressure)."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("AI reply queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class ReplyJob:
+    company_id: int
+    conversation_id: int
+    ai_user_id: int
+    company_name: Optional[str]
+    inbound_text: str
+    attempts: int = 0
+    id: Optional[int] = None  # outbox row id
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+class InMemoryReplyQueue:
+    """asyncio queue living in the worker process."""
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._lock = threading.Lock()
+        self._depth = 0  # queued + in flight
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def depth(self) -> int:
+        return self._depth
+
+    def enqueue(self, db: Session, job: ReplyJob):
+        # the slot is taken now, under the lock, so concurrent requests cannot overshoot maxsize
+        with self._lock:
+            if self._depth >= self.maxsize:
+                raise ReplyQueueFull()
+            self._depth += 1
+        on_rollback(db, lambda: self._release(1))
+        # only hand the job to workers once the inbound message is committed
+        on_commit(db, lambda: self._loop.call_soon_threadsafe(self._queue.put_nowait, job))
+
+    async def claim(self, max_jobs: int, timeout: float) -> List[ReplyJob]:
+        try:
+            jobs = [await asyncio.wait_for(self._queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while len(jobs) < max_jobs and not self._queue.empty():
+            jobs.append(self._queue.get_nowait())
+        return jobs
+
+    def complete(self, db: Session, jobs: List[ReplyJob]):
+        on_commit(db, lambda: self._release(len(jobs)))
+
+    async def retry(self, job: ReplyJob, delay: float, error: str):
+        self._loop.call_later(delay, self._queue.put_nowait, job)
+
+    async def fail(self, job: ReplyJob, error: str):
+        self._release(1)
+
+    def _release(self, n: int):
+        with self._lock:
+            self._depth -= n
+
+
+class OutboxReplyQueue:
+    """reply_jobs table; claims are leased so a crashed worker's jobs are retried."""
+
+    def __init__(self, maxsize: int = 10000, poll_interval: float = 0.2, lease_seconds: int = 120,
+                 count_interval: float = 1.0, done_retention_seconds: float = 86400,
+                 purge_interval: float = 60.0, purge_batch: int = 1000):
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.count_interval = count_interval
+        self.done_retention_seconds = done_retention_seconds  # 0 keeps done jobs
+        self.purge_interval = purge_interval
+        self.purge_batch = purge_batch
+        self._pending_estimate = 0  # refreshed by the pollers; avoids a COUNT per webhook
+        self._maintenance_lock = threading.Lock()
+        self._next_count = self._next_purge = 0.0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        pass
+
+    def depth(self) -> int:
+        return self._pending_estimate
+
+    def enqueue(self, db: Session, job: ReplyJob):
+        if self._pending_estimate >= self.maxsize:
+            raise ReplyQueueFull(retry_after=5)
+        db.add(DAOReplyJob(company_id=job.company_id, conversation_id=job.conversation_id,
+                           ai_user_id=job.ai_user_id, company_name=job.company_name,
+                           inbound_text=job.inbound_text, status="pending", attempts=0,
+                           available_at=_utcnow()))
+
+    def _claim_sync(self, max_jobs: int) -> List[ReplyJob]:
+        t = DAOReplyJob.__table__
+        now = _utcnow()
+        token = str(uuid.uuid4())
+        with get_sessionmaker()() as db:
+            claimable = sqlalchemy.or_(
+                sqlalchemy.and_(t.c.status == "pending", t.c.available_at <= now),
+                sqlalchemy.and_(t.c.status == "running", t.c.available_at <= now),  # expired lease
+            )
+            # one ix_reply_jobs_status_available range per status, read in index order (no sort)
+            ids = []
+            for status in ("pending", "running"):
+                if len(ids) < max_jobs:
+                    ids += db.execute(sqlalchemy.select(t.c.id)
+                                      .where(t.c.status == status, t.c.available_at <= now)
+                                      .order_by(t.c.available_at, t.c.id)
+                                      .limit(max_jobs - len(ids))).scalars().all()
+            if not ids:
+                return []
+            lease_until = now + datetime.timedelta(seconds=self.lease_seconds)
+            # the status/available_at re-check makes concurrent claimers race-safe
+            db.execute(t.update().where(t.c.id.in_(ids), claimable)
+                       .values(status="running", claim_token=token, available_at=lease_until))
+            rows = db.execute(sqlalchemy.select(t).where(t.c.id.in_(ids), t.c.claim_token == token)).all()
+            db.commit()
+        return [ReplyJob(company_id=r.company_id, conversation_id=r.conversation_id, ai_user_id=r.ai_user_id,
+                         company_name=r.company_name, inbound_text=r.inbound_text, attempts=r.attempts, id=r.id)
+                for r in rows]
+
+    def _maintain_sync(self):
+        """
+        Done by one poller at a time, every few seconds rather than on every poll: refresh the
+        backlog estimate and delete done jobs older than the retention, a batch per run.
+        """
+        if not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            t = DAOReplyJob.__table__
+            with get_sessionmaker()() as db:
+                if now >= self._next_count:
+                    self._next_count = now + self.count_interval
+                    # counting stops at maxsize: an ix_reply_jobs_status_available range of bounded length
+                    pending = sqlalchemy.select(t.c.id).where(t.c.status == "pending").limit(self.maxsize).subquery()
+                    self._pending_estimate = db.execute(sqlalchemy.select(sqlalchemy.func.count())
+                                                        .select_from(pending)).scalar()
+                if self.done_retention_seconds > 0 and now >= self._next_purge:
+                    self._next_purge = now + self.purge_interval
+                    # a done job's available_at is when it was claimed, at most a lease before it finished
+                    cutoff = _utcnow() - datetime.timedelta(seconds=self.done_retention_seconds)
+                    ids = db.execute(sqlalchemy.select(t.c.id)
+                                     .where(t.c.status == "done", t.c.available_at < cutoff)
+                                     .order_by(t.c.available_at, t.c.id).limit(self.purge_batch)).scalars().all()
+                    if ids:
+                        db.execute(t.delete().where(t.c.id.in_(ids)))
+                        if len(ids) == self.purge_batch:
+                            self._next_purge = now  # more to delete: next poll takes another batch
+                db.commit()
+        finally:
+            self._maintenance_lock.release()
+
+    async def claim(self, max_jobs: int, timeout: float) -> List[ReplyJob]:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            await anyio.to_thread.run_sync(self._maintain_sync)
+            jobs = await anyio.to_thread.run_sync(self._claim_sync, max_jobs)
+            if jobs or asyncio.get_running_loop().time() >= deadline:
+                return jobs
+            await asyncio.sleep(self.poll_interval)
+
+    def complete(self, db: Session, jobs: List[ReplyJob]):
+        t = DAOReplyJob.__table__
+        db.execute(t.update().where(t.c.id.in_([j.id for j in jobs])).values(status="done", claim_token=None))
+
+    def _update_sync(self, job_id: int, **values):
+        t = DAOReplyJob.__table__
+        with get_sessionmaker()() as db:
+            db.execute(t.update().where(t.c.id == job_id).values(**values))
+            db.commit()
+
+    async def retry(self, job: ReplyJob, delay: float, error: str):
+        available_at = _utcnow() + datetime.timedelta(seconds=delay)
+        await anyio.to_thread.run_sync(lambda: self._update_sync(
+            job.id, status="pending", attempts=job.attempts, available_at=available_at,
+            claim_token=None, last_error=error))
+
+    async def fail(self, job: ReplyJob, error: str):
+        await anyio.to_thread.run_sync(lambda: self._update_sync(
+            job.id, status="failed", attempts=job.attempts, claim_token=None, last_error=error))
+
+
+class ReplyWorkerPool:
+    def __init__(self, backend, provider, workers: int = 4, per_company_limit: int = 2, batch_size: int = 16,
+                 max_attempts: int = 3, retry_backoff: float = 0.5, drain_timeout: float = 5.0):
+        self.backend = backend
+        self.provider = provider
+        self.workers = workers
+        self.per_company_limit = per_company_limit
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.drain_timeout = drain_timeout
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._company_slots = None
+        # updated from request and threadpool threads as well as the event loop
+        self._stats_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "completed": 0, "skipped": 0, "retried": 0, "failed": 0, "batches": 0}
+
+    def _count(self, **deltas: int):
+        with self._stats_lock:
+            for key, n in deltas.items():
+                self.stats[key] += n
+
+    def enqueue(self, db: Session, job: ReplyJob):
+        self.backend.enqueue(db, job)
+        self._count(enqueued=1)
+
+    async def start(self):
+        self.backend.bind(asyncio.get_running_loop())
+        self._company_slots = defaultdict(lambda: asyncio.Semaphore(self.per_company_limit))
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop claiming new jobs, let in-flight batches finish for up to drain_timeout seconds."""
+        self._stopping = True
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                jobs = await self.backend.claim(self.batch_size, timeout=0.5)
+                if jobs:
+                    await self._process(jobs)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("reply worker iteration failed")
+                await asyncio.sleep(self.retry_backoff)
+
+    async def _generate(self, job: ReplyJob) -> str:
+        async with self._company_slots[job.company_id]:
+            return await self.provider.generate_reply(job.company_name, job.inbound_text)
+
+    async def _process(self, jobs: List[ReplyJob]):
+        results = await asyncio.gather(*(self._generate(job) for job in jobs), return_exceptions=True)
+        replies = []
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                await self._retry_or_fail(job, repr(result))
+            else:
+                replies.append((job, result))
+        if not replies:
+            return
+        try:
+            await anyio.to_thread.run_sync(self._persist, replies)
+        except Exception as e:
+            logger.exception("persisting AI replies failed")
+            for job, _ in replies:
+                await self._retry_or_fail(job, repr(e))
+
+    async def _retry_or_fail(self, job: ReplyJob, error: str):
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            self._count(failed=1)
+            await self.backend.fail(job, error)
+        else:
+            self._count(retried=1)
+            await self.backend.retry(job, self.retry_backoff * 2 ** (job.attempts - 1), error)
+
+    def _persist(self, replies):
+        completed = skipped = 0
+        with get_sessionmaker()() as db:
+            for job, text in replies:
+                conv = db.get(DAOConversation, job.conversation_id)
+                if conv is None or conv.owner_id != job.ai_user_id:
+                    skipped += 1  # handed over to a human meanwhile
+                    continue
+                add_message(db, conversation_id=conv.id, sender="ai", content=text, commit=False)
+                completed += 1
+            self.backend.complete(db, [job for job, _ in replies])
+            db.commit()
+        self._count(completed=completed, skipped=skipped, batches=1)
+
+    def describe(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {"backend": type(self.backend).__name__, "workers": self.workers,
+                "per_company_limit": self.per_company_limit, "depth": self.backend.depth(), **stats}
+
+
+_pool: Optional[ReplyWorkerPool] = None
+
+
+def get_reply_workers() -> Optional[ReplyWorkerPool]:
+    """The running worker pool, or None when replies are generated inline."""
+    return _pool
+
+
+def reply_workers_from_env() -> Optional[ReplyWorkerPool]:
+    if os.getenv("AI_REPLY_MODE", "inline") != "queue":
+        return None
+    size = int(os.getenv("AI_REPLY_QUEUE_SIZE", "1000"))
+    if os.getenv("AI_REPLY_QUEUE_BACKEND", "memory") == "outbox":
+        backend = OutboxReplyQueue(maxsize=size, done_retention_seconds=3600 * float(
+            os.getenv("AI_REPLY_DONE_RETENTION_HOURS", "24")))
+    else:
+        backend = InMemoryReplyQueue(maxsize=size)
+    return ReplyWorkerPool(
+        backend, provider_from_env(),
+        workers=int(os.getenv("AI_REPLY_WORKERS", "4")),
+        per_company_limit=int(os.getenv("AI_REPLY_MAX_PER_COMPANY", "2")),
+        batch_size=int(os.getenv("AI_REPLY_BATCH_SIZE", "16")),
+        max_attempts=int(os.getenv("AI_REPLY_MAX_ATTEMPTS", "3")),
+        drain_timeout=float(os.getenv("AI_REPLY_DRAIN_TIMEOUT", "5")),
+    )
+
+
+async def start_reply_workers(pool: Optional[ReplyWorkerPool] = None):
+    global _pool
+    pool = pool or reply_workers_from_env()
+    if pool is not None:
+        await pool.start()
+    _pool = pool
+
+
+async def stop_reply_workers():
+    global _pool
+    if _pool is not None:
+        await _pool.stop()
+    _pool = None
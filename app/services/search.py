@@ -0,0 +1,354 @@
+"""
+Per-company message search over an inverted index (term -> postings of message and
+conversation ids), stored in the database next to the messages.
+
+Writing: add_message / add_messages_bulk (so also AI replies and batch ingestion) tokenize
+each message and stage its postings; they go into `search_pending` with one INSERT right
+before the transaction commits. The merge job folds pending postings into `search_blocks`:
+per company and term, blocks of up to SEARCH_BLOCK_POSTINGS postings in message id order,
+delta/varint encoded (app/db_utils/postings.py).
+
+Searching: every query term must match. Each term's postings (blocks plus pending) are
+walked newest first and intersected by leapfrogging, so blocks far from the matches are
+skipped without being read; results are keyset-paginated with before_id.
+
+    python -m app.services.search merge
+    python -m app.services.search rebuild --company-id 1      (or --all)
+    python -m app.services.search query --company-id 1 "order delayed"
+
+A rebuild streams the company's messages (and its archived ones) in batches into fresh
+blocks; meanwhile new postings wait in search_pending and the merge job skips the company.
+With SEARCH_MERGE_INTERVAL_SECONDS > 0 the API process runs the merge job periodically
+(one worker per host, see app/services/leader.py).
+"""
+
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import os
+import re
+import unicodedata
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import anyio
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from app.dao.company import DAOCompany
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+from app.dao.search import DAOSearchBlock, DAOSearchIndexState, DAOSearchPending
+from app.db_utils.db_connection import get_sessionmaker
+from app.db_utils.filters import composite_in
+from app.db_utils.hooks import before_commit
+from app.db_utils.postings import Posting, PostingCursor, decode_postings, encode_postings, intersect
+from app.db_utils.upsert import insert_ignore, insert_ignore_many
+from app.services.archive import archived_upto, read_archived
+from app.services.leader import is_leader
+from app.services.messages import MESSAGE_COLUMNS, message_dicts
+
+logger = logging.getLogger(__name__)
+
+TERM_RE = re.compile(r"\w+")
+MAX_TERM_LENGTH = 64  # search_blocks.term
+MAX_QUERY_TERMS = 8
+MAX_ID = 2 ** 63 - 1
+_STAGED = "search_postings"
+
+
+def index_enabled() -> bool:
+    return os.getenv("SEARCH_INDEX_ENABLED", "1").lower() in ("1", "true", "yes")
+
+
+def _block_postings() -> int:
+    return int(os.getenv("SEARCH_BLOCK_POSTINGS", "512"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Distinct words of a text, case-folded and without accents ("Não" and "nao" match)."""
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return list(dict.fromkeys(word[:MAX_TERM_LENGTH] for word in TERM_RE.findall(folded)))
+
+
+# -- incremental updates ---------------------------------------------------------
+def _write_staged(db: Session, chunk_size: int = 4000):
+    # 4 bind parameters per row: a chunk stays below SQLite's 32766 limit
+    rows = db.info.pop(_STAGED, None)
+    for start in range(0, len(rows or ()), chunk_size):
+        insert_ignore_many(db, DAOSearchPending.__table__, rows[start:start + chunk_size])
+
+
+def index_messages(db: Session, messages: Iterable[Tuple[int, int, int, str]]):
+    """Stage postings of (company_id, message_id, conversation_id, content) for the current transaction."""
+    if not index_enabled():
+        return
+    if before_commit(db, "search_index", functools.partial(_write_staged, db)):
+        db.info[_STAGED] = []
+    db.info[_STAGED].extend(
+        {"company_id": company_id, "term": term, "message_id": message_id, "conversation_id": conversation_id}
+        for company_id, message_id, conversation_id, content in messages for term in tokenize(content))
+
+
+# -- merging pending postings into blocks -------------------------------------------
+def _encode_blocks(company_id: int, term: str, postings: Sequence[Posting], size: int) -> List[dict]:
+    return [{"company_id": company_id, "term": term, "first_id": chunk[0][0], "last_id": chunk[-1][0],
+             "postings": len(chunk), "data": encode_postings(chunk)}
+            for chunk in (postings[i:i + size] for i in range(0, len(postings), size))]
+
+
+def _merge_into_blocks(db: Session, pending: Dict[Tuple[int, str], List[Posting]], size: int):
+    """
+    Fold new postings into their terms' blocks. Rewritten per term: the tail (partial) block and
+    every block reaching past the term's lowest new id, so blocks stay full, ordered and disjoint.
+    """
+    b = DAOSearchBlock.__table__
+    lowest = min(p[0] for postings in pending.values() for p in postings)
+    affected = db.execute(
+        sqlalchemy.select(b.c.company_id, b.c.term, b.c.first_id, b.c.last_id, b.c.postings, b.c.data)
+        .where(composite_in((b.c.company_id, b.c.term), pending.keys()),
+               sqlalchemy.or_(b.c.last_id >= lowest, b.c.postings < size))).all()
+    blocks_by_term = {}
+    for row in affected:
+        blocks_by_term.setdefault((row.company_id, row.term), []).append(row)
+
+    stale, fresh = [], []
+    for key, new in pending.items():
+        low = min(p[0] for p in new)
+        merged = {}
+        for row in blocks_by_term.get(key, ()):
+            if row.last_id >= low or row.postings < size:
+                merged.update(decode_postings(row.data))
+                stale.append({"company_id": row.company_id, "term": row.term, "first_id": row.first_id})
+        merged.update(new)
+        fresh += _encode_blocks(key[0], key[1], sorted(merged.items()), size)
+    if stale:
+        db.execute(b.delete().where(b.c.company_id == sqlalchemy.bindparam("b_company_id"),
+                                    b.c.term == sqlalchemy.bindparam("b_term"),
+                                    b.c.first_id == sqlalchemy.bindparam("b_first_id")),
+                   [{f"b_{k}": v for k, v in key.items()} for key in stale])
+    if fresh:
+        db.execute(sqlalchemy.insert(b), fresh)
+
+
+def merge_pending(batch_size: int = 5000, max_batches: Optional[int] = None) -> dict:
+    """Fold search_pending into search_blocks, one transaction per batch (walked by id)."""
+    p, state = DAOSearchPending.__table__, DAOSearchIndexState.__table__
+    size = _block_postings()
+    stats = {"postings": 0, "terms": 0}
+    after = 0
+    with get_sessionmaker()() as db:
+        for _ in itertools.count() if max_batches is None else range(max_batches):
+            rows = db.execute(sqlalchemy.select(p.c.id, p.c.company_id, p.c.term, p.c.message_id, p.c.conversation_id)
+                              .where(p.c.id > after).order_by(p.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            after = rows[-1].id
+            rebuilding = set(db.execute(sqlalchemy.select(state.c.company_id).where(
+                state.c.company_id.in_(sorted({r.company_id for r in rows})),
+                state.c.rebuilding.is_(True))).scalars())
+            pending = {}
+            for r in rows:
+                if r.company_id not in rebuilding:
+                    pending.setdefault((r.company_id, r.term), []).append((r.message_id, r.conversation_id))
+            if pending:
+                _merge_into_blocks(db, pending, size)
+                db.execute(p.delete().where(p.c.id.in_([r.id for r in rows if r.company_id not in rebuilding])))
+                stats["postings"] += sum(len(v) for v in pending.values())
+                stats["terms"] += len(pending)
+            db.commit()
+    return stats
+
+
+# -- rebuild ---------------------------------------------------------------------------
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _set_rebuilding(db: Session, company_id: int, rebuilding: bool):
+    insert_ignore(db, DAOSearchIndexState.__table__, {"company_id": company_id, "rebuilding": False}, pk="company_id")
+    values = {"rebuilding": rebuilding} if rebuilding else {"rebuilding": False, "rebuilt_at": _utcnow()}
+    db.execute(sqlalchemy.update(DAOSearchIndexState.__table__)
+               .where(DAOSearchIndexState.company_id == company_id).values(**values))
+    db.commit()
+
+
+def rebuild_company(company_id: int, batch_size: int = 5000) -> dict:
+    """
+    Rebuild a company's index from its messages, streamed in windows of `batch_size` message ids.
+    A term's postings are buffered until they fill a block, so memory stays bounded by the
+    vocabulary; archived messages go through search_pending and the final merge.
+    """
+    m, c, b = DAOMessage.__table__, DAOConversation.__table__, DAOSearchBlock.__table__
+    size = _block_postings()
+    stats = {"company_id": company_id, "messages": 0, "blocks": 0, "archived": 0}
+    with get_sessionmaker()() as db:
+        _set_rebuilding(db, company_id, True)
+        db.execute(b.delete().where(b.c.company_id == company_id))
+        db.commit()
+
+        buffers: Dict[str, List[Posting]] = {}
+        top = db.execute(sqlalchemy.select(sqlalchemy.func.max(m.c.id))).scalar() or 0
+        for after in range(0, top, batch_size):
+            # a window of ids rather than ORDER BY ... LIMIT: the join can't sort by message id on an index
+            rows = sorted(db.execute(sqlalchemy.select(m.c.id, m.c.conversation_id, m.c.content)
+                                     .join(c, c.c.id == m.c.conversation_id)
+                                     .where(c.c.company_id == company_id, m.c.id > after,
+                                            m.c.id <= after + batch_size)).all())
+            if not rows:
+                continue
+            full = []
+            for message_id, conversation_id, content in rows:
+                for term in tokenize(content):
+                    buffer = buffers.setdefault(term, [])
+                    buffer.append((message_id, conversation_id))
+                    if len(buffer) == size:
+                        full += _encode_blocks(company_id, term, buffer, size)
+                        buffers[term] = []
+            if full:
+                db.execute(sqlalchemy.insert(b), full)
+            db.commit()
+            stats["messages"] += len(rows)
+            stats["blocks"] += len(full)
+        tail = [block for term, buffer in sorted(buffers.items()) if buffer
+                for block in _encode_blocks(company_id, term, buffer, size)]
+        if tail:
+            db.execute(sqlalchemy.insert(b), tail)
+        stats["blocks"] += len(tail)
+
+        archived = db.execute(sqlalchemy.select(c.c.id, c.c.archived_upto_id)
+                              .where(c.c.company_id == company_id, c.c.archived_upto_id.is_not(None))).all()
+        for conversation_id, upto_id in archived:
+            rows = read_archived(conversation_id, upto_id)
+            index_messages(db, [(company_id, r["id"], conversation_id, r["content"]) for r in rows])
+            stats["archived"] += len(rows)
+        db.commit()
+        _set_rebuilding(db, company_id, False)
+    merge_pending()  # postings written meanwhile and the archived ones
+    return stats
+
+
+# -- search ----------------------------------------------------------------------------
+def _fetch_blocks(db: Session, company_id: int, term: str, upto: int, chunk: int = 8) -> List[Tuple[int, bytes]]:
+    b = DAOSearchBlock.__table__
+    return [tuple(r) for r in db.execute(
+        sqlalchemy.select(b.c.first_id, b.c.data)
+        .where(b.c.company_id == company_id, b.c.term == term, b.c.first_id <= upto)
+        .order_by(b.c.first_id.desc()).limit(chunk)).all()]
+
+
+def _load_messages(db: Session, hits: List[Posting]) -> List[dict]:
+    """Message rows of the hits, in hit order; archived ones are read from the archive."""
+    found = {r["id"]: r for r in message_dicts(db.execute(
+        sqlalchemy.select(*MESSAGE_COLUMNS).where(DAOMessage.id.in_([h[0] for h in hits]))).all())} if hits else {}
+    rows = []
+    for message_id, conversation_id in hits:
+        row = found.get(message_id)
+        if row is None:
+            upto_id = archived_upto(db, conversation_id)
+            if upto_id is not None and message_id <= upto_id:
+                archived = read_archived(conversation_id, upto_id, after_id=message_id - 1, before_id=message_id + 1)
+                row = archived[0] if archived else None
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+def search_messages(db: Session, company_id: int, query: str, before_id: Optional[int] = None,
+                    limit: int = 20) -> Tuple[List[dict], Optional[int]]:
+    """
+    Messages of the company containing every term of `query`, newest first, ids below before_id.
+    Returns (rows, next_before_id); the cursor is None on the last page.
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return [], None
+    before_id = before_id or MAX_ID
+    p = DAOSearchPending.__table__
+    pending = {}
+    for term, message_id, conversation_id in db.execute(
+            sqlalchemy.select(p.c.term, p.c.message_id, p.c.conversation_id)
+            .where(p.c.company_id == company_id, p.c.term.in_(terms), p.c.message_id < before_id)):
+        pending.setdefault(term, []).append((message_id, conversation_id))
+
+    cursors = [PostingCursor(functools.partial(_fetch_blocks, db, company_id, term), pending.get(term, ()),
+                             before_id) for term in terms]
+    hits = list(itertools.islice(intersect(cursors), limit + 1))
+    # the cursor comes from the index: a hit whose message is gone does not end the pages
+    return _load_messages(db, hits[:limit]), hits[limit - 1][0] if len(hits) > limit else None
+
+
+# -- background job --------------------------------------------------------------
+_merger_task: Optional[asyncio.Task] = None
+
+
+async def _merge_loop(interval: float):
+    limiter = anyio.CapacityLimiter(1)  # never takes a request thread
+    while True:
+        await asyncio.sleep(interval)
+        if not is_leader():  # another worker runs the merge
+            continue
+        try:
+            stats = await anyio.to_thread.run_sync(merge_pending, limiter=limiter)
+            if stats["postings"]:
+                logger.debug("merged %(postings)d postings of %(terms)d terms", stats)
+        except Exception:
+            logger.exception("search index merge failed")
+
+
+async def start_search_merger():
+    global _merger_task
+    interval = float(os.getenv("SEARCH_MERGE_INTERVAL_SECONDS", "30"))
+    if interval > 0 and index_enabled() and _merger_task is None:
+        _merger_task = asyncio.create_task(_merge_loop(interval))
+
+
+async def stop_search_merger():
+    global _merger_task
+    if _merger_task is not None:
+        _merger_task.cancel()
+        try:
+            await _merger_task
+        except asyncio.CancelledError:
+            pass
+        _merger_task = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Message search index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("merge", help="fold pending postings into blocks")
+    rebuild = sub.add_parser("rebuild", help="rebuild a company's index from its messages")
+    target = rebuild.add_mutually_exclusive_group(required=True)
+    target.add_argument("--company-id", type=int)
+    target.add_argument("--all", action="store_true")
+    rebuild.add_argument("--batch-size", type=int, default=5000)
+    query = sub.add_parser("query", help="run a search")
+    query.add_argument("--company-id", type=int, required=True)
+    query.add_argument("--limit", type=int, default=20)
+    query.add_argument("text")
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        print(json.dumps(merge_pending()))
+    elif args.command == "rebuild":
+        if args.all:
+            with get_sessionmaker()() as db:
+                company_ids = db.execute(sqlalchemy.select(DAOCompany.id).order_by(DAOCompany.id)).scalars().all()
+        else:
+            company_ids = [args.company_id]
+        for company_id in company_ids:
+            print(json.dumps(rebuild_company(company_id, batch_size=args.batch_size)))
+    else:
+        with get_sessionmaker()() as db:
+            rows, _ = search_messages(db, args.company_id, args.text, limit=args.limit)
+        for row in rows:
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+JSON bytes for the hot read endpoints.
+
+Those endpoints build plain dicts from Core rows (only the response columns) and return a
+JSONBytesResponse: the body is encoded once by orjson (stdlib json when it is not
+installed), skipping FastAPI's per-row response_model validation and jsonable_encoder pass.
+The routes keep their response_model for the OpenAPI schema; the dicts carry exactly its
+fields, so the payload is the same.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt; stdlib json is the slow fallback
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
@@ -0,0 +1,131 @@
+"""
+Per-company cache of tenant metadata that almost never changes:
+company name, known channel ids, the AI-bot user id and the default agent id.
+
+Entries are plain JSON-able dicts so the backend can be shared between workers
+(see app/services/cache.py). Writes coming from a transaction are applied only
+after it commits, so a rolled-back insert never ends up in the cache.
+
+Every invalidation gives the company a new generation (stored in the backend too, so
+workers sharing it agree). An update carries the generation seen when its transaction
+staged it and is dropped if the company was invalidated since: the update would patch
+in values read before the change that caused the invalidation.
+"""
+
+import threading
+import uuid
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from app.db_utils.hooks import on_commit, on_rollback
+from app.services.cache import CacheBackend, backend_from_env
+
+
+_CURRENT = object()  # update() without a generation check
+_GENERATIONS = "tenant_generations"  # session info: company_id -> generation its pending invalidation sets
+
+
+class TenantCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_updates = 0
+
+    @staticmethod
+    def _key(company_id: int) -> str:
+        return f"tenant:{company_id}"
+
+    @staticmethod
+    def _generation_key(company_id: int) -> str:
+        return f"tenant-generation:{company_id}"
+
+    def generation(self, company_id: int) -> Optional[str]:
+        return self.backend.get(self._generation_key(company_id))
+
+    def get(self, company_id: int) -> dict:
+        return self.backend.get(self._key(company_id)) or {}
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def update(self, company_id: int, channel_id: Optional[int] = None, generation=_CURRENT, **fields):
+        """
+        Merge fields into the company entry (channel ids are accumulated), unless the company was
+        invalidated since `generation`. An invalidation racing the merge removes what it wrote.
+        """
+        current = self.generation(company_id)
+        if generation is not _CURRENT and generation != current:
+            with self._lock:
+                self.stale_updates += 1
+            return
+        entry = dict(self.get(company_id))
+        entry.update({k: v for k, v in fields.items() if v is not None})
+        if channel_id is not None:
+            entry["channels"] = sorted(set(entry.get("channels", [])) | {channel_id})
+        self.backend.set(self._key(company_id), entry)
+        if self.generation(company_id) != current:
+            self.backend.delete(self._key(company_id))
+
+    def invalidate(self, company_id: int, generation: Optional[str] = None):
+        # the new generation first: an update that has not yet checked it gives up, one that has deletes
+        self.backend.set(self._generation_key(company_id), generation or uuid.uuid4().hex)
+        self.backend.delete(self._key(company_id))
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "stale_updates": self.stale_updates,
+            }
+        if hasattr(self.backend, "__len__"):
+            stats["entries"] = len(self.backend)
+            stats["evictions"] = getattr(self.backend, "evictions", 0)
+        return stats
+
+
+tenant_cache = TenantCache(backend_from_env("TENANT_CACHE", default_size=10000, default_ttl=300))
+
+
+def set_tenant_cache_backend(backend: CacheBackend):
+    """Swap the storage (e.g. a shared backend in multi-worker deployments)."""
+    global tenant_cache
+    tenant_cache = TenantCache(backend)
+    return tenant_cache
+
+
+def get_tenant_cache() -> TenantCache:
+    return tenant_cache
+
+
+def update_after_commit(db: Session, company_id: int, **fields):
+    # an invalidation staged earlier in this transaction is the generation its fields belong to
+    generation = db.info.get(_GENERATIONS, {}).get(company_id, _CURRENT)
+    if generation is _CURRENT:
+        generation = tenant_cache.generation(company_id)
+    on_commit(db, lambda: tenant_cache.update(company_id, generation=generation, **fields))
+
+
+def invalidate_after_commit(db: Session, company_id: int):
+    """Explicit invalidation for when users/channels of a company are created or changed."""
+    staged = db.info.get(_GENERATIONS)
+    if staged is None:
+        staged = db.info[_GENERATIONS] = {}
+        # forgotten when the transaction ends, either way
+        on_commit(db, lambda: db.info.pop(_GENERATIONS, None))
+        on_rollback(db, lambda: db.info.pop(_GENERATIONS, None))
+    generation = staged[company_id] = uuid.uuid4().hex
+    on_commit(db, lambda: tenant_cache.invalidate(company_id, generation=generation))
@@ -0,0 +1,210 @@
+"""
+Startup warm-up and the readiness state behind GET /readyz.
+
+Without it the first requests of every worker pay for SQLAlchemy mapper configuration,
+new DB connections and the compilation of each statement they run. The app lifespan
+runs warm_up() before the worker serves anything:
+
+  1. configure the mappers,
+  2. open pool connections up front (WARMUP_CONNECTIONS per engine, the pool size by default),
+  3. rehearse the hot paths of app/services/conversation.py on one of them: an inbound
+     message and an inbound batch (tenant, contact, conversation, messages, AI reply,
+     counters), an agent message, an ownership toggle and the history/inbox reads, so
+     their statements land in the engine's compiled cache. The rehearsal runs inside a
+     transaction that is rolled back, with after-commit side effects (caches, events)
+     dropped (on MySQL it still uses up a few AUTO_INCREMENT values); it uses the first
+     existing channel and only reads when there is none.
+
+A worker is ready once that is done. When the database is unreachable at startup the
+worker starts anyway, stays not-ready and retries every WARMUP_RETRY_SECONDS. On
+shutdown it reports not-ready first (see app/server.py for the drain period).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy.orm import Session, configure_mappers
+
+from app.dao.channel import DAOChannel
+from app.dao.conversation import DAOConversation
+from app.db_utils.async_db import get_async_engine
+from app.db_utils.db_connection import get_engine, load_db_config
+from app.db_utils.hooks import DRY_RUN
+from app.services.conversation import add_message, find_open_conversation, toggle_conversation_owner
+from app.services.inbound import InboundItem, process_inbound_batch, process_inbound_message
+from app.services.inbox import list_inbox_page
+from app.services.messages import list_messages_page
+from app.services.projections import get_company_users, get_conversation_row
+
+logger = logging.getLogger(__name__)
+
+
+_state = {"ready": False, "draining": False, "started_at": time.time(), "warmup": None, "error": None}
+_retry_task: Optional[asyncio.Task] = None
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("WARMUP_ENABLED", "1").lower() in ("1", "true", "yes")
+
+
+def _rehearse(db: Session):
+    channel = db.execute(sqlalchemy.select(DAOChannel.company_id, DAOChannel.id)
+                         .order_by(DAOChannel.id).limit(1)).first()
+    if channel is None:  # empty database: the reads only
+        find_open_conversation(db, 0, 0, 0)
+        get_conversation_row(db, 0)
+        list_messages_page(db, 0, limit=50)
+        list_inbox_page(db, 0, limit=20)
+        return
+    company_id, channel_id = channel
+    phone = f"+0000warmup{os.getpid()}"  # workers warming up together do not wait on each other's rows
+    conv_id = process_inbound_message(db, company_id, channel_id, phone, "warm-up").conversation.id
+    process_inbound_batch(db, [InboundItem(company_id, channel_id, phone, "warm-up"),
+                               InboundItem(company_id, channel_id, phone + "-2", "warm-up")])
+    add_message(db, conv_id, sender="agent", content="warm-up")
+    toggle_conversation_owner(db, db.get(DAOConversation, conv_id))
+    get_conversation_row(db, conv_id)
+    get_company_users(db, company_id)
+    for page in ({}, {"after_id": 0}, {"before_id": 2 ** 62}):
+        list_messages_page(db, conv_id, limit=50, **page)
+    list_inbox_page(db, company_id, limit=20)
+    list_inbox_page(db, company_id, limit=20, before_message_id=2 ** 62)
+
+
+def rehearse_on_connection(conn: sqlalchemy.Connection):
+    """Run the rehearsal in a transaction of `conn` and roll it back."""
+    if conn.dialect.name == "sqlite":
+        # pysqlite does not BEGIN before a SAVEPOINT, whose RELEASE would then commit; IMMEDIATE
+        # takes the write lock up front, so concurrent warm-ups queue instead of failing as "locked"
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.begin()
+    try:
+        # the services' commits only release savepoints of the outer transaction
+        with Session(bind=conn, join_transaction_mode="create_savepoint", autoflush=False,
+                     expire_on_commit=False, info={DRY_RUN: True}) as db:
+            _rehearse(db)
+    finally:
+        conn.rollback()
+
+
+def _open_connections(engine, n: int):
+    conns = []
+    try:
+        for _ in range(n):
+            conns.append(engine.connect())
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def _connections(db_label: str) -> int:
+    pool_size = load_db_config()[db_label]["pool_size"]
+    return min(pool_size, int(os.getenv("WARMUP_CONNECTIONS") or pool_size))
+
+
+def warm_up() -> dict:
+    """Sync part of the warm-up; returns what each step took, in seconds."""
+    timings = {}
+    start = time.perf_counter()
+    configure_mappers()
+    timings["mappers"] = time.perf_counter() - start
+
+    step = time.perf_counter()
+    for db_label, s in load_db_config().items():
+        try:
+            _open_connections(get_engine(db_label), _connections(db_label))
+        except sqlalchemy.exc.DBAPIError:
+            if not s["replica"]:
+                raise
+            logger.warning("warm-up: replica %s unreachable", db_label)  # the replica monitor keeps it out
+    timings["connections"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    with get_engine().connect() as conn:
+        rehearse_on_connection(conn)
+    timings["rehearsal"] = time.perf_counter() - step
+    return timings
+
+
+async def warm_up_async() -> dict:
+    """The same for the async engine (DB_ASYNC=1): its pool and compiled cache are its own."""
+    timings = {}
+    step = time.perf_counter()
+    engine = get_async_engine()
+    conns = []
+    try:
+        for _ in range(_connections("main")):
+            conns.append(await engine.connect())
+    finally:
+        for conn in conns:
+            await conn.close()
+    timings["async_connections"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    async with engine.connect() as conn:
+        await conn.run_sync(rehearse_on_connection)
+    timings["async_rehearsal"] = time.perf_counter() - step
+    return timings
+
+
+async def _warm_up(async_mode: bool):
+    import anyio
+
+    start = time.perf_counter()
+    timings = await anyio.to_thread.run_sync(warm_up)
+    if async_mode:
+        timings.update(await warm_up_async())
+    timings["total"] = time.perf_counter() - start
+    _state["warmup"] = {k: round(v, 4) for k, v in timings.items()}
+    _state["error"] = None
+    _state["ready"] = True
+    logger.info("warm-up done in %.1f ms: %s", timings["total"] * 1000, _state["warmup"])
+
+
+async def _retry_loop(async_mode: bool, interval: float):
+    while not _state["ready"]:
+        await asyncio.sleep(interval)
+        try:
+            await _warm_up(async_mode)
+        except Exception as e:  # noqa: BLE001
+            _state["error"] = repr(e)
+            logger.warning("warm-up failed again: %r", e)
+
+
+async def start_warm_up(async_mode: bool):
+    """Warm up before serving; on failure stay not-ready and keep retrying in the background."""
+    global _retry_task
+    _state.update(ready=False, draining=False, warmup=None, error=None)
+    if not warmup_enabled():
+        _state["ready"] = True
+        return
+    try:
+        await _warm_up(async_mode)
+    except Exception as e:  # noqa: BLE001
+        _state["error"] = repr(e)
+        logger.exception("warm-up failed, serving as not ready until it succeeds")
+        _retry_task = asyncio.create_task(_retry_loop(async_mode, float(os.getenv("WARMUP_RETRY_SECONDS", "5"))))
+
+
+async def stop_warm_up():
+    global _retry_task
+    mark_draining()
+    if _retry_task is not None:
+        _retry_task.cancel()
+        await asyncio.gather(_retry_task, return_exceptions=True)
+        _retry_task = None
+
+
+def mark_draining():
+    _state["draining"] = True
+
+
+def readiness() -> dict:
+    return {"ready": _state["ready"] and not _state["draining"], "draining": _state["draining"], "pid": os.getpid(),
+            "warmup": _state["warmup"], "error": _state["error"],
+            "uptime_seconds": round(time.time() - _state["started_at"], 3)}
@@ -0,0 +1,213 @@
+"""
+Group commit for inbound webhook deliveries (WRITE_COALESCE=1).
+
+One POST /webhooks/inbound is a small transaction, so under concurrent traffic the
+database spends its time on per-commit overhead (log flush, fsync) rather than on rows.
+With coalescing on, the webhook hands its delivery to WriteCoalescer and waits: a flusher
+collects the deliveries queued by concurrent requests (up to WRITE_COALESCE_MAX_ROWS,
+waiting at most WRITE_COALESCE_MAX_DELAY_MS for more while other requests are in
+flight, not at all for a lone writer) and stores them
+with process_inbound_batch, the set-based path of the batch endpoint: multi-row INSERTs
+in one transaction. Every request is answered with its own conversation once that
+transaction has committed, so a 201 still means the delivery is durable.
+
+A batch whose transaction fails is retried one delivery at a time, so one bad delivery
+only fails its own request; once it has committed, nothing is stored again (a failure
+to read the conversations back goes to the waiting requests). While a flusher commits, new deliveries queue up, so
+batches grow with concurrency.
+See app/benchmarks/bench_write_coalescing.py.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import sqlalchemy
+
+from app.dao.conversation import DAOConversation
+from app.db_utils.db_connection import get_sessionmaker
+from app.db_utils.deps import pool_slot
+from app.services.inbound import BatchItemResult, InboundItem, process_inbound_batch
+from app.services.projections import CONVERSATION_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def write_coalesce_enabled() -> bool:
+    return os.getenv("WRITE_COALESCE", "0").lower() in ("1", "true", "yes")
+
+
+def _conversation_rows(db, conversation_ids) -> Dict[int, dict]:
+    rows = db.execute(sqlalchemy.select(*(getattr(DAOConversation, f) for f in CONVERSATION_FIELDS))
+                      .where(DAOConversation.id.in_(sorted(conversation_ids)))).all()
+    return {row.id: dict(zip(CONVERSATION_FIELDS, row)) for row in rows}
+
+
+class WriteCoalescer:
+    def __init__(self, max_rows: int = 256, max_delay_ms: float = 2.0, flushers: int = 2):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.flushers = flushers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._outstanding = 0  # submitted, not answered yet
+        self.stats = {"submitted": 0, "batches": 0, "rows": 0, "largest_batch": 0, "split_batches": 0,
+                      "failed": 0, "commit_seconds": 0.0}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.flushers)]
+
+    async def stop(self):
+        """Flush what is queued, then stop the flushers."""
+        for _ in self._tasks:
+            self._queue.put_nowait(None)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, item: InboundItem) -> Tuple[BatchItemResult, dict]:
+        """Store one delivery; returns its result and conversation row once the batch has committed."""
+        future = asyncio.get_running_loop().create_future()
+        self.stats["submitted"] += 1
+        self._outstanding += 1
+        self._queue.put_nowait((item, future))
+        try:
+            return await future
+        finally:
+            self._outstanding -= 1
+
+    async def _collect(self, first) -> Tuple[list, bool]:
+        batch, stop = [first], False
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_rows:
+            try:
+                entry = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._outstanding <= len(batch):
+                    break  # nobody else is writing: waiting would only add latency
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if entry is None:
+                stop = True
+                break
+            batch.append(entry)
+        return batch, stop
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch, stop = await self._collect(first)
+            start = time.perf_counter()
+            try:
+                async with pool_slot():
+                    outcomes, split = await anyio.to_thread.run_sync(self._flush, [item for item, _ in batch])
+            except Exception as e:  # noqa: BLE001 - handed to every waiting request
+                outcomes, split = [e] * len(batch), False
+            self._record(outcomes, split, time.perf_counter() - start)
+            for (_, future), outcome in zip(batch, outcomes):
+                if future.done():
+                    continue  # the request went away
+                if isinstance(outcome, BaseException):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+            if stop:
+                return
+
+    def _record(self, outcomes: list, split: bool, elapsed: float):
+        self.stats["batches"] += 1
+        self.stats["split_batches"] += split
+        self.stats["rows"] += len(outcomes)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(outcomes))
+        self.stats["failed"] += sum(isinstance(o, BaseException) for o in outcomes)
+        self.stats["commit_seconds"] += elapsed
+
+    def _flush(self, items: List[InboundItem]) -> Tuple[list, bool]:
+        """One outcome per item, (result, conversation row) or the exception; and whether the batch was split."""
+        with get_sessionmaker()() as db:
+            try:
+                results = process_inbound_batch(db, items)  # commits
+            except Exception:
+                if len(items) == 1:
+                    raise
+                db.rollback()
+                # isolate the delivery that broke the batch: every other request still gets its answer
+                logger.warning("coalesced batch of %d failed, storing its deliveries one by one", len(items),
+                               exc_info=True)
+                outcomes = []
+                for item in items:
+                    try:
+                        results = process_inbound_batch(db, [item])
+                    except Exception as e:  # noqa: BLE001
+                        db.rollback()
+                        outcomes.append(e)
+                        continue
+                    outcomes += self._read_back(db, results)
+                return outcomes, True
+            return self._read_back(db, results), False
+
+    @staticmethod
+    def _read_back(db, results: List[BatchItemResult]) -> list:
+        """
+        Outcomes of committed deliveries. A failure here goes to their requests as is: the
+        deliveries are stored, so storing them again would duplicate them.
+        """
+        try:
+            rows = _conversation_rows(db, {r.conversation_id for r in results if r.conversation_id is not None})
+        except Exception as e:  # noqa: BLE001
+            logger.warning("reading back %d stored deliveries failed", len(results), exc_info=True)
+            return [e] * len(results)
+        finally:
+            db.rollback()  # end the read transaction
+        outcomes = []
+        for result in results:
+            row = rows.get(result.conversation_id)
+            outcomes.append((result, row) if row is not None else
+                            LookupError(f"conversation {result.conversation_id} of a stored delivery is gone"))
+        return outcomes
+
+    def describe(self) -> dict:
+        batches = self.stats["batches"]
+        return {"max_rows": self.max_rows, "max_delay_ms": self.max_delay * 1000, "flushers": self.flushers,
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                "mean_batch": round(self.stats["rows"] / batches, 2) if batches else 0.0,
+                **self.stats, "commit_seconds": round(self.stats["commit_seconds"], 6)}
+
+
+_coalescer: Optional[WriteCoalescer] = None
+
+
+def get_write_coalescer() -> Optional[WriteCoalescer]:
+    """The running coalescer, or None when every request commits its own transaction."""
+    return _coalescer
+
+
+def write_coalescer_from_env() -> Optional[WriteCoalescer]:
+    if not write_coalesce_enabled():
+        return None
+    return WriteCoalescer(max_rows=int(os.getenv("WRITE_COALESCE_MAX_ROWS", "256")),
+                          max_delay_ms=float(os.getenv("WRITE_COALESCE_MAX_DELAY_MS", "2")),
+                          flushers=int(os.getenv("WRITE_COALESCE_FLUSHERS", "2")))
+
+
+async def start_write_coalescer(coalescer: Optional[WriteCoalescer] = None):
+    global _coalescer
+    coalescer = coalescer or write_coalescer_from_env()
+    if coalescer is not None:
+        await coalescer.start()
+    _coalescer = coalescer
+
+
+async def stop_write_coalescer():
+    global _coalescer
+    if _coalescer is not None:
+        await _coalescer.stop()
+    _coalescer = None
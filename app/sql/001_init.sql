@@ -17,6 +17,13 @@ FLUSH PRIVILEGES;
 -- ==========================================================
 -- Tables
 -- ==========================================================
+-- applied migrations (app/db_utils/migrations.py); every file records its own version
+CREATE TABLE schema_migrations (
+    version VARCHAR(16) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE companies (
     id BIGINT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
@@ -104,3 +111,5 @@ INSERT INTO messages (conversation_id, sender, content) VALUES
 (1, 'ai',      'Hi! I am your AI assistant. How can I help you today?'),
 (2, 'contact', 'Can I reset my password?'),
 (2, 'ai',      'Hello! Sure, I will help you reset it.');
+
+INSERT INTO schema_migrations (version, name) VALUES ('001', '001_init');
@@ -0,0 +1,30 @@
+-- ==========================================================
+-- One contact per (company, phone): required by the upsert in
+-- get_or_create_contact_by_phone and makes concurrent webhooks race-safe
+-- ==========================================================
+
+-- The old get-or-create could race into duplicate contacts, which would fail the unique
+-- key: keep the oldest contact of each (company, phone), move the conversations of the
+-- others to it and delete them. Contacts without a phone are left alone.
+UPDATE conversations
+SET contact_id = (
+  SELECT MIN(keep.id) FROM contacts dup
+  JOIN contacts keep ON keep.company_id = dup.company_id AND keep.phone = dup.phone
+  WHERE dup.id = conversations.contact_id)
+WHERE contact_id IN (
+  SELECT id FROM (
+    SELECT dup.id FROM contacts dup
+    JOIN contacts keep ON keep.company_id = dup.company_id AND keep.phone = dup.phone AND keep.id < dup.id
+  ) AS duplicates);
+
+-- the derived table is materialized first, so MySQL accepts the self-reference
+DELETE FROM contacts
+WHERE id IN (
+  SELECT id FROM (
+    SELECT dup.id FROM contacts dup
+    JOIN contacts keep ON keep.company_id = dup.company_id AND keep.phone = dup.phone AND keep.id < dup.id
+  ) AS duplicates);
+
+CREATE UNIQUE INDEX uq_contacts_company_phone ON contacts (company_id, phone);
+
+INSERT INTO schema_migrations (version, name) VALUES ('002', '002_contacts_unique_phone');
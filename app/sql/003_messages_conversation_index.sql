@@ -0,0 +1,7 @@
+-- ==========================================================
+-- Keyset pagination / streaming of a conversation's history
+-- (WHERE conversation_id = ? AND id > ? ORDER BY id)
+-- ==========================================================
+CREATE INDEX ix_messages_conversation_id_id ON messages (conversation_id, id);
+
+INSERT INTO schema_migrations (version, name) VALUES ('003', '003_messages_conversation_index');
@@ -0,0 +1,11 @@
+-- ==========================================================
+-- Idempotent webhook ingestion: store the provider message id and
+-- reject a second copy of the same delivery per channel
+-- ==========================================================
+ALTER TABLE messages
+  ADD COLUMN channel_id BIGINT NULL AFTER content,
+  ADD COLUMN channel_message_id VARCHAR(255) NULL AFTER channel_id,
+  ADD CONSTRAINT fk_messages_channel FOREIGN KEY (channel_id) REFERENCES channels(id),
+  ADD UNIQUE KEY uq_messages_channel_message (channel_id, channel_message_id);
+
+INSERT INTO schema_migrations (version, name) VALUES ('004', '004_messages_channel_message_id');
@@ -0,0 +1,24 @@
+-- ==========================================================
+-- Outbox for AI replies generated by the reply workers
+-- (AI_REPLY_MODE=queue, AI_REPLY_QUEUE_BACKEND=outbox)
+-- ==========================================================
+CREATE TABLE reply_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    company_id BIGINT NOT NULL,
+    conversation_id BIGINT NOT NULL,
+    ai_user_id BIGINT NOT NULL,
+    company_name VARCHAR(255),
+    inbound_text TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME NOT NULL,
+    claim_token VARCHAR(36),
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (company_id) REFERENCES companies(id),
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id),
+    FOREIGN KEY (ai_user_id) REFERENCES users(id),
+    INDEX ix_reply_jobs_status_available (status, available_at, id)
+);
+
+INSERT INTO schema_migrations (version, name) VALUES ('005', '005_reply_jobs');
@@ -0,0 +1,16 @@
+-- ==========================================================
+-- Composite indexes for the hot lookups
+-- (checked by app/tests/test_query_plans.py: no full scans, no filesorts)
+-- ==========================================================
+
+-- find_open_conversation(s): WHERE company_id = ? AND channel_id = ? AND contact_id = ? ORDER BY id DESC
+CREATE INDEX ix_conversations_company_channel_contact_id
+  ON conversations (company_id, channel_id, contact_id, id);
+
+-- AI-bot / default-agent lookups: WHERE company_id = ? AND role = ? ORDER BY id
+CREATE INDEX ix_users_company_role_id ON users (company_id, role, id);
+
+-- company user listing: WHERE company_id = ? ORDER BY id
+CREATE INDEX ix_users_company_id_id ON users (company_id, id);
+
+INSERT INTO schema_migrations (version, name) VALUES ('006', '006_hot_lookup_indexes');
@@ -0,0 +1,19 @@
+-- ==========================================================
+-- Conversation state: open/closed status and a denormalized
+-- last-message pointer and message count, so the company inbox
+-- is an index range scan instead of an aggregate over messages
+-- ==========================================================
+ALTER TABLE conversations
+  ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT 'open' AFTER owner_id,
+  ADD COLUMN last_message_id BIGINT NULL AFTER status,
+  ADD COLUMN last_message_at TIMESTAMP NULL AFTER last_message_id,
+  ADD COLUMN message_count INT NOT NULL DEFAULT 0 AFTER last_message_at,
+  ADD INDEX ix_conversations_company_status_last_message (company_id, status, last_message_id);
+
+-- backfill from the existing history
+UPDATE conversations c
+  JOIN (SELECT conversation_id, COUNT(*) AS n, MAX(id) AS last_id, MAX(created_at) AS last_at
+          FROM messages GROUP BY conversation_id) m ON m.conversation_id = c.id
+   SET c.message_count = m.n, c.last_message_id = m.last_id, c.last_message_at = m.last_at;
+
+INSERT INTO schema_migrations (version, name) VALUES ('007', '007_conversation_state');
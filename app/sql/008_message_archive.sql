@@ -0,0 +1,11 @@
+-- ==========================================================
+-- Cold-message archival: messages of idle conversations move
+-- to compressed segment files; conversations remember how far
+-- their history was archived, and the archival job walks idle
+-- conversations by last activity
+-- ==========================================================
+ALTER TABLE conversations
+  ADD COLUMN archived_upto_id BIGINT NULL AFTER message_count,
+  ADD INDEX ix_conversations_last_message_at_id (last_message_at, id);
+
+INSERT INTO schema_migrations (version, name) VALUES ('008', '008_message_archive');
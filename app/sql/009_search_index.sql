@@ -0,0 +1,34 @@
+-- ==========================================================
+-- Per-company message search: an inverted index of message
+-- terms. Postings are written with each message to
+-- search_pending and folded by the merge job into compact,
+-- id-ordered blocks (one row per up to SEARCH_BLOCK_POSTINGS
+-- postings). Keys start with company_id, so each company's
+-- index is its own key range.
+-- ==========================================================
+CREATE TABLE search_blocks (
+    company_id BIGINT NOT NULL,
+    term VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    first_id BIGINT NOT NULL,
+    last_id BIGINT NOT NULL,
+    postings INT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (company_id, term, first_id)
+);
+
+CREATE TABLE search_pending (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    company_id BIGINT NOT NULL,
+    term VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+    message_id BIGINT NOT NULL,
+    conversation_id BIGINT NOT NULL,
+    UNIQUE KEY uq_search_pending_term_message (company_id, term, message_id)
+);
+
+CREATE TABLE search_index_state (
+    company_id BIGINT PRIMARY KEY,
+    rebuilding BOOLEAN NOT NULL DEFAULT FALSE,
+    rebuilt_at TIMESTAMP NULL
+);
+
+INSERT INTO schema_migrations (version, name) VALUES ('009', '009_search_index');
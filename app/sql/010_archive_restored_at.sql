@@ -0,0 +1,9 @@
+-- ==========================================================
+-- Restored conversations: the archival job skips them until
+-- they have been idle since the restore (their last message
+-- is still old right after it)
+-- ==========================================================
+ALTER TABLE conversations
+  ADD COLUMN restored_at TIMESTAMP NULL AFTER archived_upto_id;
+
+INSERT INTO schema_migrations (version, name) VALUES ('010', '010_archive_restored_at');
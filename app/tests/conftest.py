@@ -0,0 +1,101 @@
+import sys, os
+import pytest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def seeded_db(url, monkeypatch):
+    """Point the engine registry at `url`, build the schema from the models and load the demo seed."""
+    from app.db_utils.db_connection import get_engine, dispose_engines
+    from app.db_utils.local_db import create_schema, seed_demo_data
+    from app.services.cache import InMemoryLRUBackend
+    from app.services.tenant_cache import set_tenant_cache_backend
+    from app.services.dedup import set_dedup_backend
+
+    set_tenant_cache_backend(InMemoryLRUBackend())
+    set_dedup_backend(InMemoryLRUBackend())
+    monkeypatch.setenv("DB_URL", url)
+    dispose_engines()
+    engine = get_engine()
+    create_schema(engine)
+    seed_demo_data(engine)
+    return engine
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Point the engine registry at a seeded SQLite file (offline stand-in for MySQL)."""
+    from app.db_utils.db_connection import dispose_engines
+
+    yield seeded_db(f"sqlite:///{tmp_path / 'omni.db'}", monkeypatch)
+    dispose_engines()
+
+
+@pytest.fixture
+def mysql_db(monkeypatch):
+    """Same as sqlite_db on a scratch MySQL database given by TEST_MYSQL_URL (skipped when unset)."""
+    url = os.getenv("TEST_MYSQL_URL")
+    if not url:
+        pytest.skip("TEST_MYSQL_URL is not set")
+    from app.dao.base import Base
+    from app.db_utils import local_db  # noqa: F401 (registers every table for drop_all)
+    from app.db_utils.db_connection import get_engine, dispose_engines
+
+    monkeypatch.setenv("DB_URL", url)
+    dispose_engines()
+    Base.metadata.drop_all(get_engine())
+    yield seeded_db(url, monkeypatch)
+    dispose_engines()
+
+
+@pytest.fixture
+def local_client(sqlite_db):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def async_client(sqlite_db):
+    """Same app with DB_ASYNC=1 (AsyncSession over aiosqlite)."""
+    from fastapi.testclient import TestClient
+    from app.main import create_app
+
+    with TestClient(create_app(async_mode=True)) as c:
+        yield c
+
+
+class StatementRecorder:
+    """Collects every SQL statement and COMMIT issued on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.commits = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.engine, "commit", self._on_commit)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(self.engine, "commit", self._on_commit)
+
+
+@pytest.fixture
+def record_sql(sqlite_db):
+    return lambda: StatementRecorder(sqlite_db)
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db_utils.fair_queue import FairSemaphore
+from app.services.admission import AdmissionController, TenantLimits, set_admission_controller
+
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def admission(sqlite_db, monkeypatch, request):
+    """Admission on, with a controller whose clock only moves when the test says so."""
+    from app.main import create_app
+
+    now = [0.0]
+    monkeypatch.setenv("ADMISSION_ENABLED", "1")
+    controller = set_admission_controller(AdmissionController(
+        TenantLimits(rate=1, burst=3, max_concurrent=0, weight=1.0),
+        {2: TenantLimits(rate=0, burst=1, max_concurrent=0, weight=1.0)}, clock=lambda: now[0]))
+    with TestClient(create_app(async_mode=request.param)) as client:
+        yield client, controller, now
+    set_admission_controller(None)
+
+
+def _inbound(client, company_id, i=0):
+    return client.post("/webhooks/inbound", json={"company_id": company_id, "channel_id": company_id,
+                                                  "from": f"+155594{company_id}{i:04d}", "text": "hi"})
+
+
+def test_over_limit_requests_get_429_with_retry_after(admission):
+    client, controller, now = admission
+    conv_id = _inbound(client, 1).json()["id"]
+    assert client.get(f"/conversations/{conv_id}").status_code == 200
+    assert client.get("/companies/1/conversations").status_code == 200
+
+    # the bucket (burst 3) is empty: the webhook, and the company's other routes, are refused at once
+    r = _inbound(client, 1, 1)
+    assert r.status_code == 429 and r.headers["Retry-After"] == "1"
+    assert client.get(f"/conversations/{conv_id}").status_code == 429
+    r = client.post("/webhooks/inbound/batch", json={"messages": [
+        {"company_id": 1, "channel_id": 1, "from": "+15559410000", "text": "a"},
+        {"company_id": 2, "channel_id": 2, "from": "+15559420000", "text": "b"}]})
+    assert r.status_code == 429  # all or nothing
+    # other tenants and unattributed endpoints are not affected
+    assert all(_inbound(client, 2, i).status_code == 201 for i in range(5))
+    assert client.get("/system/db/pool").status_code == 200
+
+    now[0] += 2.5  # two tokens back
+    assert _inbound(client, 1, 2).status_code == 201
+    assert client.get(f"/conversations/{conv_id}").status_code == 200
+    assert client.get(f"/conversations/{conv_id}").status_code == 429
+
+    stats = client.get("/system/admission").json()
+    assert stats["enabled"] is True
+    assert stats["tenants"]["1"] | {"tokens": 0} == {
+        "rate": 1, "burst": 3, "max_concurrent": 0, "weight": 1.0, "in_flight": 0, "tokens": 0,
+        "admitted": 5, "rate_limited": 4, "concurrency_limited": 0}
+    assert stats["tenants"]["2"]["admitted"] == 5
+    assert stats["pool_slots"] and all(p["in_use"] == 0 for p in stats["pool_slots"].values())
+    metrics = client.get("/metrics").text
+    assert 'admission_requests_total{company_id="other",outcome="rate_limited"}' in metrics
+    assert 'admission_requests_total{company_id="2",outcome="admitted"}' in metrics
+    assert 'company_id="1"' not in metrics  # only the overrides get their own series
+
+
+def test_concurrency_cap_and_batch_costs():
+    controller = AdmissionController(TenantLimits(rate=10, burst=10, max_concurrent=2, weight=1.0))
+    assert controller.try_admit({1: 1}) is None
+    assert controller.try_admit({1: 1}) is None
+    assert controller.try_admit({1: 1}) == (1, "concurrency_limited", 1)
+    controller.release({1: 1})
+    assert controller.try_admit({1: 1}) is None
+    assert controller.try_admit({3: 25}) is None  # larger than the burst: takes the whole bucket
+    assert controller.try_admit({3: 1, 4: 1}) == (3, "rate_limited", 1)
+    assert controller.try_admit({4: 10}) is None  # nothing was charged
+
+
+def test_tenant_state_is_bounded_and_overflow_shares_one_bucket():
+    controller = AdmissionController(TenantLimits(rate=1, burst=2, max_concurrent=0, weight=1.0),
+                                     {7: TenantLimits(rate=0, burst=1, max_concurrent=1, weight=2.0)},
+                                     clock=lambda: 0.0, max_tenants=2)
+    busy = [controller.tenant_costs({company_id: 1}) for company_id in (1, 2)]
+    assert busy == [{1: 1}, {2: 1}] and all(controller.try_admit(c) is None for c in busy)
+
+    # the LRU is full of companies in flight: new ones share the default-limited OTHER bucket
+    assert controller.tenant_costs({3: 1, 4: 1, 7: 1}) == {"other": 2, 7: 1}
+    assert controller.try_admit({5: 1}) is None and controller.try_admit({6: 1}) is None
+    assert controller.try_admit({8: 1}) == ("other", "rate_limited", 1)
+    assert controller.in_flight() == {"other": 4}  # companies 1 and 2 too: 7 is the only own series
+
+    # an idle company is evicted to make room; ids sprayed by clients never grow the state
+    controller.release(busy[0])
+    assert controller.tenant_costs({9: 1}) == {9: 1} and controller.evictions == 1
+    for company_id in range(100, 1100):
+        costs = controller.tenant_costs({company_id: 1})
+        assert controller.try_admit(costs) is None
+        controller.release(costs)
+    stats = controller.describe()
+    assert stats["tracked"] == 2 and stats["evictions"] == 1001
+    assert set(stats["tenants"]) == {"other", "7", "2", "1099"}  # 2 is still in flight
+
+
+def test_saturated_pool_is_shared_fairly_between_tenants():
+    async def scenario():
+        slots = FairSemaphore(1)
+        await slots.acquire("idle")
+        order = []
+
+        async def session(tenant, weight=1.0):
+            await slots.acquire(tenant, weight)
+            order.append(tenant)
+            slots.release()
+
+        tasks = [asyncio.create_task(session("burst")) for _ in range(20)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(session("quiet")) for _ in range(2)]
+        tasks += [asyncio.create_task(session("gold", weight=3)) for _ in range(6)]
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*tasks)
+        assert slots.in_use == 0 and slots.describe()["tenants"]["burst"]["queued"] == 20
+        return order
+
+    order = asyncio.run(scenario())
+    # FIFO would serve the quiet tenant after the 20 queued burst requests; here each of its
+    # requests waits for at most one of every other tenant's (three of gold's, at weight 3)
+    assert [i for i, t in enumerate(order) if t == "quiet"] == [1, 6]
+    # weight 3: the gold tenant's six requests go through in the time burst gets about two
+    last_gold = max(i for i, t in enumerate(order) if t == "gold")
+    assert order[:last_gold].count("burst") <= 3
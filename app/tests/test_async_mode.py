@@ -0,0 +1,28 @@
+def test_async_inbound_and_history(async_client):
+    payload = {"company_id": 1, "channel_id": 1, "from": "+15550002222", "text": "async hi",
+               "channel_message_id": "async-1"}
+    r = async_client.post("/webhooks/inbound", json=payload)
+    assert r.status_code == 201, r.text
+    conv_id = r.json()["id"]
+
+    assert async_client.post("/webhooks/inbound", json=payload).status_code == 200  # retry is deduplicated
+
+    msgs = async_client.get(f"/conversations/{conv_id}/messages").json()
+    assert [m["sender"] for m in msgs] == ["contact", "ai"]
+    assert async_client.get(f"/conversations/{conv_id}").json()["owner_id"] == r.json()["owner_id"]
+
+
+def test_async_agent_message_and_toggle(async_client):
+    r = async_client.post("/conversations/1/messages", json={"author_id": 2, "text": "Taking over"})
+    assert r.status_code == 201 and r.json()["sender"] == "agent"
+    assert async_client.post("/conversations/1/messages", json={"author_id": 4, "text": "x"}).status_code == 400
+
+    assert async_client.post("/conversations/1/transfer-toggle").json()["detail"] == "switched ownership to human"
+    assert async_client.post("/conversations/1/transfer-toggle").json()["detail"] == "switched ownership to ai"
+    assert async_client.get("/conversations/404").status_code == 404
+
+
+def test_async_routes_use_the_async_pool(async_client):
+    async_client.get("/companies/1/users")
+    stats = [s for s in async_client.get("/system/db/pool").json() if s.get("async")]
+    assert stats and stats[0]["checkouts"] >= 1 and stats[0]["checked_out"] == 0
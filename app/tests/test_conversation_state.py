@@ -0,0 +1,70 @@
+from sqlalchemy.orm import Session
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+
+
+def _inbound(client, phone, text="hi"):
+    r = client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": phone, "text": text})
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _state(db, conv_id):
+    conv = db.get(DAOConversation, conv_id)
+    last = db.query(DAOMessage).filter(DAOMessage.conversation_id == conv_id).order_by(DAOMessage.id.desc()).first()
+    count = db.query(DAOMessage).filter(DAOMessage.conversation_id == conv_id).count()
+    return (conv.message_count, conv.last_message_id, conv.last_message_at is not None), (count, last.id, True)
+
+
+def test_state_follows_every_write_path(local_client, sqlite_db):
+    conv_id = _inbound(local_client, "+15550600000")["id"]  # contact + AI reply
+    _inbound(local_client, "+15550600000", "again")
+    local_client.post(f"/conversations/{conv_id}/messages", json={"author_id": 2, "text": "agent here"})
+    local_client.post("/webhooks/inbound/batch", json={"messages": [
+        {"company_id": 1, "channel_id": 1, "from": "+15550600000", "text": "bulk 1"},
+        {"company_id": 1, "channel_id": 1, "from": "+15550600000", "text": "bulk 2"},
+    ]})
+
+    with Session(sqlite_db) as db:
+        stored, expected = _state(db, conv_id)
+        assert stored == expected
+        assert stored[0] == 9
+
+
+def test_closed_conversation_is_not_reused(local_client):
+    first = _inbound(local_client, "+15550700000")
+    r = local_client.post(f"/conversations/{first['id']}/close")
+    assert r.status_code == 200 and r.json()["status"] == "closed"
+
+    second = _inbound(local_client, "+15550700000", "back again")
+    assert second["id"] != first["id"] and second["status"] == "open"
+    assert local_client.post("/conversations/999999/close").status_code == 404
+
+
+def test_inbox_is_keyset_paginated_by_recency(local_client):
+    ids = [_inbound(local_client, f"+1555080{i:04d}")["id"] for i in range(5)]
+    _inbound(local_client, "+15550800001", "bump")  # most recent activity now
+
+    r = local_client.get("/companies/1/conversations", params={"limit": 3})
+    page = r.json()
+    assert [c["id"] for c in page] == [ids[1], ids[4], ids[3]]
+    assert page[0]["message_count"] == 4
+    cursor = r.headers["X-Next-Before-Message-Id"]
+    assert cursor == str(page[-1]["last_message_id"])
+
+    rest = local_client.get("/companies/1/conversations", params={"limit": 3, "before_message_id": cursor})
+    assert [c["id"] for c in rest.json()] == [ids[2], ids[0], 1]  # seeded conversation 1 is the oldest
+    assert "X-Next-Before-Message-Id" not in rest.headers
+
+    local_client.post(f"/conversations/{ids[4]}/close")
+    open_ids = [c["id"] for c in local_client.get("/companies/1/conversations").json()]
+    closed = local_client.get("/companies/1/conversations", params={"status": "closed"}).json()
+    assert ids[4] not in open_ids and [c["id"] for c in closed] == [ids[4]]
+
+
+def test_inbox_on_async_path(async_client):
+    conv_id = async_client.post("/webhooks/inbound", json={"company_id": 2, "channel_id": 2, "from": "+1555",
+                                                           "text": "hi"}).json()["id"]
+    rows = async_client.get("/companies/2/conversations").json()
+    assert rows[0]["id"] == conv_id and rows[0]["message_count"] == 2
+    assert async_client.post(f"/conversations/{conv_id}/close").json()["status"] == "closed"
@@ -0,0 +1,22 @@
+from app.db_utils.db_connection import DBConn, get_engine
+
+
+def test_requests_share_one_engine(local_client):
+    engine = get_engine()
+    for _ in range(5):
+        r = local_client.get("/conversations/1")
+        assert r.status_code == 200
+    assert get_engine() is engine
+    assert DBConn().connect().get_bind() is engine
+
+
+def test_pool_stats_endpoint(local_client):
+    local_client.get("/conversations/1/messages")
+    r = local_client.get("/system/db/pool")
+    assert r.status_code == 200
+    stats = {s["db_label"]: s for s in r.json()}
+    main = stats["main"]
+    assert main["initialized"] is True
+    assert main["checked_out"] == 0  # every request gave its connection back
+    assert main["checkouts"] >= 1
+    assert main["wait_seconds_total"] >= 0
@@ -0,0 +1,197 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import events
+from app.services.events import (
+    InMemoryTransport, LocalBroker, RelayBroker, company_topic, conversation_topic, sse_stream,
+)
+
+
+async def _drain(sub, timeout=0.05):
+    items = []
+    while True:
+        try:
+            item = await sub.next(timeout=timeout)
+        except StopAsyncIteration:
+            return items
+        if item is None:
+            return items
+        items.append(item)
+
+
+def _types(items):
+    return [event["type"] for _, event in items]
+
+
+def test_local_fan_out_and_resume():
+    async def scenario():
+        broker = LocalBroker(replay_size=3)
+        await broker.start()
+        conv_sub = broker.subscribe([conversation_topic(1)])
+        company_sub = broker.subscribe([company_topic(7)])
+        broker.publish([conversation_topic(1), company_topic(7)], {"type": "a"})
+        broker.publish([conversation_topic(2), company_topic(7)], {"type": "b"})
+        first = await _drain(conv_sub)
+        assert _types(first) == ["a"]
+        assert _types(await _drain(company_sub)) == ["a", "b"]
+        conv_sub.close()
+
+        # reconnect after missing two events: they are replayed, then live events follow
+        broker.publish([conversation_topic(1)], {"type": "c"})
+        broker.publish([conversation_topic(1)], {"type": "d"})
+        resumed = broker.subscribe([conversation_topic(1)], last_event_id=first[-1][0])
+        broker.publish([conversation_topic(1)], {"type": "e"})
+        assert _types(await _drain(resumed)) == ["c", "d", "e"]
+
+        # the log only keeps 3 events per topic: "a" is gone, the client must reload
+        assert _types(await _drain(broker.subscribe([conversation_topic(1)], f"{broker._epoch}-0"))) == \
+            ["reset", "c", "d", "e"]
+        # an id from a previous process run
+        assert _types(await _drain(broker.subscribe([conversation_topic(1)], "1-1"))) == ["reset"]
+        await broker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_cut_off_instead_of_buffering():
+    async def scenario():
+        broker = LocalBroker(buffer_size=3)
+        await broker.start()
+        slow = broker.subscribe([company_topic(1)])
+        for i in range(5):
+            broker.publish([company_topic(1)], {"type": "message.created", "n": i})
+        await asyncio.sleep(0)
+        assert await _drain(slow) == []
+        assert slow.lagged
+        assert broker.describe()["lagged"] == 1
+        assert broker.describe()["subscribers"] == 1
+        slow.close()
+        assert broker.describe()["subscribers"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_relay_delivers_events_published_by_other_workers():
+    async def scenario():
+        transport = InMemoryTransport(maxlen=2)
+        worker_a = RelayBroker(transport, block_ms=20)
+        worker_b = RelayBroker(transport, block_ms=20)
+        await worker_a.start()
+        await worker_b.start()
+        sub = worker_b.subscribe([conversation_topic(1)])
+        worker_a.publish([conversation_topic(1)], {"type": "a"})
+        worker_a.publish([conversation_topic(2)], {"type": "other"})
+        received = await _drain(sub, timeout=1)
+        assert _types(received) == ["a"]
+
+        worker_a.publish([conversation_topic(1)], {"type": "b"})
+        resumed = worker_a.subscribe([conversation_topic(1)], last_event_id=received[-1][0])
+        assert _types(await _drain(resumed, timeout=0.2)) == ["b"]
+        # "a" fell out of the 2-entry transport log
+        assert _types(await _drain(worker_a.subscribe([conversation_topic(1)], "0"), timeout=0.2))[0] == "reset"
+        await worker_a.stop()
+        await worker_b.stop()
+
+    asyncio.run(scenario())
+
+
+def test_resume_with_more_missed_events_than_the_buffer_resets():
+    async def scenario():
+        local = LocalBroker(buffer_size=4)
+        await local.start()
+        for i in range(10):
+            local.publish([conversation_topic(1)], {"type": f"x{i}"})
+        first = f"{local._epoch}-1"
+        assert _types(await _drain(local.subscribe([conversation_topic(1)], first))) == ["reset"]
+        assert _types(await _drain(local.subscribe([conversation_topic(1)], f"{local._epoch}-7"))) == \
+            ["x7", "x8", "x9"]
+
+        # the relay counts only the topic's own events against the buffer
+        relay = RelayBroker(InMemoryTransport(), buffer_size=4, block_ms=20)
+        await relay.start()
+        for i in range(10):
+            relay.publish([conversation_topic(2)], {"type": "other"})
+            if i % 3 == 0:
+                relay.publish([conversation_topic(1)], {"type": f"x{i}"})
+        assert _types(await _drain(relay.subscribe([conversation_topic(1)], "0"), timeout=0.2)) == \
+            ["x0", "x3", "x6", "x9"]
+        relay.publish([conversation_topic(1)], {"type": "x10"})
+        await asyncio.sleep(0.1)
+        assert _types(await _drain(relay.subscribe([conversation_topic(1)], "0"), timeout=0.2)) == ["reset"]
+        await local.stop()
+        await relay.stop()
+
+    asyncio.run(scenario())
+
+
+def test_relay_resume_misses_nothing_published_while_reading_the_log(monkeypatch):
+    async def scenario():
+        transport = InMemoryTransport()
+        broker = RelayBroker(transport, block_ms=20)
+        await broker.start()
+        broker.publish([conversation_topic(1)], {"type": "a"})
+        read_after = transport.read_after
+
+        def slow_read_after(last_id, block_ms=0):
+            entries = read_after(last_id, block_ms)
+            if not block_ms:  # the replay read: "b" is published and relayed meanwhile
+                transport.append('{"topics": ["conversation:1"], "event": {"type": "b"}}')
+                time.sleep(0.1)
+            return entries
+
+        monkeypatch.setattr(transport, "read_after", slow_read_after)
+        start = time.perf_counter()
+        resumed = broker.subscribe([conversation_topic(1)], "0")
+        assert time.perf_counter() - start < 0.05  # the transport is not read on the event loop
+        assert _types(await _drain(resumed, timeout=0.3)) == ["a", "b"]
+        await broker.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def fresh_broker():
+    previous = events.get_broker()
+    yield events.set_broker(LocalBroker())
+    events.set_broker(previous)
+
+
+def test_services_publish_after_commit(fresh_broker, local_client):
+    sub = local_client.portal.call(_subscribe, fresh_broker, [company_topic(1)])
+    conv = local_client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": "+15557000000",
+                                                        "text": "hi"}).json()
+    local_client.post(f"/conversations/{conv['id']}/transfer-toggle")
+    local_client.post(f"/conversations/{conv['id']}/messages", json={"author_id": 2, "text": "agent here"})
+    local_client.post(f"/conversations/{conv['id']}/close")
+
+    received = local_client.portal.call(_drain, sub)
+    assert _types(received) == ["message.created", "message.created", "conversation.owner_changed",
+                                "message.created", "conversation.closed"]
+    assert [e["message"]["sender"] for _, e in received if e["type"] == "message.created"] == \
+        ["contact", "ai", "agent"]
+    assert all(e["conversation_id"] == conv["id"] and e["company_id"] == 1 for _, e in received)
+
+    assert local_client.get("/conversations/999999/events").status_code == 404
+
+
+def test_sse_stream_format(fresh_broker, local_client):
+    async def read(n):
+        stream = sse_stream([conversation_topic(5)], heartbeat=0.01)
+        chunks = [await stream.__anext__()]
+        fresh_broker.publish([conversation_topic(5)], {"type": "conversation.closed", "conversation_id": 5})
+        for _ in range(n):
+            chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return chunks
+
+    chunks = local_client.portal.call(read, 2)
+    assert chunks[0] == "retry: 2000\n\n"
+    assert chunks[1].startswith(f"id: {fresh_broker._epoch}-1\nevent: conversation.closed\ndata: {{")
+    assert chunks[2] == ": keepalive\n\n"
+    assert fresh_broker.describe()["subscribers"] == 0
+
+
+async def _subscribe(broker, topics):
+    return broker.subscribe(topics)
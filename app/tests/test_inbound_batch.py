@@ -0,0 +1,91 @@
+from sqlalchemy.orm import Session
+from app.dao.channel import DAOChannel
+from app.dao.contact import DAOContact
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+
+
+def _item(phone, text="hi", company_id=1, channel_id=1, **extra):
+    return {"company_id": company_id, "channel_id": channel_id, "from": phone, "text": text, **extra}
+
+
+def _batch(client, items):
+    r = client.post("/webhooks/inbound/batch", json={"messages": items})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_batch_matches_single_endpoint_semantics(local_client, sqlite_db):
+    existing = local_client.post("/webhooks/inbound", json=_item("+15550100000")).json()
+
+    body = _batch(local_client, [
+        _item("+15550100000", "again"),
+        _item("+15550100001", "new one"),
+        _item("+15550100001", "second to new one"),
+        _item("+15550100002", company_id=7, channel_id=70),  # unknown tenant is created like the single path
+    ])
+    statuses = [r["status"] for r in body["results"]]
+    assert statuses == ["appended", "created", "appended", "created"]
+    assert body["accepted"] == 4 and body["errors"] == 0
+    assert body["results"][0]["conversation_id"] == existing["id"]
+    assert body["results"][1]["conversation_id"] == body["results"][2]["conversation_id"]
+
+    with Session(sqlite_db) as db:
+        conv_id = body["results"][1]["conversation_id"]
+        msgs = db.query(DAOMessage).filter(DAOMessage.conversation_id == conv_id).order_by(DAOMessage.id).all()
+        assert [(m.sender, m.content) for m in msgs][::2] == [("contact", "new one"), ("contact", "second to new one")]
+        assert [m.sender for m in msgs] == ["contact", "ai", "contact", "ai"]
+        assert db.query(DAOContact).filter(DAOContact.phone == "+15550100001").count() == 1
+        assert db.get(DAOConversation, body["results"][3]["conversation_id"]).company_id == 7
+
+
+def test_batch_reports_errors_and_duplicates_per_item(local_client, sqlite_db):
+    local_client.post("/webhooks/inbound", json=_item("+15550200000", channel_message_id="wamid.1"))
+
+    body = _batch(local_client, [
+        _item("+15550200000", channel_message_id="wamid.1"),  # stored by the single endpoint
+        {"company_id": 1, "channel_id": 1, "text": "no sender"},
+        _item("+15550200001", channel_message_id="wamid.2"),
+        _item("+15550200001", channel_message_id="wamid.2"),  # repeated within the batch
+        _item("+15550200009", channel_message_id="wamid.2"),  # same delivery id, another phone
+    ])
+    results = body["results"]
+    assert [r["status"] for r in results] == ["duplicate", "error", "created", "duplicate", "duplicate"]
+    assert results[1]["error"].startswith("from")
+    assert results[3]["conversation_id"] == results[4]["conversation_id"] == results[2]["conversation_id"]
+    assert (body["accepted"], body["duplicates"], body["errors"]) == (1, 3, 1)
+    with Session(sqlite_db) as db:  # the repeat's phone got no contact, nor an empty conversation
+        assert db.query(DAOContact).filter(DAOContact.phone == "+15550200009").count() == 0
+
+    # the whole batch is idempotent when redelivered
+    again = _batch(local_client, [_item("+15550200001", channel_message_id="wamid.2")])
+    assert again["results"][0] == {"index": 0, "status": "duplicate",
+                                   "conversation_id": results[2]["conversation_id"], "error": None}
+
+
+def test_new_channel_id_sent_for_two_companies(local_client, sqlite_db):
+    body = _batch(local_client, [_item("+15550500000", company_id=8, channel_id=80),
+                                 _item("+15550500001", company_id=6, channel_id=80)])
+    assert [r["status"] for r in body["results"]] == ["created", "created"]
+    with Session(sqlite_db) as db:
+        # created once, for the lowest company id, as sequential deliveries in that order would
+        assert db.get(DAOChannel, 80).company_id == 6
+        assert {db.get(DAOConversation, r["conversation_id"]).company_id for r in body["results"]} == {6, 8}
+
+
+def test_batch_statement_count_does_not_grow_with_size(local_client, record_sql):
+    _batch(local_client, [_item("+15550300000")])  # warm the tenant cache
+
+    with record_sql() as rec:
+        body = _batch(local_client, [_item(f"+1555031{i:04d}", channel_message_id=f"m{i}") for i in range(200)])
+    assert body["accepted"] == 200
+    assert rec.commits == 1
+    # dedup lookup, contacts select/insert/select, conversations select/insert/select, messages insert,
+    # conversation state update, search index postings (MySQL also reads the new message ids back)
+    assert len(rec.statements) <= 10, rec.statements
+
+
+def test_batch_on_async_path(async_client):
+    body = async_client.post("/webhooks/inbound/batch",
+                             json={"messages": [_item("+15550400000"), _item("+15550400000", "two")]}).json()
+    assert [r["status"] for r in body["results"]] == ["created", "appended"]
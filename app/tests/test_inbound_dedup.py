@@ -0,0 +1,49 @@
+from sqlalchemy.orm import Session
+from app.dao.message import DAOMessage
+from app.services.cache import InMemoryLRUBackend
+from app.services.dedup import set_dedup_backend
+
+PAYLOAD = {"company_id": 1, "channel_id": 1, "from": "+15550003333", "text": "hi", "channel_message_id": "wamid-1"}
+
+
+def _message_count(engine):
+    with Session(engine) as db:
+        return db.query(DAOMessage).count()
+
+
+def test_retry_returns_original_conversation_from_cache(local_client, sqlite_db, record_sql):
+    first = local_client.post("/webhooks/inbound", json=PAYLOAD)
+    assert first.status_code == 201
+    count = _message_count(sqlite_db)
+
+    with record_sql() as rec:
+        retry = local_client.post("/webhooks/inbound", json=PAYLOAD)
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert len(rec.statements) == 1 and rec.commits == 0  # one conversation lookup by primary key
+    assert _message_count(sqlite_db) == count
+
+
+def test_unique_index_catches_retry_the_cache_missed(local_client, sqlite_db):
+    first = local_client.post("/webhooks/inbound", json=PAYLOAD)
+    count = _message_count(sqlite_db)
+
+    set_dedup_backend(InMemoryLRUBackend())  # e.g. the retry landed on another worker
+    retry = local_client.post("/webhooks/inbound", json=PAYLOAD)
+    assert retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert _message_count(sqlite_db) == count
+
+
+def test_same_provider_id_on_another_channel_is_not_a_duplicate(local_client):
+    local_client.post("/webhooks/inbound", json=PAYLOAD)
+    other = local_client.post("/webhooks/inbound", json=PAYLOAD | {"company_id": 2, "channel_id": 2})
+    assert other.status_code == 201
+
+
+def test_messages_without_provider_id_are_never_deduplicated(local_client, sqlite_db):
+    payload = {k: v for k, v in PAYLOAD.items() if k != "channel_message_id"}
+    local_client.post("/webhooks/inbound", json=payload)
+    count = _message_count(sqlite_db)
+    assert local_client.post("/webhooks/inbound", json=payload).status_code == 201
+    assert _message_count(sqlite_db) == count + 2
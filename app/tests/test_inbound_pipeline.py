@@ -0,0 +1,50 @@
+from sqlalchemy.orm import Session
+from app.dao.contact import DAOContact
+from app.dao.message import DAOMessage
+
+# statements per inbound message; the first call also fills the tenant cache.
+# Both include one UPDATE of the conversation's last-message pointer and count,
+# and one INSERT of the messages' search index postings.
+MAX_STATEMENTS_EXISTING_CONVERSATION = 6
+MAX_STATEMENTS_NEW_CONVERSATION = 10
+
+
+def _inbound(client, phone, text="hi"):
+    payload = {"company_id": 1, "channel_id": 1, "from": phone, "text": text}
+    r = client.post("/webhooks/inbound", json=payload)
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def test_inbound_statement_cap_and_single_commit(local_client, record_sql):
+    with record_sql() as rec:
+        conv = _inbound(local_client, "+15550007777")
+    assert rec.commits == 1
+    assert len(rec.statements) <= MAX_STATEMENTS_NEW_CONVERSATION, rec.statements
+
+    with record_sql() as rec:
+        again = _inbound(local_client, "+15550007777", "second")
+    assert again["id"] == conv["id"]
+    assert rec.commits == 1
+    assert len(rec.statements) <= MAX_STATEMENTS_EXISTING_CONVERSATION, rec.statements
+
+
+def test_inbound_reuses_contact_and_writes_both_messages(local_client, sqlite_db):
+    first = _inbound(local_client, "+15550008888", "one")
+    second = _inbound(local_client, "+15550008888", "two")
+    assert first["id"] == second["id"]
+
+    with Session(sqlite_db) as db:
+        contacts = db.query(DAOContact).filter(DAOContact.phone == "+15550008888").all()
+        assert len(contacts) == 1
+        senders = [m.sender for m in db.query(DAOMessage)
+                   .filter(DAOMessage.conversation_id == first["id"]).order_by(DAOMessage.id)]
+        assert senders == ["contact", "ai", "contact", "ai"]
+
+
+def test_inbound_creates_missing_company_and_channel(local_client):
+    r = local_client.post("/webhooks/inbound", json={"company_id": 9, "channel_id": 9, "from": "+1555", "text": "x"})
+    assert r.status_code == 201
+    assert r.json()["company_id"] == 9
+    msgs = local_client.get(f"/conversations/{r.json()['id']}/messages").json()
+    assert msgs[-1]["content"].startswith("Auto-reply from AI bot (Company 9)")
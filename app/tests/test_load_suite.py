@@ -0,0 +1,64 @@
+import copy
+import json
+import os
+
+from app.benchmarks.load_suite import LoadConfig, SCENARIOS, compare, conversation_sizes, run_suite, zipf_weights
+
+
+def test_zipf_sizes_are_skewed():
+    weights = zipf_weights(100, 1.1)
+    assert abs(sum(weights) - 1) < 1e-9
+    sizes = conversation_sizes(LoadConfig(contacts=100, history=1000))
+    assert sizes == sorted(sizes, reverse=True) and min(sizes) == 1
+    assert sum(sizes[:10]) > sum(sizes[10:])  # the top 10% of conversations hold most messages
+
+
+def test_suite_reports_every_scenario(sqlite_db):
+    config = LoadConfig(tenants=2, contacts=5, history=20, requests=10, warmup=2)
+    report = run_suite(config)
+    assert set(report["scenarios"]) == set(SCENARIOS) | {"mixed"}
+    assert report["environment"]["dialect"] == "sqlite"
+    for result in report["scenarios"].values():
+        assert result["requests"] == 10 and result["errors"] == 0
+        assert result["throughput_rps"] > 0
+        assert 0 < result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+        assert 0 < result["queries_per_request"] <= result["queries_per_request_max"]
+
+
+def test_concurrent_clients_count_each_requests_queries(sqlite_db):
+    config = LoadConfig(tenants=2, contacts=5, history=20, requests=20, warmup=2, concurrency=4)
+    report = run_suite(config, scenarios=("list_messages", "transfer_toggle", "mixed"))
+    assert report["config"]["concurrency"] == 4
+    for result in report["scenarios"].values():
+        assert result["requests"] == 20 and result["errors"] == 0
+    # statements run in the threadpool are still attributed to the request that issued them
+    assert report["scenarios"]["transfer_toggle"]["queries_per_request"] == 2
+    mixed = report["scenarios"]["mixed"]
+    assert 0 < mixed["queries_per_request"] <= mixed["queries_per_request_max"]
+
+
+def test_committed_baselines_cover_every_scenario():
+    directory = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks", "baselines")
+    for name, concurrency in (("load_suite.json", 1), ("load_suite_c16.json", 16)):
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            baseline = json.load(f)
+        assert baseline["config"]["concurrency"] == concurrency
+        assert set(baseline["scenarios"]) == set(SCENARIOS) | {"mixed"}
+        assert compare(baseline, baseline) == []
+
+
+def test_compare_flags_regressions():
+    baseline = {"scenarios": {"inbound": {"requests": 10, "errors": 0, "throughput_rps": 100.0,
+                                          "latency_ms": {"p50": 5.0, "p95": 10.0, "p99": 20.0},
+                                          "queries_per_request": 5.0, "queries_per_request_max": 5}}}
+    report = copy.deepcopy(baseline)
+    report["scenarios"]["inbound"]["throughput_rps"] = 90.0  # within tolerance
+    assert compare(report, baseline, tolerance=0.25) == []
+
+    report["scenarios"]["inbound"].update(throughput_rps=50.0, queries_per_request=6.0)
+    report["scenarios"]["inbound"]["latency_ms"]["p95"] = 30.0
+    assert compare(report, baseline, tolerance=0.25) == [
+        "inbound: throughput 100.0 -> 50.0 req/s",
+        "inbound: p95 10.0 -> 30.0 ms",
+        "inbound: queries/request 5.0 -> 6.0",
+    ]
@@ -0,0 +1,80 @@
+import json
+from typing import List
+import pytest
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from app.dao.message import DAOMessage
+from app.schemas.conversations import ConversationOut, InboxConversationOut
+from app.schemas.messages import MessageOut
+from app.schemas.users import UserOut
+
+
+def _fill(engine, conversation_id=1, n=25):
+    with Session(engine) as db:
+        db.add_all([DAOMessage(conversation_id=conversation_id, sender="contact", content=f"m{i}") for i in range(n)])
+        db.commit()
+
+
+def test_keyset_pages_walk_the_whole_history(local_client, sqlite_db):
+    _fill(sqlite_db)
+    seen, after_id = [], 0
+    while True:
+        r = local_client.get("/conversations/1/messages", params={"limit": 10, "after_id": after_id})
+        assert r.status_code == 200
+        seen += [m["id"] for m in r.json()]
+        after_id = r.headers.get("X-Next-After-Id")
+        if not after_id:
+            break
+    assert len(seen) == 27  # 2 seeded + 25
+    assert seen == sorted(seen) and len(set(seen)) == len(seen)
+
+
+def test_before_id_returns_previous_page_in_ascending_order(local_client, sqlite_db):
+    _fill(sqlite_db)
+    last = local_client.get("/conversations/1/messages", params={"limit": 1000}).json()[-1]["id"]
+    r = local_client.get("/conversations/1/messages", params={"before_id": last, "limit": 5})
+    ids = [m["id"] for m in r.json()]
+    assert ids == list(range(last - 5, last))
+    assert r.headers["X-Next-Before-Id"] == str(ids[0])
+
+
+def test_default_page_is_the_newest_and_scrolls_back(local_client, sqlite_db):
+    _fill(sqlite_db)
+    newest = local_client.get("/conversations/1/messages", params={"limit": 10})
+    ids = [m["id"] for m in newest.json()]
+    everything = local_client.get("/conversations/1/messages", params={"limit": 1000, "after_id": 0}).json()
+    assert ids == [m["id"] for m in everything][-10:]
+    seen, before_id = ids, newest.headers["X-Next-Before-Id"]
+    while before_id:
+        r = local_client.get("/conversations/1/messages", params={"limit": 10, "before_id": before_id})
+        seen = [m["id"] for m in r.json()] + seen
+        before_id = r.headers.get("X-Next-Before-Id")
+    assert len(seen) == 27 and seen == sorted(seen)
+
+
+def test_ndjson_export_streams_every_message(local_client, sqlite_db):
+    _fill(sqlite_db, n=2500)
+    r = local_client.get("/conversations/1/messages/export")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert len(lines) == 2502
+    assert set(lines[0]) == {"id", "conversation_id", "sender", "content"}
+
+    assert local_client.get("/conversations/999/messages/export").status_code == 404
+
+
+@pytest.mark.parametrize("client_fixture", ["local_client", "async_client"])
+def test_projection_responses_match_the_response_models(request, client_fixture, sqlite_db):
+    client = request.getfixturevalue(client_fixture)
+    _fill(sqlite_db, n=3)
+    checks = [("/conversations/1", ConversationOut), ("/conversations/1/messages", List[MessageOut]),
+              ("/companies/1/conversations", List[InboxConversationOut]), ("/companies/1/users", List[UserOut])]
+    for url, model in checks:
+        r = client.get(url)
+        assert r.status_code == 200 and r.headers["content-type"] == "application/json"
+        adapter = TypeAdapter(model)
+        assert r.json() == adapter.dump_python(adapter.validate_json(r.content), mode="json")
+    assert client.get("/companies/1/users").json()
+    schema = client.app.openapi()["paths"]["/companies/{company_id}/users"]["get"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"]["items"]["$ref"].endswith("/UserOut")
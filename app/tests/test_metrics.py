@@ -0,0 +1,58 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from app.services import metrics
+
+
+def _inbound(client, phone, **extra):
+    r = client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": phone, "text": "hi", **extra})
+    assert r.status_code in (200, 201), r.text
+    return r.json()
+
+
+def test_request_metrics_per_route_template(local_client):
+    labels = ("POST", "/webhooks/inbound")
+    before = (metrics.http_latency.count(labels), metrics.http_statements.sum(labels),
+              metrics.http_commits.sum(labels))
+    conv = _inbound(local_client, "+15558000000")
+    _inbound(local_client, "+15558000000")
+
+    assert metrics.http_latency.count(labels) == before[0] + 2
+    assert metrics.http_statements.sum(labels) - before[1] >= 4
+    assert metrics.http_commits.sum(labels) - before[2] == 2  # one unit of work per webhook
+
+    local_client.get(f"/conversations/{conv['id']}")
+    local_client.get("/conversations/999999")
+    body = local_client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/conversations/{conversation_id}",status="404"}' in body
+    assert 'http_request_db_statements_count{method="POST",route="/webhooks/inbound"}' in body
+    assert 'http_request_db_pool_wait_seconds_bucket{method="POST",route="/webhooks/inbound",le="+Inf"}' in body
+    assert 'db_statements_total{db_label="main"}' in body
+    assert 'db_pool_checked_out{db_label="main"} 0' in body
+
+
+def test_slow_request_log_includes_sql(sqlite_db, monkeypatch, caplog):
+    monkeypatch.setenv("METRICS_SLOW_REQUEST_MS", "0.001")
+    from app.main import create_app
+
+    with TestClient(create_app(async_mode=False)) as client, caplog.at_level(logging.WARNING, logger=metrics.__name__):
+        _inbound(client, "+15558100000")
+        client.get("/metrics")
+    slow = [r.getMessage() for r in caplog.records if r.name == metrics.__name__]
+    assert slow[0].startswith("slow request POST /webhooks/inbound -> 201")
+    assert "INSERT INTO messages" in slow[0]
+    assert metrics.http_slow_requests.value(("POST", "/webhooks/inbound")) >= 1
+
+
+def test_histogram_exposition():
+    h = metrics.Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5):
+        h.observe(value, ("/x",))
+    assert h.render()[2:] == [
+        't_seconds_bucket{route="/x",le="0.1"} 1',
+        't_seconds_bucket{route="/x",le="1.0"} 2',
+        't_seconds_bucket{route="/x",le="+Inf"} 3',
+        't_seconds_sum{route="/x"} 5.55',
+        't_seconds_count{route="/x"} 3',
+    ]
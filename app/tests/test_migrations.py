@@ -0,0 +1,79 @@
+import shutil
+
+import pytest
+import sqlalchemy
+
+from app.db_utils.migrations import (
+    SQL_DIR, MigrationError, applied_versions, baseline, discover, pending, split_statements, upgrade,
+)
+
+
+def test_repo_migrations_are_ordered_and_record_themselves():
+    migrations = discover()
+    assert [m.version for m in migrations] == [f"{i:03d}" for i in range(1, len(migrations) + 1)]
+    for m in migrations:
+        with open(m.path, encoding="utf-8") as f:
+            statements = split_statements(f.read())
+        # docker-entrypoint-initdb.d applies the files without the runner
+        assert statements[-1] == f"INSERT INTO schema_migrations (version, name) VALUES ('{m.version}', '{m.name}')"
+
+
+def test_split_statements_skips_comments():
+    sql = "-- header; not a statement\nCREATE TABLE a (id INT);\n\nCREATE INDEX ix ON a (id)\n  ;\n"
+    assert split_statements(sql) == ["CREATE TABLE a (id INT)", "CREATE INDEX ix ON a (id)"]
+
+
+@pytest.fixture
+def migration_dir(tmp_path):
+    sql_dir = tmp_path / "sql"
+    sql_dir.mkdir()
+    (sql_dir / "001_init.sql").write_text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT);\n")
+    (sql_dir / "002_items_name.sql").write_text("-- lookups by name\nCREATE INDEX ix_items_name ON items (name);\n")
+    (sql_dir / "notes.txt").write_text("ignored")
+    return sql_dir
+
+
+def test_upgrade_applies_pending_once(tmp_path, migration_dir):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    assert upgrade(engine, str(migration_dir)) == ["001_init", "002_items_name"]
+    assert applied_versions(engine) == {"001", "002"}
+    assert upgrade(engine, str(migration_dir)) == []
+
+    (migration_dir / "003_items_extra.sql").write_text("ALTER TABLE items ADD COLUMN extra TEXT;\n")
+    assert [m.name for m in pending(engine, str(migration_dir))] == ["003_items_extra"]
+    assert upgrade(engine, str(migration_dir)) == ["003_items_extra"]
+    assert "ix_items_name" in {ix["name"] for ix in sqlalchemy.inspect(engine).get_indexes("items")}
+
+
+def test_legacy_database_needs_a_baseline(tmp_path, migration_dir):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    with pytest.raises(MigrationError):
+        upgrade(engine, str(migration_dir))
+
+    assert baseline(engine, "001", str(migration_dir)) == ["001_init"]
+    assert upgrade(engine, str(migration_dir)) == ["002_items_name"]
+
+
+def test_unique_contact_phones_merges_existing_duplicates(tmp_path):
+    sql_dir = tmp_path / "sql"
+    sql_dir.mkdir()
+    shutil.copy(f"{SQL_DIR}/002_contacts_unique_phone.sql", sql_dir)
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'm.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE contacts (id INTEGER PRIMARY KEY, company_id INTEGER NOT NULL, "
+                             "phone VARCHAR(50))")
+        conn.exec_driver_sql("CREATE TABLE conversations (id INTEGER PRIMARY KEY, contact_id INTEGER NOT NULL)")
+        # racing get-or-creates left three contacts for (1, +1); NULL phones are not duplicates
+        conn.exec_driver_sql("INSERT INTO contacts VALUES (1, 1, '+1'), (2, 1, '+1'), (3, 1, '+2'), (4, 2, '+1'), "
+                             "(5, 1, NULL), (6, 1, NULL), (7, 1, '+1')")
+        conn.exec_driver_sql("INSERT INTO conversations VALUES (10, 2), (11, 7), (12, 3), (13, 6)")
+    baseline(engine, "001", str(sql_dir))
+    assert upgrade(engine, str(sql_dir)) == ["002_contacts_unique_phone"]
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT id FROM contacts ORDER BY id").scalars().all() == [1, 3, 4, 5, 6]
+        assert conn.exec_driver_sql("SELECT id, contact_id FROM conversations ORDER BY id").all() == \
+            [(10, 1), (11, 1), (12, 3), (13, 6)]
+    assert "uq_contacts_company_phone" in {ix["name"] for ix in sqlalchemy.inspect(engine).get_indexes("contacts")}
@@ -0,0 +1,170 @@
+"""
+Query-plan regression harness: drives every service path through the API, records each
+statement with its parameters and runs EXPLAIN on it. Fails when a statement scans a
+whole table (or index) or sorts outside an index (filesort / temp b-tree).
+
+Runs on SQLite always, and on MySQL when TEST_MYSQL_URL points at a scratch database.
+"""
+
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.dao.conversation import DAOConversation
+from app.db_utils.segments import SegmentStore
+from app.services.archive import archive_idle, restore_conversation, set_archive_store
+
+from app.services.cache import InMemoryLRUBackend
+from app.services.dedup import set_dedup_backend
+from app.services.reply_queue import OutboxReplyQueue, ReplyJob
+from app.services.search import merge_pending, rebuild_company
+from app.services.tenant_cache import set_tenant_cache_backend
+
+
+@pytest.fixture(params=["sqlite_db", "mysql_db"])
+def plan_db(request):
+    return request.getfixturevalue(request.param)
+
+
+class Recorder:
+    def __init__(self, engine):
+        self.engine = engine
+        self.queries = {}  # statement -> first parameters seen
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and re.match(r"\s*(SELECT|UPDATE|DELETE)\b", statement, re.I):
+            self.queries.setdefault(statement, parameters)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def _workload(engine, archive_dir):
+    from app.main import create_app
+
+    def cold_caches():
+        set_tenant_cache_backend(InMemoryLRUBackend())
+        set_dedup_backend(InMemoryLRUBackend())
+
+    set_archive_store(SegmentStore(archive_dir))
+    with TestClient(create_app(async_mode=False)) as client:
+        # some volume, so the MySQL optimizer does not prefer scans of tiny tables
+        for company_id in (1, 2):
+            client.post("/webhooks/inbound/batch", json={"messages": [
+                {"company_id": company_id, "channel_id": company_id, "from": f"+1555{company_id}{i:05d}",
+                 "text": "seed", "channel_message_id": f"seed-{company_id}-{i}"} for i in range(300)]})
+        if engine.dialect.name == "mysql":
+            with engine.connect() as conn:
+                for table in ("companies", "channels", "users", "contacts", "conversations", "messages"):
+                    conn.exec_driver_sql(f"ANALYZE TABLE {table}")
+
+        with Recorder(engine) as rec:
+            cold_caches()
+            new = client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": "+15559990000",
+                                                         "text": "hi", "channel_message_id": "plan-1"}).json()
+            client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": "+15559990000",
+                                                   "text": "again"})
+            cold_caches()
+            client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": "+15559990000",
+                                                   "text": "hi", "channel_message_id": "plan-1"})  # duplicate
+            client.post("/webhooks/inbound", json={"company_id": 8, "channel_id": 80, "from": "+1555", "text": "x"})
+            cold_caches()
+            client.post("/webhooks/inbound/batch", json={"messages": [
+                {"company_id": 1, "channel_id": 1, "from": "+15559990000", "text": "b", "channel_message_id": "plan-1"},
+                {"company_id": 9, "channel_id": 90, "from": "+15559990001", "text": "b", "channel_message_id": "plan-2"},
+            ]})
+
+            conv_id = new["id"]
+            client.get(f"/conversations/{conv_id}")
+            client.get(f"/conversations/{conv_id}/messages", params={"limit": 2})
+            client.get(f"/conversations/{conv_id}/messages", params={"after_id": 1, "limit": 2})
+            client.get(f"/conversations/{conv_id}/messages", params={"before_id": 10 ** 6, "limit": 2})
+            client.get(f"/conversations/{conv_id}/messages/export").read()
+            client.post(f"/conversations/{conv_id}/messages", json={"author_id": 2, "text": "agent"})
+            cold_caches()
+            client.post(f"/conversations/{conv_id}/transfer-toggle")
+            cold_caches()
+            client.post(f"/conversations/{conv_id}/transfer-toggle")
+            client.get("/companies/1/users")
+            client.get("/companies/1/conversations", params={"limit": 5})
+            client.get("/companies/1/conversations", params={"before_message_id": 100, "limit": 5})
+            client.post(f"/conversations/{conv_id}/close")
+            client.get("/companies/1/conversations", params={"status": "closed"})
+
+            from app.db_utils.db_connection import get_sessionmaker
+
+            # archive tier: idle conversation archived, read through, restored
+            with engine.begin() as conn:
+                conn.execute(sqlalchemy.update(DAOConversation.__table__)
+                             .where(DAOConversation.id == conv_id)
+                             .values(last_message_at=datetime.utcnow() - timedelta(days=90)))
+            archive_idle(timedelta(days=30), batch_size=2, max_conversations=1)
+            client.get(f"/conversations/{conv_id}/messages", params={"limit": 2})
+            client.get(f"/conversations/{conv_id}/messages/export").read()
+            with get_sessionmaker()() as db:
+                restore_conversation(db, conv_id)
+
+            # message search: pending postings, merged blocks, rebuild
+            client.get("/companies/1/search", params={"q": "seed hi", "limit": 5})
+            merge_pending()
+            client.get("/companies/1/search", params={"q": "seed", "limit": 5})
+            client.get("/companies/1/search", params={"q": "seed", "before_id": 100, "limit": 5})
+            rebuild_company(2, batch_size=100)
+
+            # outbox reply jobs: enqueue, claim, retry, complete
+            outbox = OutboxReplyQueue()
+            with get_sessionmaker()() as db:
+                outbox.enqueue(db, ReplyJob(company_id=1, conversation_id=conv_id, ai_user_id=1,
+                                            company_name="Acme Corp", inbound_text="hi"))
+                db.commit()
+            jobs = outbox._claim_sync(8)
+            asyncio.run(outbox.retry(jobs[0], 0, "flaky"))
+            jobs = outbox._claim_sync(8)
+            with get_sessionmaker()() as db:
+                outbox.complete(db, jobs)
+                db.commit()
+    return rec.queries
+
+
+def _sqlite_problems(conn, statement, parameters):
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [detail for *_, detail in rows
+            if (detail.startswith("SCAN") and "CONSTANT ROW" not in detail) or "TEMP B-TREE" in detail]
+
+
+def _mysql_problems(conn, statement, parameters):
+    rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+    problems = []
+    for row in rows:
+        extra = row.get("Extra") or ""
+        if row.get("table") and not row["table"].startswith("<") and row.get("type") in ("ALL", "index"):
+            problems.append(f"{row['table']}: type={row['type']}")
+        if "filesort" in extra or "temporary" in extra:
+            problems.append(f"{row['table']}: {extra}")
+    return problems
+
+
+def test_service_queries_use_indexes(plan_db, tmp_path):
+    try:
+        queries = _workload(plan_db, str(tmp_path / "archive"))
+    finally:
+        set_archive_store(None)
+    assert len(queries) > 20  # the workload really went through the services
+
+    explain = _mysql_problems if plan_db.dialect.name == "mysql" else _sqlite_problems
+    failures = {}
+    with plan_db.connect() as conn:
+        for statement, parameters in queries.items():
+            problems = explain(conn, statement, parameters)
+            if problems:
+                failures[" ".join(statement.split())] = problems
+    assert not failures, "\n\n".join(f"{stmt}\n  -> {problems}" for stmt, problems in failures.items())
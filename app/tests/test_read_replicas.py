@@ -0,0 +1,64 @@
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from app.dao.users import DAOUser
+from app.db_utils.local_db import create_schema, seed_demo_data
+from app.db_utils.replicas import STICKY_COOKIE, get_replica_monitor
+
+
+@pytest.fixture
+def replica_url(sqlite_db, tmp_path, monkeypatch):
+    """A second SQLite file standing in for a replica; its users are renamed so reads show where they went."""
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = sqlalchemy.create_engine(url)
+    create_schema(engine)
+    seed_demo_data(engine)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.update(DAOUser.__table__).values(name="from replica"))
+    engine.dispose()
+    monkeypatch.setenv("DB_REPLICAS", "replica1")
+    monkeypatch.setenv("DB_REPLICA1_URL", url)
+    return url
+
+
+def _names(client):
+    return {u["name"] for u in client.get("/companies/1/users").json()}
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_reads_go_to_replica_until_the_client_writes(replica_url, async_mode):
+    from app.main import create_app
+
+    with TestClient(create_app(async_mode=async_mode)) as client:
+        assert _names(client) == {"from replica"}
+        assert client.get("/conversations/999999").status_code == 404  # the replica has no conversations either
+
+        conv_id = client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": "+15559200000",
+                                                         "text": "hi"}).json()["id"]
+        assert STICKY_COOKIE in client.cookies
+        # read-your-writes: the new conversation is only on the primary
+        assert client.get(f"/conversations/{conv_id}").status_code == 200
+        assert len(client.get(f"/conversations/{conv_id}/messages").json()) == 2
+        assert "from replica" not in _names(client)
+
+        client.cookies.clear()
+        assert _names(client) == {"from replica"}
+        assert client.get(f"/conversations/{conv_id}").status_code == 404
+
+
+def test_unreachable_replica_falls_back_to_primary(sqlite_db, tmp_path, monkeypatch):
+    from app.main import create_app
+
+    monkeypatch.setenv("DB_REPLICAS", "replica1")
+    monkeypatch.setenv("DB_REPLICA1_URL", f"sqlite:///file:{tmp_path / 'missing.db'}?mode=ro&uri=true")
+    with TestClient(create_app(async_mode=False)) as client:
+        monitor = get_replica_monitor()
+        assert monitor.describe()[0]["healthy"] is False  # failed the startup check
+        assert "from replica" not in _names(client)
+
+        # a replica that dies between health checks: the request falls back and takes it out of rotation
+        monitor._state["replica1"]["healthy"] = True
+        assert client.get("/companies/1/users").status_code == 200
+        stats = client.get("/system/db/replicas").json()
+        assert stats[0]["db_label"] == "replica1" and stats[0]["healthy"] is False and stats[0]["error"]
@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.dao.reply_job import DAOReplyJob
+from app.services import reply_queue
+from app.services.ai_provider import AIProviderError, MockAIProvider, SlowMockAIProvider
+
+
+class RecordingProvider(MockAIProvider):
+    """Slow provider that records the peak number of concurrent calls per company."""
+
+    def __init__(self, latency=0.2, failures=0):
+        self.latency = latency
+        self.failures = failures
+        self.in_flight, self.peak = {}, {}
+
+    async def generate_reply(self, company_name, inbound_text):
+        key = company_name
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        self.peak[key] = max(self.peak.get(key, 0), self.in_flight[key])
+        try:
+            await asyncio.sleep(self.latency)
+            if self.failures:
+                self.failures -= 1
+                raise AIProviderError("flaky")
+            return await super().generate_reply(company_name, inbound_text)
+        finally:
+            self.in_flight[key] -= 1
+
+
+@pytest.fixture
+def queue_client(sqlite_db, monkeypatch):
+    def make(provider, backend="memory", **env):
+        monkeypatch.setenv("AI_REPLY_MODE", "queue")
+        monkeypatch.setenv("AI_REPLY_DRAIN_TIMEOUT", "0.2")
+        monkeypatch.setenv("AI_REPLY_QUEUE_BACKEND", backend)
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        monkeypatch.setattr(reply_queue, "provider_from_env", lambda: provider)
+        from app.main import create_app
+        return TestClient(create_app())
+    return make
+
+
+def _inbound(client, phone, text="hi", company_id=1):
+    return client.post("/webhooks/inbound", json={"company_id": company_id, "channel_id": company_id,
+                                                  "from": phone, "text": text})
+
+
+def _wait_for_senders(client, conv_id, expected, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        senders = [m["sender"] for m in client.get(f"/conversations/{conv_id}/messages").json()]
+        if senders == expected:
+            return senders
+        time.sleep(0.05)
+    return senders
+
+
+def test_webhook_returns_before_slow_ai_reply(queue_client):
+    with queue_client(SlowMockAIProvider(latency=1.0)) as client:
+        start = time.perf_counter()
+        r = _inbound(client, "+15550001000")
+        assert r.status_code == 201
+        assert time.perf_counter() - start < 0.5  # not waiting on the 1s provider call
+
+        conv_id = r.json()["id"]
+        assert _wait_for_senders(client, conv_id, ["contact"], timeout=0.1) == ["contact"]
+        assert _wait_for_senders(client, conv_id, ["contact", "ai"]) == ["contact", "ai"]
+
+
+def test_per_company_concurrency_limit(queue_client):
+    provider = RecordingProvider(latency=0.2)
+    with queue_client(provider, AI_REPLY_MAX_PER_COMPANY=2, AI_REPLY_WORKERS=4) as client:
+        conv_ids = [_inbound(client, f"+1555000{i:04d}").json()["id"] for i in range(6)]
+        for conv_id in conv_ids:
+            assert _wait_for_senders(client, conv_id, ["contact", "ai"]) == ["contact", "ai"]
+        stats = client.get("/system/reply-queue").json()
+    assert provider.peak["Acme Corp"] <= 2
+    assert stats["completed"] == 6 and stats["depth"] == 0
+
+
+def test_failed_calls_are_retried(queue_client):
+    provider = RecordingProvider(latency=0.01, failures=2)
+    with queue_client(provider, AI_REPLY_MAX_ATTEMPTS=3) as client:
+        conv_id = _inbound(client, "+15550002000").json()["id"]
+        assert _wait_for_senders(client, conv_id, ["contact", "ai"]) == ["contact", "ai"]
+        stats = client.get("/system/reply-queue").json()
+    assert stats["retried"] == 2 and stats["failed"] == 0
+
+
+def test_full_queue_applies_backpressure(queue_client):
+    with queue_client(SlowMockAIProvider(latency=5), AI_REPLY_QUEUE_SIZE=1) as client:
+        assert _inbound(client, "+15550003000").status_code == 201
+        r = _inbound(client, "+15550003001")
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == "1"
+
+
+def test_reply_skipped_when_conversation_was_handed_to_a_human(queue_client):
+    with queue_client(SlowMockAIProvider(latency=0.3)) as client:
+        conv_id = _inbound(client, "+15550004000").json()["id"]
+        client.post(f"/conversations/{conv_id}/transfer-toggle")  # AI -> human before the reply lands
+        time.sleep(0.6)
+        senders = [m["sender"] for m in client.get(f"/conversations/{conv_id}/messages").json()]
+        assert senders == ["contact"]
+        assert client.get("/system/reply-queue").json()["skipped"] == 1
+
+
+def test_outbox_jobs_survive_a_restart(queue_client, sqlite_db):
+    # first process: the job is written with the inbound message but the provider never answers
+    with queue_client(SlowMockAIProvider(latency=30), backend="outbox") as client:
+        conv_id = _inbound(client, "+15550005000").json()["id"]
+        with Session(sqlite_db) as db:
+            job = db.query(DAOReplyJob).one()
+            assert job.conversation_id == conv_id
+        time.sleep(0.3)  # claimed by a worker, which is then stopped mid-call
+
+    with Session(sqlite_db) as db:
+        db.query(DAOReplyJob).update({"available_at": DAOReplyJob.created_at})  # expire the lease
+        db.commit()
+
+    # second process picks the job up again
+    with queue_client(MockAIProvider(), backend="outbox") as client:
+        assert _wait_for_senders(client, conv_id, ["contact", "ai"]) == ["contact", "ai"]
+    with Session(sqlite_db) as db:
+        assert db.query(DAOReplyJob).one().status == "done"
+
+
+def test_memory_queue_reserves_its_slot_at_enqueue(sqlite_db):
+    queue = reply_queue.InMemoryReplyQueue(maxsize=2)
+    queue.bind(asyncio.new_event_loop())
+    job = reply_queue.ReplyJob(company_id=1, conversation_id=1, ai_user_id=1, company_name=None, inbound_text="hi")
+    with Session(sqlite_db) as first, Session(sqlite_db) as second:
+        first.begin()
+        second.begin()
+        queue.enqueue(first, job)
+        queue.enqueue(first, job)
+        # neither is committed yet, but both slots are taken
+        with pytest.raises(reply_queue.ReplyQueueFull):
+            queue.enqueue(second, job)
+        first.rollback()
+        assert queue.depth() == 0
+        queue.enqueue(second, job)
+    assert queue.depth() == 0  # closed without committing
+
+
+def test_outbox_purges_old_done_jobs_and_bounds_its_count(sqlite_db):
+    now = datetime.datetime.utcnow()
+    with Session(sqlite_db) as db:
+        for status, age in [("done", 3), ("done", 3), ("done", 0), ("failed", 3), ("pending", 0), ("pending", 0),
+                            ("pending", 0)]:
+            db.add(DAOReplyJob(company_id=1, conversation_id=1, ai_user_id=1, inbound_text="hi", status=status,
+                               available_at=now - datetime.timedelta(hours=age)))
+        db.commit()
+    queue = reply_queue.OutboxReplyQueue(maxsize=2, done_retention_seconds=3600)
+    queue._maintain_sync()
+    assert queue.depth() == 2  # counting stops at maxsize
+    with Session(sqlite_db) as db:
+        assert sorted(s for s, in db.query(DAOReplyJob.status)) == ["done", "failed", "pending", "pending", "pending"]
@@ -0,0 +1,134 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+from app.dao.search import DAOSearchBlock, DAOSearchPending
+from app.db_utils.postings import PostingCursor, decode_postings, encode_postings, intersect
+from app.db_utils.segments import SegmentStore
+from app.services.archive import archive_idle, set_archive_store
+from app.services.search import merge_pending, rebuild_company, tokenize
+
+WORDS = ["order", "delayed", "refund", "Não", "recebi", "pedido", "invoice", "shipping", "olá", "help"]
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setenv("SEARCH_BLOCK_POSTINGS", "4")
+
+
+def _send(client, rng, company_id=1, n=40):
+    for i in range(n):
+        text = " ".join(rng.sample(WORDS, 3))
+        client.post("/webhooks/inbound", json={"company_id": company_id, "channel_id": company_id,
+                                               "from": f"+1555930{company_id}{i % 7:03d}", "text": text})
+
+
+def _expected(engine, company_id, query):
+    terms = set(tokenize(query))
+    with Session(engine) as db:
+        rows = db.execute(sqlalchemy.select(DAOMessage.id, DAOMessage.content)
+                          .join(DAOConversation, DAOConversation.id == DAOMessage.conversation_id)
+                          .where(DAOConversation.company_id == company_id)).all()
+    return sorted((r.id for r in rows if terms <= set(tokenize(r.content))), reverse=True)
+
+
+def _search_all(client, company_id, query, limit=3):
+    ids, before_id = [], None
+    while True:
+        params = {"q": query, "limit": limit} | ({"before_id": before_id} if before_id else {})
+        r = client.get(f"/companies/{company_id}/search", params=params)
+        assert r.status_code == 200, r.text
+        ids += [m["id"] for m in r.json()]
+        before_id = r.headers.get("X-Next-Before-Id")
+        if not before_id:
+            return ids
+
+
+def test_search_pages_through_pending_and_merged_postings(local_client, sqlite_db, small_blocks):
+    rng = random.Random(7)
+    _send(local_client, rng, company_id=1)
+    _send(local_client, rng, company_id=2, n=10)
+    queries = ["order", "order delayed", "NAO recebi", "refund invoice help", "missing"]
+
+    before_merge = {q: _search_all(local_client, 1, q) for q in queries}
+    assert merge_pending()["postings"] > 0
+    with Session(sqlite_db) as db:
+        assert db.query(DAOSearchPending).count() == 0
+        assert db.query(DAOSearchBlock).filter(DAOSearchBlock.postings > 4).count() == 0
+    _send(local_client, rng, company_id=1, n=10)  # new postings on top of the blocks
+    merge_pending(batch_size=7)
+    _send(local_client, rng, company_id=1, n=5)  # and some left pending
+
+    for q in queries:
+        expected = _expected(sqlite_db, 1, q)
+        assert _search_all(local_client, 1, q) == expected
+        assert before_merge[q] == [i for i in expected if i <= max(before_merge[q], default=0)]
+    assert _search_all(local_client, 1, "missing") == []
+    assert set(_search_all(local_client, 2, "order")) == set(_expected(sqlite_db, 2, "order"))
+
+
+def test_rebuild_indexes_live_and_archived_messages(local_client, sqlite_db, small_blocks, tmp_path):
+    set_archive_store(SegmentStore(str(tmp_path / "archive")))
+    try:
+        _send(local_client, random.Random(11), n=30)
+        queries = ["pedido", "order refund", "ola"]
+        expected = {q: _expected(sqlite_db, 1, q) for q in queries}
+        with sqlite_db.begin() as conn:  # archive one conversation, then lose the index
+            conn.execute(sqlalchemy.update(DAOConversation.__table__).where(DAOConversation.company_id == 1)
+                         .values(last_message_at=datetime.utcnow() - timedelta(days=90)))
+        assert archive_idle(timedelta(days=30), max_conversations=1)["conversations"] == 1
+        with sqlite_db.begin() as conn:
+            conn.execute(sqlalchemy.delete(DAOSearchBlock.__table__))
+            conn.execute(sqlalchemy.delete(DAOSearchPending.__table__))
+        assert _search_all(local_client, 1, "pedido") == []
+
+        stats = rebuild_company(1, batch_size=16)
+        assert stats["archived"] > 0 and stats["blocks"] > 0
+        for q in queries:
+            assert _search_all(local_client, 1, q) == expected[q]
+        hits = local_client.get("/companies/1/search", params={"q": "pedido"}).json()
+        assert hits and all("pedido" in tokenize(m["content"]) for m in hits)
+    finally:
+        set_archive_store(None)
+
+
+def test_posting_cursors_intersect_newest_first():
+    rng = random.Random(3)
+    for _ in range(50):
+        sets = [sorted(rng.sample(range(1, 300), rng.randint(0, 120))) for _ in range(rng.randint(1, 3))]
+        cursors = []
+        for ids in sets:
+            pending = [(i, i % 9) for i in ids if i % 5 == 0]
+            stored = [(i, i % 9) for i in ids if i % 5]
+            blocks = [(stored[k][0], encode_postings(stored[k:k + 8])) for k in range(0, len(stored), 8)]
+            assert [p for _, data in blocks for p in decode_postings(data)] == stored
+
+            def fetch(upto, blocks=blocks):
+                return [b for b in reversed(blocks) if b[0] <= upto][:2]
+            cursors.append(PostingCursor(fetch, pending, before_id=250))
+        expected = sorted((i for i in set.intersection(*map(set, sets)) if i < 250), reverse=True)
+        assert [p[0] for p in intersect(cursors)] == expected
+
+
+def test_bulk_insert_read_back_skips_concurrent_writers_rows(local_client, sqlite_db):
+    from app.services.conversation import _read_back_inserted
+
+    conv_id = local_client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1,
+                                                           "from": "+15559400000", "text": "hi"}).json()["id"]
+    rows = [{"conversation_id": conv_id, "sender": "contact", "content": f"mine {i}", "channel_id": 1,
+             "channel_message_id": None} for i in range(2)]
+    with Session(sqlite_db) as db:
+        ids = []
+        # MySQL with innodb_autoinc_lock_mode=2: another writer's row lands between this statement's rows
+        for content in ("mine 0", "theirs", "mine 1"):
+            msg = DAOMessage(conversation_id=conv_id, sender="contact", content=content, channel_id=1)
+            db.add(msg)
+            db.flush()
+            ids.append(msg.id)
+        assert _read_back_inserted(db, rows, ids[0]) == [(ids[0], conv_id, "mine 0"), (ids[2], conv_id, "mine 1")]
+        db.rollback()
@@ -0,0 +1,117 @@
+import time
+from sqlalchemy.orm import Session
+
+from app.dao.users import DAOUser
+from app.services.cache import InMemoryLRUBackend
+from app.services.tenant_cache import TenantCache, get_tenant_cache
+
+METADATA_TABLES = ("companies", "channels", "users")
+
+
+def _inbound(client, phone="+15550004444"):
+    r = client.post("/webhooks/inbound", json={"company_id": 1, "channel_id": 1, "from": phone, "text": "hi"})
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def test_warm_cache_skips_metadata_queries(local_client, record_sql):
+    _inbound(local_client)  # cold: fills the cache after commit
+    with record_sql() as rec:
+        _inbound(local_client)
+    touched = [s for s in rec.statements if any(f"FROM {t}" in s or f"INTO {t}" in s for t in METADATA_TABLES)]
+    assert touched == []
+    # contact upsert, conversation lookup, 2 message inserts, conversation state, search postings
+    assert len(rec.statements) == 6
+
+    stats = local_client.get("/system/cache/tenants").json()
+    assert stats["hits"] >= 1 and stats["misses"] >= 1
+
+
+def test_toggle_uses_cached_user_ids(local_client, record_sql):
+    local_client.post("/conversations/1/transfer-toggle")  # ai -> human, caches the default agent
+    local_client.post("/conversations/1/transfer-toggle")  # human -> ai, caches the AI user
+    with record_sql() as rec:
+        r = local_client.post("/conversations/1/transfer-toggle")
+    assert r.json()["detail"] == "switched ownership to human"
+    assert not any("FROM users" in s for s in rec.statements)
+
+
+def test_created_user_invalidates_company_entry(local_client, sqlite_db):
+    # company 9 does not exist yet: the webhook creates company, channel and AI user
+    r = local_client.post("/webhooks/inbound", json={"company_id": 9, "channel_id": 9, "from": "+1", "text": "x"})
+    conv_id = r.json()["id"]
+    entry = get_tenant_cache().get(9)
+    assert entry["ai_user_id"] == r.json()["owner_id"] and entry["channels"] == [9]
+
+    local_client.post(f"/conversations/{conv_id}/transfer-toggle")  # creates the default agent
+    with Session(sqlite_db) as db:
+        agent = db.query(DAOUser).filter(DAOUser.company_id == 9, DAOUser.role == "agent").one()
+    assert get_tenant_cache().get(9).get("default_agent_id") == agent.id
+
+
+def test_rolled_back_writes_do_not_reach_cache(sqlite_db):
+    from app.services.conversation import resolve_tenant
+    with Session(sqlite_db) as db:
+        resolve_tenant(db, company_id=7, channel_id=7)
+        db.rollback()
+    assert get_tenant_cache().get(7) == {}
+
+
+def test_savepoint_rollback_keeps_outer_callbacks(sqlite_db):
+    from app.db_utils.hooks import on_commit
+    ran = []
+    with Session(sqlite_db) as db:
+        on_commit(db, lambda: ran.append("outer"))
+        nested = db.begin_nested()
+        nested.rollback()
+        db.commit()
+    assert ran == ["outer"]
+
+
+def test_update_staged_before_an_invalidation_is_dropped(sqlite_db):
+    from app.services.tenant_cache import update_after_commit
+
+    cache = get_tenant_cache()
+    cache.update(5, name="Old", default_agent_id=50)
+    with Session(sqlite_db) as db:
+        db.begin()
+        update_after_commit(db, 5, default_agent_id=50)  # read before another request changed the agent
+        cache.invalidate(5)
+        db.commit()
+    assert cache.get(5) == {} and cache.stats()["stale_updates"] == 1
+
+
+def test_invalidation_racing_an_update_removes_its_write():
+    class RacingBackend(InMemoryLRUBackend):
+        def set(self, key, value):
+            super().set(key, value)
+            if key == "tenant:1" and racing:
+                racing.pop()
+                cache.invalidate(1)  # between the merge and its re-check
+
+    racing = [True]
+    cache = TenantCache(RacingBackend())
+    cache.update(1, name="Acme", default_agent_id=10)
+    assert cache.get(1) == {}
+    cache.update(1, name="Acme", default_agent_id=11)
+    assert cache.get(1)["default_agent_id"] == 11
+
+
+def test_lru_bound_and_ttl():
+    backend = InMemoryLRUBackend(maxsize=2, ttl=0.05)
+    cache = TenantCache(backend)
+    for company_id in (1, 2, 3):
+        cache.update(company_id, name=f"c{company_id}")
+    assert cache.get(1) == {} and cache.get(3)["name"] == "c3"
+    assert backend.evictions == 1
+    time.sleep(0.06)
+    assert cache.get(3) == {}
+
+
+def test_shared_backend_propagates_invalidation():
+    shared = InMemoryLRUBackend()  # stand-in for a shared store such as Redis
+    worker_a, worker_b = TenantCache(shared), TenantCache(shared)
+    worker_a.update(1, name="Acme", ai_user_id=1, channel_id=1)
+    assert worker_b.get(1)["ai_user_id"] == 1
+    worker_b.invalidate(1)
+    assert worker_a.get(1) == {}
@@ -0,0 +1,111 @@
+import asyncio
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_MISS
+from uvicorn import Config
+
+from app.dao.base import Base
+from app.db_utils.db_connection import get_sessionmaker
+from app.server import DrainingServer
+from app.services import leader, warmup
+from app.services.inbound import process_inbound_message
+from app.services.tenant_cache import get_tenant_cache
+
+
+def _row_counts(engine):
+    with engine.connect() as conn:
+        return {t.name: conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(t)).scalar()
+                for t in Base.metadata.sorted_tables}
+
+
+def test_warm_up_compiles_the_inbound_path_and_leaves_nothing_behind(sqlite_db):
+    before = _row_counts(sqlite_db)
+    timings = warmup.warm_up()
+    assert set(timings) == {"mappers", "connections", "rehearsal"}
+    assert _row_counts(sqlite_db) == before
+    assert get_tenant_cache().stats()["entries"] == 0  # after-commit side effects were dropped
+
+    # the first real delivery only runs statements the rehearsal already compiled (the dialect
+    # upserts have no cache key at all: they are compiled on every execution, warm or not)
+    uncached = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if context.compiled is not None and context.cache_hit is CACHE_MISS:
+            uncached.append(statement)
+
+    event.listen(sqlite_db, "after_cursor_execute", on_execute)
+    try:
+        with get_sessionmaker()() as db:
+            process_inbound_message(db, 1, 1, "+15559700001", "first one")
+    finally:
+        event.remove(sqlite_db, "after_cursor_execute", on_execute)
+    assert uncached == []
+
+
+@pytest.mark.parametrize("async_mode", [False, True], ids=["sync", "async"])
+def test_not_ready_until_warm_up_succeeds_and_again_on_shutdown(sqlite_db, monkeypatch, async_mode):
+    from app.main import create_app
+
+    monkeypatch.setenv("WARMUP_RETRY_SECONDS", "0.05")
+    failures = [sqlalchemy.exc.OperationalError("SELECT 1", {}, Exception("database is down"))]
+    warm_up = warmup.warm_up
+
+    def flaky():
+        if failures:
+            raise failures.pop()
+        return warm_up()
+
+    monkeypatch.setattr(warmup, "warm_up", flaky)
+    with TestClient(create_app(async_mode=async_mode)) as client:
+        assert client.get("/healthz").json() == {"status": "ok"}
+        r = client.get("/readyz")
+        assert r.status_code == 503 and "database is down" in r.json()["error"]
+        deadline = time.monotonic() + 5
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        state = client.get("/readyz").json()
+        assert state["ready"] is True and state["error"] is None
+        assert ("async_rehearsal" in state["warmup"]) is async_mode
+    assert warmup.readiness()["ready"] is False and warmup.readiness()["draining"] is True
+
+
+def test_sigterm_drains_before_shutting_down():
+    async def scenario():
+        server = DrainingServer(Config(app=None))
+        server.drain_seconds = 0.05
+        server.handle_exit(signal.SIGTERM, None)
+        draining = warmup.readiness()["draining"], server.should_exit
+        await asyncio.sleep(0.1)
+        drained = server.should_exit
+
+        impatient = DrainingServer(Config(app=None))
+        impatient.drain_seconds = 60
+        impatient.handle_exit(signal.SIGTERM, None)
+        impatient.handle_exit(signal.SIGTERM, None)  # a second signal skips the drain period
+        return draining, drained, impatient.should_exit
+
+    warmup._state.update(ready=True, draining=False)
+    assert asyncio.run(scenario()) == ((True, False), True, True)
+
+
+@pytest.mark.skipif(leader.fcntl is None, reason="no flock")
+def test_one_process_per_host_runs_the_periodic_jobs(tmp_path, monkeypatch):
+    monkeypatch.setenv("JOBS_LOCK_FILE", str(tmp_path / "jobs.lock"))
+    leader.release_leadership()
+    other = subprocess.Popen([sys.executable, "-c", "from app.services.leader import is_leader; "
+                              "print(is_leader(), flush=True); input()"],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert other.stdout.readline().strip() == "True"
+        assert leader.is_leader() is False
+    finally:
+        other.communicate("\n", timeout=10)
+    assert leader.is_leader() is True  # taken over once the other process is gone
+    leader.release_leadership()
@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import pytest
+import sqlalchemy
+
+from app.dao.conversation import DAOConversation
+from app.dao.message import DAOMessage
+from app.services import write_coalescer
+from app.services.write_coalescer import get_write_coalescer
+
+
+def _delivery(i, company_id=1, **extra):
+    return {"company_id": company_id, "channel_id": company_id, "from": f"+155595{company_id}{i % 12:04d}",
+            "text": f"hello {i}", **extra}
+
+
+async def _post_concurrently(app, payloads):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(client.post("/webhooks/inbound", json=p) for p in payloads))
+            stats = (await client.get("/system/write-coalescer")).json()
+    return responses, stats
+
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def coalesced_app(sqlite_db, monkeypatch, request):
+    from app.main import create_app
+
+    monkeypatch.setenv("WRITE_COALESCE", "1")
+    monkeypatch.setenv("WRITE_COALESCE_MAX_DELAY_MS", "20")
+    return create_app(async_mode=request.param)
+
+
+def _count(engine, stmt):
+    with engine.connect() as conn:
+        return conn.execute(stmt).scalar()
+
+
+def test_concurrent_deliveries_are_committed_in_shared_batches(coalesced_app, sqlite_db):
+    payloads = [_delivery(i, company_id=1 + i % 2, channel_message_id=f"co-{i}") for i in range(60)]
+    payloads += [_delivery(3, company_id=2, channel_message_id="co-3")]  # provider retry in the same burst
+    responses, stats = asyncio.run(_post_concurrently(coalesced_app, payloads))
+
+    assert [r.status_code for r in responses].count(201) == 60
+    assert responses[-1].status_code == 200 and responses[-1].json() == responses[3].json()
+    for payload, r in zip(payloads, responses):
+        conv = r.json()
+        assert conv["company_id"] == payload["company_id"] and conv["status"] == "open"
+    # six contacts per company, one conversation each; every delivery stored once, with its AI reply
+    assert len({r.json()["id"] for r in responses}) == 12
+    assert _count(sqlite_db, sqlalchemy.select(sqlalchemy.func.count()).select_from(DAOMessage)
+                  .where(DAOMessage.channel_message_id.like("co-%"))) == 60
+    assert _count(sqlite_db, sqlalchemy.select(sqlalchemy.func.sum(DAOConversation.message_count))
+                  .where(DAOConversation.id.in_({r.json()["id"] for r in responses}))) == 120
+    assert stats["submitted"] == 61 and stats["rows"] == 61 and stats["batches"] < 20
+    assert get_write_coalescer() is None  # stopped with the app
+
+
+def test_a_failing_delivery_only_fails_its_own_request(coalesced_app, sqlite_db, monkeypatch):
+    store_batch = write_coalescer.process_inbound_batch
+
+    def flaky(db, items):
+        if any(item.text == "boom" for item in items):
+            raise RuntimeError("boom")
+        return store_batch(db, items)
+
+    monkeypatch.setattr(write_coalescer, "process_inbound_batch", flaky)
+    payloads = [_delivery(i) for i in range(10)] + [{**_delivery(99), "text": "boom"}]
+    responses, stats = asyncio.run(_post_concurrently(coalesced_app, payloads))
+
+    assert [r.status_code for r in responses] == [201] * 10 + [500]
+    assert stats["split_batches"] >= 1 and stats["failed"] == 1
+    assert _count(sqlite_db, sqlalchemy.select(sqlalchemy.func.count()).select_from(DAOMessage)
+                  .where(DAOMessage.content == "boom")) == 0
+
+
+def test_committed_batch_is_not_stored_again_when_the_read_back_fails(coalesced_app, sqlite_db, monkeypatch):
+    read_back = write_coalescer._conversation_rows
+    failures = [RuntimeError("read back failed")]
+
+    def flaky(db, conversation_ids):
+        if failures:
+            raise failures.pop()
+        return read_back(db, conversation_ids)
+
+    monkeypatch.setattr(write_coalescer, "_conversation_rows", flaky)
+    payloads = [{**_delivery(i), "text": f"once {i}"} for i in range(10)]
+    responses, stats = asyncio.run(_post_concurrently(coalesced_app, payloads))
+
+    assert 500 in [r.status_code for r in responses] and stats["split_batches"] == 0
+    # deliveries without channel_message_id: a second store would have inserted them twice
+    assert _count(sqlite_db, sqlalchemy.select(sqlalchemy.func.count()).select_from(DAOMessage)
+                  .where(DAOMessage.content.like("once %"))) == 10
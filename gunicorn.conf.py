@@ -0,0 +1,39 @@
+# gunicorn.conf.py - production server (the Dockerfile's CMD):
+#
+#     gunicorn app.main:app -c gunicorn.conf.py
+#
+# Workers are separate processes: each has its own connection pools (the database sees up
+# to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections), its own admission budgets and
+# its own in-memory reply queue. Event streams only see other workers' events through the
+# Redis relay, so the default is one process per core with it and a single one without.
+import multiprocessing
+import os
+
+events_shared = os.getenv("EVENTS_BROKER", "local") == "relay" and os.getenv("EVENTS_TRANSPORT") == "redis"
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY") or (multiprocessing.cpu_count() if events_shared else 1))
+worker_class = "app.server.DrainingUvicornWorker"
+
+# import the app once in the master: workers fork with the modules already loaded (and
+# shared copy-on-write) instead of each importing them. The master opens no connections:
+# engines are created by each worker's lifespan, which also runs the warm-up.
+preload_app = True
+
+# SIGTERM: SHUTDOWN_DRAIN_SECONDS of not-ready, then requests in flight get the rest of this
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not events_shared:
+        server.log.error("%d workers without EVENTS_BROKER=relay and EVENTS_TRANSPORT=redis: an event stream "
+                         "only gets the events published by the worker serving it", server.cfg.workers)
+
+
+def when_ready(server):
+    # before the first fork, so no worker configures the mappers on its own
+    from sqlalchemy.orm import configure_mappers
+
+    configure_mappers()